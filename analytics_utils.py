@@ -0,0 +1,260 @@
+"""
+Moteur de calcul des statistiques de la page d'analyse
+Toutes les séries sont obtenues en quelques requêtes groupées (agrégation conditionnelle
+sur la table courrier_daily_stats, regroupements par mois côté SQL) et retournées dans
+un seul objet AnalyticsResult, partagé par analytics() et export_analytics()
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta
+from sqlalchemy import func, case, literal, select, union_all, and_
+from app import db
+from stats_utils import month_starts
+
+MONTHS_HISTORY = 24      # profondeur de l'évolution mensuelle
+WEEKS_HISTORY = 8        # profondeur de l'évolution hebdomadaire des statuts
+RECENT_DAYS = 30         # fenêtre des séries quotidiennes, par jour de semaine et par heure
+TOP_LIMIT = 10
+
+WEEKDAYS = ['Dimanche', 'Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi']
+
+DailyVolume = namedtuple('DailyVolume', ['jour', 'count'])
+StatusCount = namedtuple('StatusCount', ['statut', 'count'])
+TopSender = namedtuple('TopSender', ['expediteur', 'count'])
+TopRecipient = namedtuple('TopRecipient', ['destinataire', 'count'])
+DeptStat = namedtuple('DeptStat', ['departement', 'total', 'entrants', 'sortants'])
+UserStat = namedtuple('UserStat', ['nom_complet', 'total', 'entrants', 'sortants'])
+DeptPerformance = namedtuple('DeptPerformance', ['departement', 'total', 'temps_moyen'])
+MonthVolume = namedtuple('MonthVolume', ['month_start', 'entrants', 'sortants', 'total'])
+
+class AnalyticsResult:
+    """Ensemble des indicateurs de la page d'analyse"""
+
+    def __init__(self):
+        self.total_courriers = 0
+        self.courriers_entrants = 0
+        self.courriers_sortants = 0
+        self.courriers_7_days = 0
+        self.courriers_30_days = 0
+        self.avg_processing_time = 0.0
+        self.daily_volumes = []        # [DailyVolume]
+        self.status_distribution = []  # [StatusCount]
+        self.top_senders = []          # [TopSender]
+        self.top_recipients = []       # [TopRecipient]
+        self.dept_stats = []           # [DeptStat]
+        self.user_stats = []           # [UserStat]
+        self.dept_performance = []     # [DeptPerformance]
+        self.monthly_series = []       # [MonthVolume], du plus ancien au mois courant
+        self.weekly_status = {}        # {"Semaine n": {statut: nombre}}
+        self.weekday_counts = {}       # {jour de semaine (0 = dimanche): nombre}
+        self.hourly_counts = {}        # {heure: nombre}
+
+    def monthly_volumes(self, months):
+        """Les `months` derniers mois, du plus ancien au plus récent"""
+        return self.monthly_series[-months:]
+
+    def type_evolution(self, months):
+        """{mois: {type: nombre}} des `months` derniers mois, du plus récent au plus ancien"""
+        evolution = {}
+        for volume in reversed(self.monthly_volumes(months)):
+            counts = {'ENTRANT': volume.entrants, 'SORTANT': volume.sortants}
+            evolution[volume.month_start.strftime('%B %Y')] = {typ: n for typ, n in counts.items() if n}
+        return evolution
+
+    def weekday_data(self):
+        days = sorted(self.weekday_counts)
+        return {'labels': [WEEKDAYS[day] for day in days], 'counts': [self.weekday_counts[day] for day in days]}
+
+    def hourly_data(self):
+        hours = sorted(self.hourly_counts)
+        return {'hours': [f"{hour:02d}h" for hour in hours], 'counts': [self.hourly_counts[hour] for hour in hours]}
+
+def compute_analytics(start_date=None, end_date=None, now=None):
+    """Calcule tous les indicateurs ; start_date/end_date (datetime) filtrent la période analysée"""
+    from models import Courrier, CourrierDailyStats, Departement, User
+
+    now = now or datetime.now()
+    today = now.date()
+    start_day = start_date.date() if start_date else None
+    end_day = end_date.date() if end_date else None
+    result = AnalyticsResult()
+    departement_names = dict(db.session.query(Departement.id, Departement.nom).all())
+
+    _load_overview(result, CourrierDailyStats, departement_names, start_day, end_day, today)
+    _load_daily(result, CourrierDailyStats, start_day, end_day, today)
+    _load_monthly(result, CourrierDailyStats, today)
+
+    base_filter = [Courrier.is_deleted == False]
+    if start_date and end_date:
+        base_filter.append(Courrier.date_enregistrement >= start_date)
+        base_filter.append(Courrier.date_enregistrement <= end_date)
+    _load_top_contacts(result, Courrier, base_filter)
+    _load_user_stats(result, Courrier, User, base_filter)
+    _load_hourly(result, Courrier, now - timedelta(days=RECENT_DAYS))
+
+    return result
+
+def _in_period(column, start_day, end_day):
+    conditions = []
+    if start_day is not None:
+        conditions.append(column >= start_day)
+    if end_day is not None:
+        conditions.append(column <= end_day)
+    return and_(*conditions) if conditions else None
+
+def _sum_if(condition, value):
+    if condition is None:
+        return func.coalesce(func.sum(value), 0)
+    return func.coalesce(func.sum(case((condition, value), else_=0)), 0)
+
+def _load_overview(result, stats, departement_names, start_day, end_day, today):
+    """Totaux, statuts, départements et délais : une requête par (type, statut, département)"""
+    rows = db.session.query(
+        stats.type_courrier,
+        stats.statut,
+        stats.departement_id,
+        _sum_if(_in_period(stats.jour, start_day, end_day), stats.nombre).label('periode'),
+        _sum_if(stats.jour >= today - timedelta(days=7), stats.nombre).label('derniers_7'),
+        _sum_if(stats.jour >= today - timedelta(days=30), stats.nombre).label('derniers_30'),
+        _sum_if(None, stats.nombre).label('total'),
+        _sum_if(None, stats.delai_total_jours).label('delai'),
+    ).group_by(stats.type_courrier, stats.statut, stats.departement_id).all()
+
+    by_status = {}
+    by_dept = {}
+    performance = {}
+    processed_total = processed_delay = 0
+    for row in rows:
+        result.total_courriers += row.periode
+        if row.type_courrier == 'ENTRANT':
+            result.courriers_entrants += row.periode
+        elif row.type_courrier == 'SORTANT':
+            result.courriers_sortants += row.periode
+        result.courriers_7_days += row.derniers_7
+        result.courriers_30_days += row.derniers_30
+        if row.periode:
+            by_status[row.statut] = by_status.get(row.statut, 0) + row.periode
+
+        if row.statut == 'TRAITE':
+            processed_total += row.total
+            processed_delay += row.delai
+
+        departement = departement_names.get(row.departement_id)
+        if departement is None:
+            continue
+        if row.periode:
+            dept = by_dept.setdefault(departement, {'total': 0, 'ENTRANT': 0, 'SORTANT': 0})
+            dept['total'] += row.periode
+            if row.type_courrier in dept:
+                dept[row.type_courrier] += row.periode
+        if row.statut in ('TRAITE', 'CLOS') and row.total:
+            perf = performance.setdefault(departement, [0, 0])
+            perf[0] += row.total
+            perf[1] += row.delai
+
+    result.status_distribution = [StatusCount(statut, count) for statut, count in sorted(by_status.items())]
+    result.dept_stats = sorted(
+        (DeptStat(name, data['total'], data['ENTRANT'], data['SORTANT']) for name, data in by_dept.items()),
+        key=lambda stat: stat.total, reverse=True
+    )
+    result.dept_performance = [DeptPerformance(name, total, delay / total)
+                               for name, (total, delay) in sorted(performance.items())]
+    result.avg_processing_time = processed_delay / processed_total if processed_total else 0
+
+def _load_daily(result, stats, start_day, end_day, today):
+    """Séries quotidiennes, hebdomadaires et par jour de semaine : une requête par (jour, statut)"""
+    daily_start = start_day or today - timedelta(days=RECENT_DAYS)
+    weeks_start = today - timedelta(weeks=WEEKS_HISTORY)
+    rows = db.session.query(
+        stats.jour,
+        stats.statut,
+        func.sum(stats.nombre).label('nombre'),
+    ).filter(stats.jour >= min(daily_start, weeks_start)).group_by(stats.jour, stats.statut).order_by(stats.jour).all()
+
+    daily = {}
+    result.weekly_status = {f"Semaine {WEEKS_HISTORY - i}": {} for i in range(WEEKS_HISTORY)}
+    for row in rows:
+        jour = row.jour
+        if jour >= daily_start and (end_day is None or jour <= end_day):
+            daily[jour] = daily.get(jour, 0) + row.nombre
+        if jour >= today - timedelta(days=RECENT_DAYS):
+            day_of_week = (jour.weekday() + 1) % 7
+            result.weekday_counts[day_of_week] = result.weekday_counts.get(day_of_week, 0) + row.nombre
+        week = (today - jour).days // 7
+        if 0 <= week < WEEKS_HISTORY:
+            statuses = result.weekly_status[f"Semaine {WEEKS_HISTORY - week}"]
+            statut = row.statut or 'Non défini'
+            statuses[statut] = statuses.get(statut, 0) + row.nombre
+
+    result.daily_volumes = [DailyVolume(jour, count) for jour, count in sorted(daily.items())]
+
+def _load_monthly(result, stats, today):
+    """Évolution mensuelle par type : regroupement par mois calculé par la base"""
+    months = month_starts(MONTHS_HISTORY, today)
+    if db.engine.dialect.name == 'postgresql':
+        month_bucket = func.to_char(func.date_trunc('month', stats.jour), 'YYYY-MM')
+    else:
+        month_bucket = func.strftime('%Y-%m', stats.jour)
+
+    rows = db.session.query(
+        month_bucket.label('mois'),
+        _sum_if(stats.type_courrier == 'ENTRANT', stats.nombre).label('entrants'),
+        _sum_if(stats.type_courrier == 'SORTANT', stats.nombre).label('sortants'),
+    ).filter(stats.jour >= months[0]).group_by(month_bucket).all()
+
+    by_month = {row.mois: (row.entrants, row.sortants) for row in rows}
+    for month_start in months:
+        entrants, sortants = by_month.get(month_start.strftime('%Y-%m'), (0, 0))
+        result.monthly_series.append(MonthVolume(month_start, entrants, sortants, entrants + sortants))
+
+def _load_top_contacts(result, courrier, base_filter):
+    """Top expéditeurs et destinataires en une requête (classement par fenêtre ROW_NUMBER)"""
+    def contact_counts(kind, column):
+        return select(
+            literal(kind).label('kind'),
+            column.label('nom'),
+            func.count(courrier.id).label('nombre'),
+        ).where(*base_filter, column.isnot(None), column != '').group_by(column)
+
+    contacts = union_all(
+        contact_counts('expediteur', courrier.expediteur),
+        contact_counts('destinataire', courrier.destinataire),
+    ).subquery()
+    ranked = select(
+        contacts.c.kind,
+        contacts.c.nom,
+        contacts.c.nombre,
+        func.row_number().over(partition_by=contacts.c.kind, order_by=contacts.c.nombre.desc()).label('rang'),
+    ).subquery()
+    rows = db.session.execute(
+        select(ranked.c.kind, ranked.c.nom, ranked.c.nombre)
+        .where(ranked.c.rang <= TOP_LIMIT)
+        .order_by(ranked.c.kind, ranked.c.rang)
+    ).all()
+
+    result.top_senders = [TopSender(row.nom, row.nombre) for row in rows if row.kind == 'expediteur']
+    result.top_recipients = [TopRecipient(row.nom, row.nombre) for row in rows if row.kind == 'destinataire']
+
+def _load_user_stats(result, courrier, user, base_filter):
+    """Top utilisateurs, entrants et sortants comptés dans la même requête"""
+    total = func.count(courrier.id)
+    rows = db.session.query(
+        user.nom_complet,
+        total.label('total'),
+        _sum_if(courrier.type_courrier == 'ENTRANT', 1).label('entrants'),
+        _sum_if(courrier.type_courrier == 'SORTANT', 1).label('sortants'),
+    ).join(courrier, courrier.utilisateur_id == user.id)\
+     .filter(*base_filter)\
+     .group_by(user.id, user.nom_complet)\
+     .order_by(total.desc()).limit(TOP_LIMIT).all()
+
+    result.user_stats = [UserStat(row.nom_complet, row.total, row.entrants, row.sortants) for row in rows]
+
+def _load_hourly(result, courrier, since):
+    """Répartition par heure (non disponible dans la table journalière)"""
+    hour = func.extract('hour', courrier.date_enregistrement)
+    rows = db.session.query(hour.label('hour'), func.count(courrier.id).label('nombre')).filter(
+        courrier.date_enregistrement >= since,
+        courrier.is_deleted == False
+    ).group_by(hour).all()
+
+    result.hourly_counts = {int(row.hour): row.nombre for row in rows}
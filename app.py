@@ -20,6 +20,10 @@ app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-gec-mines")
 app.config['PERMANENT_SESSION_LIFETIME'] = 86400 * 30  # 30 jours
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
+# Compression gzip/brotli des réponses HTML et JSON
+from compression_utils import CompressionMiddleware
+app.wsgi_app = CompressionMiddleware(app.wsgi_app)
+
 # Configure the database
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///gec_mines.db")
 app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
@@ -41,6 +45,14 @@ login_manager.login_message = 'Veuillez vous connecter pour accéder à cette pa
 # Create upload directory if it doesn't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# Journaux d'activité écrits par lots en arrière-plan (vidés à l'arrêt)
+from log_writer_utils import log_writer
+log_writer.init_app(app)
+
+# Fichiers statiques : empreintes (static_url), bundles et variantes gzip/brotli
+from static_utils import init_static_assets
+init_static_assets(app)
+
 with app.app_context():
     # Import models
     import models
@@ -53,6 +65,20 @@ with app.app_context():
     run_automatic_migrations(app, db)
     apply_database_specific_fixes(db.engine)
     
+    # Index de recherche plein texte des courriers (FTS5 / tsvector) et index de suggestions
+    from search_utils import ensure_search_index, ensure_suggestion_index
+    ensure_search_index(db.engine)
+    ensure_suggestion_index(db.engine)
+    
+    # Statistiques quotidiennes agrégées des courriers
+    from stats_utils import ensure_daily_stats
+    ensure_daily_stats(db.engine)
+    
+    # Journal des activités partitionné par mois, compaction des mois anciens en archives
+    from log_storage_utils import ensure_log_partitions, start_log_compaction
+    ensure_log_partitions(db.engine)
+    start_log_compaction(app)
+    
     # Import security utilities
     from security_utils import add_security_headers, clean_security_storage, audit_log
     
@@ -168,7 +194,11 @@ def rate_limit_error(error):
     except:
         parametres = None
     
-    return render_template('429.html', parametres=parametres), 429
+    response = app.make_response((render_template('429.html', parametres=parametres), 429))
+    retry_after = getattr(error, 'retry_after', None)
+    if retry_after is not None:
+        response.headers['Retry-After'] = str(retry_after)
+    return response
 
 @app.errorhandler(403)
 def forbidden_error(error):
@@ -0,0 +1,342 @@
+"""
+Stockage des pièces jointes par contenu (SHA-256)
+Chaque fichier est rangé une seule fois, sous ATTACHMENT_STORE_FOLDER/ab/cd/<sha256> d'après
+son empreinte (fichier_checksum) : un même document joint plusieurs fois n'occupe qu'une copie
+et aucun répertoire ne grossit indéfiniment. La table fichier_stocke compte les courriers et
+transmissions qui référencent chaque fichier ; une ligne tombée à zéro est conservée jusqu'à ce
+que le fichier soit supprimé, une fois passé le délai de grâce (balayage sweep_unreferenced).
+Le dossier se trouve sous uploads/ : les sauvegardes et restaurations existantes l'incluent.
+"""
+import os
+import re
+import time
+import hashlib
+import logging
+import tempfile
+from datetime import datetime
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+ATTACHMENT_STORE_FOLDER = os.environ.get('ATTACHMENT_STORE_FOLDER', os.path.join('uploads', 'store'))
+CHUNK_SIZE = 1024 * 1024
+ORPHAN_GRACE_SECONDS = 3600   # un fichier récemment écrit ou réutilisé n'est jamais supprimé
+SWEEP_INTERVAL_SECONDS = 600  # balayage des fichiers sans référence au plus toutes les 10 minutes par processus
+CHECKSUM_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+class AttachmentStore:
+    """Fichiers rangés par empreinte SHA-256 dans deux niveaux de sous-dossiers"""
+
+    def __init__(self, root=ATTACHMENT_STORE_FOLDER):
+        self.root = root
+        self._next_sweep = 0.0
+
+    def path_for(self, checksum):
+        """Chemin du fichier d'empreinte checksum (relatif si le dossier du stockage l'est)"""
+        if not checksum or not CHECKSUM_PATTERN.match(checksum):
+            raise ValueError(f"Empreinte SHA-256 invalide: {checksum!r}")
+        return os.path.join(self.root, checksum[:2], checksum[2:4], checksum)
+
+    def owns(self, path, checksum):
+        """Le chemin enregistré en base désigne-t-il le fichier du stockage pour cette empreinte ?"""
+        if not path or not checksum or not CHECKSUM_PATTERN.match(checksum):
+            return False
+        return os.path.normpath(path) == os.path.normpath(self.path_for(checksum))
+
+    def resolve(self, checksum=None, legacy_path=None):
+        """Fichier à servir : celui du stockage, sinon l'ancien emplacement ; None s'il n'existe pas"""
+        if checksum and CHECKSUM_PATTERN.match(checksum):
+            path = self.path_for(checksum)
+            if os.path.exists(path):
+                return path
+        if legacy_path:
+            # Anciens chemins absolus : ne garder que la partie sous uploads/
+            if os.path.isabs(legacy_path) and not os.path.exists(legacy_path) and 'uploads/' in legacy_path:
+                legacy_path = os.path.join('uploads', legacy_path.split('uploads/')[-1])
+            if os.path.exists(legacy_path):
+                return legacy_path
+        return None
+
+    # ===== ÉCRITURE =====
+
+    def save(self, stream):
+        """Enregistre un fichier envoyé (FileStorage ou objet fichier) et y ajoute une référence
+
+        Retourne (checksum, taille, chemin).
+        """
+        checksum, size, temporary = self._spool(stream)
+        self.acquire(checksum, size)
+        return checksum, size, self._place(temporary, checksum)
+
+    def save_file(self, source_path):
+        """Copie un fichier existant dans le stockage et y ajoute une référence"""
+        checksum, size, path = self.put_file(source_path)
+        self.acquire(checksum, size)
+        return checksum, size, path
+
+    def put_file(self, source_path):
+        """Copie un fichier existant dans le stockage, sans référence (voir rebuild_references)"""
+        with open(source_path, 'rb') as source:
+            checksum, size, temporary = self._spool(source)
+        return checksum, size, self._place(temporary, checksum)
+
+    def _spool(self, stream):
+        """Copie le flux dans un fichier temporaire du stockage en calculant son empreinte"""
+        temporary_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(temporary_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        handle, temporary = tempfile.mkstemp(dir=temporary_dir, suffix='.part')
+        try:
+            with os.fdopen(handle, 'wb') as output:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    output.write(chunk)
+                    size += len(chunk)
+                output.flush()
+                os.fsync(output.fileno())
+        except BaseException:
+            os.remove(temporary)
+            raise
+        return digest.hexdigest(), size, temporary
+
+    def _place(self, temporary, checksum):
+        """Range le fichier temporaire sous son empreinte ; un contenu déjà présent n'est pas réécrit"""
+        path = self.path_for(checksum)
+        if os.path.exists(path):
+            os.remove(temporary)
+            # Fichier réutilisé : hors de portée de la suppression des orphelins
+            os.utime(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temporary, path)
+        return path
+
+    # ===== RÉFÉRENCES =====
+
+    def acquire(self, checksum, size):
+        """Ajoute une référence au fichier (transaction séparée de celle de la requête)"""
+        from app import db
+        from models import FichierStocke
+
+        table = FichierStocke.__table__
+        for _ in range(2):
+            try:
+                with db.engine.begin() as connection:
+                    updated = connection.execute(
+                        table.update().where(table.c.checksum == checksum)
+                        .values(nb_references=table.c.nb_references + 1)
+                    ).rowcount
+                    if not updated:
+                        connection.execute(table.insert().values(
+                            checksum=checksum, taille=size, nb_references=1, date_creation=datetime.utcnow()
+                        ))
+                return
+            except IntegrityError:
+                # Insertion concurrente du même contenu : la mise à jour réussira au second passage
+                continue
+        raise RuntimeError(f"Référence impossible à enregistrer pour {checksum}")
+
+    def release(self, checksum):
+        """Retire une référence ; le fichier qui n'est plus référencé est supprimé par le balayage
+
+        La ligne reste à zéro tant que le fichier est dans son délai de grâce : un fichier récent
+        n'est jamais perdu de vue, un balayage ultérieur le supprime avec sa ligne.
+        """
+        from app import db
+        from models import FichierStocke
+
+        table = FichierStocke.__table__
+        with db.engine.begin() as connection:
+            connection.execute(
+                table.update().where(table.c.checksum == checksum, table.c.nb_references > 0)
+                .values(nb_references=table.c.nb_references - 1)
+            )
+            unreferenced = connection.execute(
+                select(table.c.checksum).where(table.c.checksum == checksum, table.c.nb_references <= 0)
+            ).first()
+        if unreferenced:
+            self._drop_unreferenced(checksum)
+        if time.monotonic() >= self._next_sweep:
+            self._next_sweep = time.monotonic() + SWEEP_INTERVAL_SECONDS
+            try:
+                self.sweep_unreferenced()
+            except Exception as e:
+                logging.warning(f"Balayage du stockage des pièces jointes impossible: {e}")
+
+    def sweep_unreferenced(self):
+        """Supprime les fichiers sans référence sortis du délai de grâce, puis leur ligne
+
+        Retourne le nombre de fichiers supprimés.
+        """
+        from app import db
+        from models import FichierStocke
+
+        table = FichierStocke.__table__
+        with db.engine.connect() as connection:
+            checksums = list(connection.execute(
+                select(table.c.checksum).where(table.c.nb_references <= 0)
+            ).scalars())
+        return sum(1 for checksum in checksums if self._drop_unreferenced(checksum))
+
+    def _drop_unreferenced(self, checksum):
+        """Supprime le fichier puis sa ligne si elle est toujours à zéro ; True si le fichier l'a été"""
+        from app import db
+        from models import FichierStocke
+
+        removed = self._remove_orphan(checksum)
+        if not removed and os.path.exists(self.path_for(checksum)):
+            return False   # encore dans le délai de grâce : la ligne garde le fichier en vue
+        table = FichierStocke.__table__
+        with db.engine.begin() as connection:
+            # Une référence reprise entre-temps (acquire) a rafraîchi ou réécrit le fichier : ligne conservée
+            connection.execute(
+                table.delete().where(table.c.checksum == checksum, table.c.nb_references <= 0)
+            )
+        return removed
+
+    def _remove_orphan(self, checksum):
+        """Supprime le fichier s'il n'a pas été écrit ou réutilisé récemment ; True s'il l'a été"""
+        path = self.path_for(checksum)
+        try:
+            if time.time() - os.path.getmtime(path) >= ORPHAN_GRACE_SECONDS:
+                os.remove(path)
+                return True
+        except OSError:
+            pass
+        return False
+
+    def rebuild_references(self):
+        """Recalcule les références depuis les courriers et transmissions, supprime les orphelins
+
+        À lancer après une restauration, un import ou une suppression en masse.
+        Retourne {'files': ..., 'references': ..., 'orphans_removed': ...}.
+        """
+        from app import db
+        from models import Courrier, CourrierForward, FichierStocke
+
+        counts = {}
+        for checksum, path in db.session.query(Courrier.fichier_checksum, Courrier.fichier_chemin) \
+                .filter(Courrier.fichier_checksum.isnot(None)).yield_per(1000):
+            if self.owns(path, checksum):
+                counts[checksum] = counts.get(checksum, 0) + 1
+        for (checksum,) in db.session.query(CourrierForward.attached_file_checksum) \
+                .filter(CourrierForward.attached_file_checksum.isnot(None)).yield_per(1000):
+            counts[checksum] = counts.get(checksum, 0) + 1
+
+        table = FichierStocke.__table__
+        with db.engine.begin() as connection:
+            known = set(connection.execute(select(table.c.checksum)).scalars())
+            # Les fichiers qui ne sont plus référencés passent à zéro : le balayage les supprimera
+            unreferenced = table.update().values(nb_references=0)
+            connection.execute(unreferenced.where(table.c.checksum.notin_(list(counts))) if counts
+                               else unreferenced)
+            for checksum, references in counts.items():
+                path = self.path_for(checksum)
+                if checksum in known:
+                    connection.execute(table.update().where(table.c.checksum == checksum)
+                                       .values(nb_references=references))
+                elif os.path.exists(path):
+                    connection.execute(table.insert().values(
+                        checksum=checksum, taille=os.path.getsize(path), nb_references=references,
+                        date_creation=datetime.utcnow()
+                    ))
+
+        removed = self.sweep_unreferenced()
+        for checksum in list(self.iter_checksums()):
+            # Fichiers sans aucune ligne (écriture interrompue avant acquire, restauration partielle)
+            if checksum not in counts and checksum not in known and self._remove_orphan(checksum):
+                removed += 1
+        return {'files': len(counts), 'references': sum(counts.values()), 'orphans_removed': removed}
+
+    def iter_checksums(self):
+        """Empreintes des fichiers présents dans le stockage"""
+        if not os.path.isdir(self.root):
+            return
+        for first in sorted(os.listdir(self.root)):
+            first_dir = os.path.join(self.root, first)
+            if len(first) != 2 or not os.path.isdir(first_dir):
+                continue
+            for second in sorted(os.listdir(first_dir)):
+                second_dir = os.path.join(first_dir, second)
+                if not os.path.isdir(second_dir):
+                    continue
+                for name in os.listdir(second_dir):
+                    if CHECKSUM_PATTERN.match(name):
+                        yield name
+
+    def stats(self):
+        """Fichiers distincts, références et octets économisés par la déduplication"""
+        from app import db
+        from models import FichierStocke
+
+        files, references, stored, referenced = db.session.query(
+            func.count(FichierStocke.checksum),
+            func.coalesce(func.sum(FichierStocke.nb_references), 0),
+            func.coalesce(func.sum(FichierStocke.taille), 0),
+            func.coalesce(func.sum(FichierStocke.taille * FichierStocke.nb_references), 0),
+        ).filter(FichierStocke.nb_references > 0).one()
+        return {'files': files, 'references': int(references), 'stored_bytes': int(stored),
+                'saved_bytes': int(referenced) - int(stored)}
+
+    def clean_temporary(self, max_age=ORPHAN_GRACE_SECONDS):
+        """Supprime les fichiers temporaires abandonnés (écriture interrompue)"""
+        temporary_dir = os.path.join(self.root, 'tmp')
+        if not os.path.isdir(temporary_dir):
+            return 0
+        removed = 0
+        for name in os.listdir(temporary_dir):
+            path = os.path.join(temporary_dir, name)
+            try:
+                if time.time() - os.path.getmtime(path) >= max_age:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                pass
+        return removed
+
+attachment_store = AttachmentStore()
+
+def migrate_legacy_attachments():
+    """Range dans le stockage les pièces jointes enregistrées à l'ancien emplacement (uploads/, uploads/forwards)
+
+    Le fichier d'origine n'est supprimé qu'une fois la base mise à jour. Retourne le nombre de fichiers migrés.
+    """
+    from app import db
+    from models import Courrier, CourrierForward
+
+    forwards_dir = os.path.join('uploads', 'forwards')
+    migrated = 0
+    courrier_ids = [row.id for row in db.session.query(Courrier.id).filter(Courrier.fichier_chemin.isnot(None))]
+    for courrier_id in courrier_ids:
+        courrier = db.session.get(Courrier, courrier_id)
+        if attachment_store.owns(courrier.fichier_chemin, courrier.fichier_checksum):
+            continue
+        legacy_path = attachment_store.resolve(None, courrier.fichier_chemin)
+        if not legacy_path:
+            continue
+        checksum, _, path = attachment_store.put_file(legacy_path)
+        courrier.fichier_checksum = checksum
+        courrier.fichier_chemin = path
+        db.session.commit()
+        _remove_legacy(legacy_path)
+        migrated += 1
+
+    forward_ids = [row.id for row in db.session.query(CourrierForward.id).filter(
+        CourrierForward.attached_file.isnot(None), CourrierForward.attached_file_checksum.is_(None))]
+    for forward_id in forward_ids:
+        forward = db.session.get(CourrierForward, forward_id)
+        legacy_path = attachment_store.resolve(None, os.path.join(forwards_dir, forward.attached_file))
+        if not legacy_path:
+            continue
+        checksum, _, _ = attachment_store.put_file(legacy_path)
+        forward.attached_file_checksum = checksum
+        db.session.commit()
+        _remove_legacy(legacy_path)
+        migrated += 1
+    return migrated
+
+def _remove_legacy(path):
+    try:
+        os.remove(path)
+    except OSError as e:
+        logging.warning(f"Ancien fichier {path} non supprimé: {e}")
@@ -0,0 +1,83 @@
+"""
+Micro-benchmark de sanitize_input : coût par appel sur des entrées de 1 Ko et 64 Ko
+Compare l'ancien traitement (détection motif par motif puis re.sub successifs)
+au scan unique de l'alternation précompilée (security_utils.scan_attacks).
+
+Usage: python benchmark_sanitize.py [--repeat N]
+"""
+import re
+import sys
+import timeit
+import argparse
+from security_utils import scan_attacks
+
+SIZES = [('1 Ko', 1024), ('64 Ko', 64 * 1024)]
+
+# Texte courant d'un courrier, et le même avec quelques charges d'attaque
+BENIGN = "Objet : transmission du rapport trimestriel au Secrétariat Général, référence 2025/114. "
+HOSTILE = BENIGN + "' OR 1=1 -- <script>alert(1)</script> <iframe src=x> url(javascript:evil) "
+
+# Motifs de l'ancienne implémentation, appliqués un par un avec re.IGNORECASE
+OLD_SQL_INJECTION_PATTERNS = [
+    r"(\\'|(\\\\)+\')|(--;)|(-\s*-)",
+    r"\b(union\s+select|union\s+all\s+select)\b",
+    r"\b(drop\s+table|drop\s+database|truncate\s+table)\b",
+    r"\b(exec\s*\(|execute\s*\(|sp_executesql)\b",
+    r"(0x[0-9a-fA-F]+)|(\bhex\s*\()",
+    r"(\bor\s+1\s*=\s*1)|(\band\s+1\s*=\s*0)",
+    r"(script.*?/script)|(javascript\s*:)|(vbscript\s*:)",
+    r"(eval\s*\(.*?\))|(expression\s*\(.*?\))",
+]
+OLD_XSS_PATTERNS = [
+    r"<script[^>]*>.*?</script>", r"javascript:", r"vbscript:", r"on\w+\s*=", r"<iframe[^>]*>",
+    r"<object[^>]*>", r"<embed[^>]*>", r"<link[^>]*>", r"<meta[^>]*>",
+]
+OLD_ADDITIONAL_PATTERNS = [
+    r'eval\s*\(', r'expression\s*\(', r'url\s*\(', r'@import', r'\\x[0-9a-fA-F]+', r'&#[0-9]+;',
+]
+
+def sequential_sanitize(text):
+    """Ancien traitement : une passe par motif, minuscules recalculées pour la détection SQL"""
+    input_lower = text.lower()
+    if any(re.search(p, input_lower, re.IGNORECASE) for p in OLD_SQL_INJECTION_PATTERNS):
+        for pattern in OLD_SQL_INJECTION_PATTERNS:
+            text = re.sub(pattern, '', text, flags=re.IGNORECASE)
+    if any(re.search(p, text, re.IGNORECASE) for p in OLD_XSS_PATTERNS):
+        for pattern in OLD_XSS_PATTERNS:
+            text = re.sub(pattern, '', text, flags=re.IGNORECASE)
+    for pattern in OLD_ADDITIONAL_PATTERNS:
+        text = re.sub(pattern, '', text, flags=re.IGNORECASE)
+    return text.strip()
+
+def single_pass_sanitize(text):
+    return scan_attacks(text)[0].strip()
+
+def build_input(sample, size):
+    return (sample * (size // len(sample) + 1))[:size]
+
+def per_call(function, text, repeat):
+    number = max(1, repeat // (len(text) // 1024))
+    best = min(timeit.repeat(lambda: function(text), number=number, repeat=5))
+    return best / number
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmark de sanitize_input")
+    parser.add_argument('--repeat', type=int, default=2000, help="appels par mesure pour 1 Ko")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("MICRO-BENCHMARK SANITIZE_INPUT")
+    print("=" * 60 + "\n")
+
+    for label, sample in (('texte normal', BENIGN), ('texte hostile', HOSTILE)):
+        for size_label, size in SIZES:
+            text = build_input(sample, size)
+            before = per_call(sequential_sanitize, text, args.repeat)
+            after = per_call(single_pass_sanitize, text, args.repeat)
+            print(f"📊 {label:<14} {size_label:>6} : "
+                  f"{before * 1e6:10.1f} µs -> {after * 1e6:10.1f} µs  (x{before / after:.1f})")
+    print()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
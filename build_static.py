@@ -0,0 +1,68 @@
+"""
+Script de préparation des fichiers statiques
+Génère la feuille Tailwind purgée à partir des templates (CLI Tailwind requise), puis
+assemble les bundles, écrit les variantes gzip/brotli et affiche les empreintes.
+
+Usage: python build_static.py
+       TAILWIND_CLI=/chemin/vers/tailwindcss python build_static.py
+"""
+import os
+import sys
+import shutil
+import subprocess
+from static_utils import prepare_static_assets, TAILWIND_CSS, brotli
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATIC_FOLDER = os.path.join(BASE_DIR, 'static')
+TAILWIND_CONFIG = os.path.join(BASE_DIR, 'tailwind.config.js')
+TAILWIND_INPUT = os.path.join(STATIC_FOLDER, 'css', 'tailwind.input.css')
+
+def find_tailwind_cli():
+    """Binaire autonome tailwindcss, ou npx si Node.js est installé"""
+    cli = os.environ.get('TAILWIND_CLI') or shutil.which('tailwindcss')
+    if cli:
+        return [cli]
+    npx = shutil.which('npx')
+    if npx:
+        return [npx, '--yes', 'tailwindcss@3']
+    return None
+
+def build_tailwind():
+    cli = find_tailwind_cli()
+    if cli is None:
+        print("⚠️  CLI Tailwind introuvable (TAILWIND_CLI, tailwindcss ou npx) :")
+        print("   les pages continueront à compiler Tailwind dans le navigateur.")
+        return False
+
+    output = os.path.join(STATIC_FOLDER, TAILWIND_CSS)
+    command = cli + ['-c', TAILWIND_CONFIG, '-i', TAILWIND_INPUT, '-o', output, '--minify']
+    result = subprocess.run(command, cwd=BASE_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        print(f"❌ Échec de la génération Tailwind:\n{result.stderr}")
+        return False
+    print(f"   ✓ {TAILWIND_CSS} ({os.path.getsize(output) // 1024} Ko)")
+    return True
+
+def main():
+    print("=" * 60)
+    print("PRÉPARATION DES FICHIERS STATIQUES")
+    print("=" * 60 + "\n")
+
+    print("🔄 Feuille Tailwind purgée...")
+    build_tailwind()
+
+    print("🔄 Bundles, variantes compressées et empreintes...")
+    try:
+        count = prepare_static_assets(STATIC_FOLDER)
+    except Exception as e:
+        print(f"\n❌ Erreur lors de la préparation des fichiers statiques: {e}")
+        return 1
+    print(f"   ✓ {count} fichier(s) avec empreinte")
+    if brotli is None:
+        print("   ⚠️  Module brotli non installé : variantes gzip uniquement")
+
+    print("\n✨ Fichiers statiques prêts.\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
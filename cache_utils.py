@@ -0,0 +1,620 @@
+"""
+Caches des résultats calculés et compteurs partagés
+LRU en mémoire avec durée de vie par clé, limite en nombre d'entrées et en octets,
+chargement "single-flight" (un seul appelant recalcule une clé expirée) et compteurs.
+Backends interchangeables (variable CACHE_BACKEND) : mémoire du processus, fichier SQLite
+partagé par les workers d'une même machine, serveur Redis.
+"""
+import os
+import sys
+import time
+import pickle
+import socket
+import sqlite3
+import heapq
+import itertools
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from urllib.parse import urlparse, unquote
+
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'memory').lower()
+CACHE_SQLITE_PATH = os.environ.get('CACHE_SQLITE_PATH', os.path.join('instance', 'gec_cache.db'))
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+REDIS_KEY_PREFIX = 'gec'
+
+class _Flight:
+    """Chargement en cours d'une clé, attendu par les autres appelants"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+class LRUCache:
+    """Cache LRU+TTL thread-safe"""
+
+    def __init__(self, name, max_entries=1024, max_bytes=16 * 1024 * 1024, default_ttl=300):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()  # clé -> (valeur, expiration, taille)
+        self._expiry = []              # tas (expiration, n°, clé) ; les éléments périmés sont ignorés
+        self._sequence = itertools.count()
+        self._bytes = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'loads': 0, 'coalesced': 0}
+
+    def get(self, key, default=None):
+        with self._lock:
+            found, value = self._lookup(key)
+        return value if found else default
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        size = estimate_size(value)
+        with self._lock:
+            self._remove(key)
+            if size > self.max_bytes:
+                return
+            self._store(key, value, time.monotonic() + ttl, size)
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def incr(self, key, amount=1, ttl=None):
+        """Incrémente un compteur ; la durée de vie part du premier incrément"""
+        ttl = self.default_ttl if ttl is None else ttl
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                value += amount
+                _, expires, size = self._entries[key]
+                self._entries[key] = (value, expires, size)
+                return value
+            self._store(key, amount, time.monotonic() + ttl, estimate_size(amount))
+            return amount
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._expiry.clear()
+            self._bytes = 0
+
+    def get_or_load(self, key, loader, ttl=None):
+        """Retourne la valeur en cache ou la calcule ; les appels concurrents attendent le premier"""
+        while True:
+            with self._lock:
+                found, value = self._lookup(key)
+                if found:
+                    return value
+                flight = self._inflight.get(key)
+                owner = flight is None
+                if owner:
+                    flight = self._inflight[key] = _Flight()
+                else:
+                    self._counters['coalesced'] += 1
+            if owner:
+                break
+            flight.event.wait()
+            if flight.error is None:
+                return flight.value
+            # Le chargement a échoué : un des appelants en attente le retente
+
+        try:
+            value = loader()
+        except Exception as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.error = e
+            flight.event.set()
+            raise
+
+        self.set(key, value, ttl)
+        with self._lock:
+            self._counters['loads'] += 1
+            self._inflight.pop(key, None)
+        flight.value = value
+        flight.event.set()
+        return value
+
+    def purge_expired(self):
+        """Retire les entrées expirées ; ne parcourt que la tête du tas des expirations"""
+        now = time.monotonic()
+        removed = 0
+        with self._lock:
+            while self._expiry and self._expiry[0][0] <= now:
+                expires, _, key = heapq.heappop(self._expiry)
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] == expires:
+                    self._remove(key)
+                    removed += 1
+            self._counters['expirations'] += removed
+        return removed
+
+    def stats(self):
+        """Compteurs et occupation du cache"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats.update({
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+            })
+        stats['backend'] = 'memory'
+        return _with_hit_rate(stats)
+
+    def _lookup(self, key):
+        """Recherche sous verrou ; met à jour l'ordre LRU et les compteurs"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._counters['hits'] += 1
+                return True, entry[0]
+            self._remove(key)
+            self._counters['expirations'] += 1
+        self._counters['misses'] += 1
+        return False, None
+
+    def _store(self, key, value, expires, size):
+        """Insertion sous verrou"""
+        self._entries[key] = (value, expires, size)
+        self._bytes += size
+        heapq.heappush(self._expiry, (expires, next(self._sequence), key))
+        self._evict()
+        # Les clés remplacées ou évincées laissent des éléments morts dans le tas : reconstruction
+        if len(self._expiry) > 2 * len(self._entries) + 64:
+            self._expiry = [(entry[1], next(self._sequence), k) for k, entry in self._entries.items()]
+            heapq.heapify(self._expiry)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, _, size) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self._counters['evictions'] += 1
+
+def estimate_size(value, _depth=0):
+    """Taille approximative en octets d'une valeur (conteneurs parcourus sur quelques niveaux)"""
+    size = sys.getsizeof(value, 64)
+    if _depth >= 3:
+        return size
+    if isinstance(value, dict):
+        size += sum(estimate_size(k, _depth + 1) + estimate_size(v, _depth + 1) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item, _depth + 1) for item in value)
+    elif hasattr(value, '__dict__'):
+        size += estimate_size(vars(value), _depth + 1)
+    return size
+
+def _with_hit_rate(stats):
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+    return stats
+
+def _key_text(key):
+    """Clé textuelle stable pour les backends partagés (les clés composées sont hachées)"""
+    if isinstance(key, str) and len(key) <= 200:
+        return key
+    return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+_MISSING = object()
+
+# ===== BACKENDS PARTAGÉS ENTRE WORKERS =====
+
+class _SharedCache:
+    """Base des backends partagés : single-flight par processus et compteurs locaux
+
+    Les valeurs sont sérialisées avec pickle : le fichier ou le serveur de cache
+    doit rester réservé à l'application.
+    """
+
+    backend = None
+
+    def __init__(self, name, max_entries=1024, max_bytes=16 * 1024 * 1024, default_ttl=300):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'loads': 0,
+                          'coalesced': 0, 'errors': 0}
+
+    def get(self, key, default=None):
+        try:
+            value = self._get(_key_text(key))
+        except Exception as e:
+            self._error('lecture', e)
+            value = _MISSING
+        with self._lock:
+            self._counters['hits' if value is not _MISSING else 'misses'] += 1
+        return default if value is _MISSING else value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+        try:
+            self._set(_key_text(key), data, ttl)
+        except Exception as e:
+            self._error('écriture', e)
+
+    def delete(self, key):
+        try:
+            self._delete(_key_text(key))
+        except Exception as e:
+            self._error('suppression', e)
+
+    def incr(self, key, amount=1, ttl=None):
+        """Incrémente atomiquement un compteur partagé ; la durée de vie part du premier incrément"""
+        ttl = self.default_ttl if ttl is None else ttl
+        return self._incr(_key_text(key), amount, ttl)
+
+    def get_or_load(self, key, loader, ttl=None):
+        """Retourne la valeur en cache ou la calcule (un seul calcul par processus à la fois)"""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        with self._lock:
+            flight = self._inflight.get(key)
+            owner = flight is None
+            if owner:
+                flight = self._inflight[key] = _Flight()
+            else:
+                self._counters['coalesced'] += 1
+        if not owner:
+            flight.event.wait()
+            if flight.error is None:
+                return flight.value
+            return self.get_or_load(key, loader, ttl)
+
+        try:
+            value = loader()
+        except Exception as e:
+            with self._lock:
+                self._inflight.pop(key, None)
+            flight.error = e
+            flight.event.set()
+            raise
+
+        self.set(key, value, ttl)
+        with self._lock:
+            self._counters['loads'] += 1
+            self._inflight.pop(key, None)
+        flight.value = value
+        flight.event.set()
+        return value
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats.update({'backend': self.backend, 'max_entries': self.max_entries, 'max_bytes': self.max_bytes})
+        try:
+            stats.update(self._occupancy())
+        except Exception as e:
+            self._error('statistiques', e)
+        return _with_hit_rate(stats)
+
+    def _error(self, operation, error):
+        with self._lock:
+            self._counters['errors'] += 1
+        logging.warning(f"Cache {self.name} ({self.backend}): échec de {operation}: {error}")
+
+class SQLiteCache(_SharedCache):
+    """Cache dans un fichier SQLite (mode WAL) partagé par les workers d'une même machine"""
+
+    backend = 'sqlite'
+    TRIM_INTERVAL = 64  # écritures entre deux contrôles de la taille
+
+    def __init__(self, name, path=None, **options):
+        super().__init__(name, **options)
+        self.path = path or CACHE_SQLITE_PATH
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            " namespace TEXT NOT NULL, cle TEXT NOT NULL, valeur BLOB NOT NULL, expire REAL NOT NULL,"
+            " PRIMARY KEY (namespace, cle))"
+        )
+        self._connection().execute(
+            "CREATE INDEX IF NOT EXISTS ix_cache_entries_expire ON cache_entries (namespace, expire)"
+        )
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _get(self, key):
+        row = self._connection().execute(
+            "SELECT valeur FROM cache_entries WHERE namespace = ? AND cle = ? AND expire > ?",
+            (self.name, key, time.time())
+        ).fetchone()
+        return _MISSING if row is None else pickle.loads(row[0])
+
+    def _set(self, key, data, ttl):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO cache_entries (namespace, cle, valeur, expire) VALUES (?, ?, ?, ?)",
+            (self.name, key, data, time.time() + ttl)
+        )
+        self._writes += 1
+        if self._writes % self.TRIM_INTERVAL == 0:
+            self._trim()
+
+    def _delete(self, key):
+        self._connection().execute("DELETE FROM cache_entries WHERE namespace = ? AND cle = ?", (self.name, key))
+
+    def _incr(self, key, amount, ttl):
+        connection = self._connection()
+        now = time.time()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT valeur, expire FROM cache_entries WHERE namespace = ? AND cle = ?", (self.name, key)
+            ).fetchone()
+            if row is not None and row[1] > now:
+                value, expires = pickle.loads(row[0]) + amount, row[1]
+            else:
+                value, expires = amount, now + ttl
+            connection.execute(
+                "INSERT OR REPLACE INTO cache_entries (namespace, cle, valeur, expire) VALUES (?, ?, ?, ?)",
+                (self.name, key, pickle.dumps(value), expires)
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return value
+
+    def clear(self):
+        self._connection().execute("DELETE FROM cache_entries WHERE namespace = ?", (self.name,))
+
+    def purge_expired(self):
+        cursor = self._connection().execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND expire <= ?", (self.name, time.time())
+        )
+        with self._lock:
+            self._counters['expirations'] += cursor.rowcount
+        return cursor.rowcount
+
+    def _trim(self):
+        """Applique les limites : entrées expirées puis les plus proches de l'expiration"""
+        self.purge_expired()
+        entries, size = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(valeur)), 0) FROM cache_entries WHERE namespace = ?",
+            (self.name,)
+        ).fetchone()
+        excess = entries - self.max_entries
+        if size > self.max_bytes and entries:
+            excess = max(excess, entries - int(entries * self.max_bytes / size))
+        if excess > 0:
+            self._connection().execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND cle IN ("
+                " SELECT cle FROM cache_entries WHERE namespace = ? ORDER BY expire LIMIT ?)",
+                (self.name, self.name, excess)
+            )
+            with self._lock:
+                self._counters['evictions'] += excess
+
+    def _occupancy(self):
+        entries, size = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(valeur)), 0) FROM cache_entries "
+            "WHERE namespace = ? AND expire > ?", (self.name, time.time())
+        ).fetchone()
+        return {'entries': entries, 'bytes': size}
+
+class RedisError(Exception):
+    """Réponse d'erreur du serveur Redis"""
+
+class RedisClient:
+    """Client minimal du protocole Redis (RESP2), une connexion par thread"""
+
+    def __init__(self, url=None, timeout=2.0):
+        parsed = urlparse(url or REDIS_URL)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def execute(self, *args):
+        return self.pipeline([args])[0]
+
+    def pipeline(self, commands):
+        """Envoie plusieurs commandes en un seul aller-retour ; reconnecte une fois si besoin"""
+        payload = b''.join(_encode_command(args) for args in commands)
+        for attempt in (1, 2):
+            connection, reader = self._connect()
+            try:
+                connection.sendall(payload)
+                return [_read_reply(reader) for _ in commands]
+            except (OSError, EOFError):
+                self.close()
+                if attempt == 2:
+                    raise
+
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            try:
+                connection.close()
+            except OSError:
+                pass
+            self._local.connection = None
+
+    def _connect(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._local.connection = connection
+            self._local.reader = connection.makefile('rb')
+            setup = []
+            if self.password:
+                setup.append(('AUTH', self.password))
+            if self.db:
+                setup.append(('SELECT', self.db))
+            if setup:
+                try:
+                    connection.sendall(b''.join(_encode_command(args) for args in setup))
+                    for _ in setup:
+                        _read_reply(self._local.reader)
+                except Exception:
+                    self.close()
+                    raise
+        return connection, self._local.reader
+
+def _encode_command(args):
+    parts = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        if isinstance(arg, str):
+            arg = arg.encode('utf-8')
+        elif not isinstance(arg, bytes):
+            arg = str(arg).encode('ascii')
+        parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+    return b''.join(parts)
+
+def _read_reply(reader):
+    line = reader.readline()
+    if not line.endswith(b'\r\n'):
+        raise EOFError("connexion Redis fermée")
+    kind, body = line[:1], line[1:-2]
+    if kind == b'+':
+        return body.decode('utf-8')
+    if kind == b'-':
+        raise RedisError(body.decode('utf-8'))
+    if kind == b':':
+        return int(body)
+    if kind == b'$':
+        length = int(body)
+        if length < 0:
+            return None
+        data = reader.read(length + 2)
+        return data[:-2]
+    if kind == b'*':
+        length = int(body)
+        if length < 0:
+            return None
+        return [_read_reply(reader) for _ in range(length)]
+    raise RedisError(f"réponse inattendue: {line!r}")
+
+class RedisCache(_SharedCache):
+    """Cache sur un serveur Redis ; l'expiration et l'éviction sont laissées au serveur"""
+
+    backend = 'redis'
+
+    def __init__(self, name, url=None, client=None, **options):
+        super().__init__(name, **options)
+        self.client = client or RedisClient(url)
+        self.prefix = f"{REDIS_KEY_PREFIX}:{name}:"
+
+    def _get(self, key):
+        data = self.client.execute('GET', self.prefix + key)
+        if data is None:
+            return _MISSING
+        # Les compteurs sont stockés en entiers natifs pour INCRBY
+        if data.lstrip(b'-').isdigit():
+            return int(data)
+        return pickle.loads(data)
+
+    def _set(self, key, data, ttl):
+        self.client.execute('SET', self.prefix + key, data, 'PX', max(1, int(ttl * 1000)))
+
+    def _delete(self, key):
+        self.client.execute('DEL', self.prefix + key)
+
+    def _incr(self, key, amount, ttl):
+        # MULTI/EXEC : SET NX (durée de vie posée à la création) et INCRBY s'exécutent d'un bloc,
+        # la clé ne peut pas expirer entre les deux et renaître sans durée de vie
+        replies = self.client.pipeline([
+            ('MULTI',),
+            ('SET', self.prefix + key, 0, 'PX', max(1, int(ttl * 1000)), 'NX'),
+            ('INCRBY', self.prefix + key, amount),
+            ('EXEC',),
+        ])
+        return replies[3][1]
+
+    def clear(self):
+        for keys in list(self._scan()):
+            if keys:
+                self.client.execute('DEL', *keys)
+
+    def purge_expired(self):
+        return 0
+
+    def _occupancy(self):
+        return {'entries': sum(len(keys) for keys in self._scan())}
+
+    def _scan(self):
+        """Lots de clés de l'espace de noms (SCAN, sans bloquer le serveur)"""
+        cursor = '0'
+        while True:
+            cursor, keys = self.client.execute('SCAN', cursor, 'MATCH', self.prefix + '*', 'COUNT', 500)
+            yield keys
+            cursor = cursor.decode('ascii') if isinstance(cursor, bytes) else cursor
+            if cursor == '0':
+                break
+
+def create_cache(name, max_entries=1024, max_bytes=16 * 1024 * 1024, default_ttl=300, backend=None):
+    """Crée un cache avec le backend configuré (CACHE_BACKEND=memory|sqlite|redis)
+
+    Un backend partagé injoignable au démarrage retombe sur le cache mémoire du processus.
+    """
+    backend = (backend or CACHE_BACKEND).lower()
+    options = {'max_entries': max_entries, 'max_bytes': max_bytes, 'default_ttl': default_ttl}
+    try:
+        if backend == 'sqlite':
+            return SQLiteCache(name, **options)
+        if backend == 'redis':
+            cache = RedisCache(name, **options)
+            cache.client.execute('PING')
+            return cache
+        if backend != 'memory':
+            logging.warning(f"Backend de cache inconnu '{backend}', utilisation du cache mémoire")
+    except Exception as e:
+        logging.warning(f"Backend de cache '{backend}' indisponible pour {name}, cache mémoire utilisé: {e}")
+    return LRUCache(name, **options)
+
+# ===== INVALIDATION PAR ÉTIQUETTES =====
+# Chaque étiquette (nom de modèle : 'Courrier', 'User'...) porte un numéro de version partagé
+# via le backend configuré. Les clés des entrées étiquetées incluent ces versions :
+# incrémenter une version rend inaccessibles les entrées qui en dépendent, dans tous les workers,
+# et elles sont ensuite évincées par le LRU ou leur durée de vie.
+
+TAG_VERSION_TTL = 10 * 365 * 24 * 3600  # les versions ne doivent pas expirer avant les entrées
+
+_tag_versions = create_cache('etiquettes', max_entries=4096, max_bytes=1024 * 1024,
+                             default_ttl=TAG_VERSION_TTL)
+
+def tag_versions(tags):
+    """Versions courantes des étiquettes, dans l'ordre donné"""
+    return tuple(_tag_versions.get(tag) or 0 for tag in tags)
+
+def invalidate_tags(*tags):
+    """Invalide les entrées qui dépendent d'une des étiquettes"""
+    for tag in sorted(set(tags)):
+        try:
+            _tag_versions.incr(tag, ttl=TAG_VERSION_TTL)
+        except Exception as e:
+            logging.warning(f"Invalidation du cache impossible pour l'étiquette {tag}: {e}")
@@ -5,10 +5,11 @@ Supprime toutes les données sauf l'utilisateur super admin et les données de c
 import os
 import sys
 from app import app, db
+from attachment_store_utils import attachment_store
 from models import (
     User, Courrier, CourrierModification, LogActivite, 
     Notification, CourrierComment, CourrierForward,
-    IPBlock, Departement
+    IPBlock, Departement, CourrierSuggestion, CourrierDailyStats
 )
 
 def cleanup_database():
@@ -31,6 +32,14 @@ def cleanup_database():
     
     with app.app_context():
         try:
+            # Pièces jointes du stockage par contenu dont les références seront retirées après validation
+            released_checksums = [checksum for checksum, chemin in db.session.query(
+                Courrier.fichier_checksum, Courrier.fichier_chemin
+            ).filter(Courrier.fichier_checksum.isnot(None)) if attachment_store.owns(chemin, checksum)]
+            released_checksums += [checksum for (checksum,) in db.session.query(
+                CourrierForward.attached_file_checksum
+            ).filter(CourrierForward.attached_file_checksum.isnot(None))]
+            
             # 1. Supprimer les transferts de courrier
             print("📧 Suppression des transferts de courrier...")
             count_forwards = CourrierForward.query.delete()
@@ -51,8 +60,13 @@ def cleanup_database():
             count_modifications = CourrierModification.query.delete()
             print(f"   ✓ {count_modifications} modification(s) supprimée(s)")
             
-            # 5. Supprimer tous les courriers
+            # 5. Supprimer tous les courriers (la suppression en masse ne déclenche pas les
+            # événements du modèle : retirer les suggestions de recherche et les statistiques d'abord)
             print("📄 Suppression des courriers...")
+            count_suggestions = CourrierSuggestion.query.delete()
+            print(f"   ✓ {count_suggestions} suggestion(s) de recherche supprimée(s)")
+            count_daily_stats = CourrierDailyStats.query.delete()
+            print(f"   ✓ {count_daily_stats} ligne(s) de statistiques quotidiennes supprimée(s)")
             count_courriers = Courrier.query.delete()
             print(f"   ✓ {count_courriers} courrier(s) supprimé(s)")
             
@@ -95,6 +109,9 @@ def cleanup_database():
             # Commit toutes les modifications
             print("\n💾 Enregistrement des modifications...")
             db.session.commit()
+            for checksum in released_checksums:
+                attachment_store.release(checksum)
+            print(f"   ✓ {len(released_checksums)} référence(s) de pièce jointe libérée(s)")
             
             print("\n" + "=" * 60)
             print("✅ NETTOYAGE TERMINÉ AVEC SUCCÈS!")
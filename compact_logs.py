@@ -0,0 +1,41 @@
+"""
+Script de compaction du journal des activités (table log_activite)
+Archive en NDJSON compressé les mois antérieurs à l'horizon LOG_HOT_MONTHS et crée les
+partitions des mois à venir (PostgreSQL). À planifier (cron) quand la compaction intégrée
+est désactivée par LOG_COMPACTION_INTERVAL_HOURS=0.
+
+Usage: python compact_logs.py [--months N]
+"""
+import sys
+import argparse
+from app import app, db
+from log_storage_utils import run_log_compaction, LOG_HOT_MONTHS, LOG_ARCHIVE_FOLDER
+
+def main():
+    parser = argparse.ArgumentParser(description="Compaction du journal des activités")
+    parser.add_argument('--months', type=int, default=LOG_HOT_MONTHS,
+                        help="mois conservés en base avant archivage")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("COMPACTION DU JOURNAL DES ACTIVITÉS")
+    print("=" * 60 + "\n")
+
+    with app.app_context():
+        try:
+            archived = run_log_compaction(db.engine, args.months)
+        except Exception as e:
+            print(f"\n❌ Erreur lors de la compaction du journal: {e}")
+            return 1
+
+    if archived is None:
+        print("⚠️  Une compaction est déjà en cours.\n")
+        return 1
+    for month, count in archived:
+        print(f"   ✓ {month:%Y-%m} : {count} entrée(s) archivée(s)")
+
+    print(f"\n✨ {len(archived)} mois archivé(s) dans {LOG_ARCHIVE_FOLDER}.\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
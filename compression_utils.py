@@ -0,0 +1,218 @@
+"""
+Compression des réponses HTML/JSON (middleware WSGI gzip, brotli si disponible)
+Les fichiers envoyés tels quels (PDF, images, variantes statiques déjà compressées),
+les petites réponses et les réponses partielles ne sont pas recompressés.
+"""
+import zlib
+import logging
+import threading
+
+try:
+    import brotli
+except ImportError:  # brotli est optionnel : gzip seul
+    brotli = None
+
+COMPRESS_MIN_SIZE = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5   # compromis CPU/taille pour une compression à la volée
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/css', 'text/plain', 'text/csv', 'text/xml', 'text/javascript',
+    'application/json', 'application/javascript', 'application/xml', 'image/svg+xml',
+}
+
+class CompressionStats:
+    """Compteurs de compression du processus"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counters = {'compressed': 0, 'skipped': 0, 'bytes_in': 0, 'bytes_out': 0}
+            self._by_encoding = {}
+
+    def record(self, encoding, bytes_in, bytes_out):
+        with self._lock:
+            self._counters['compressed'] += 1
+            self._counters['bytes_in'] += bytes_in
+            self._counters['bytes_out'] += bytes_out
+            entry = self._by_encoding.setdefault(encoding, {'responses': 0, 'bytes_in': 0, 'bytes_out': 0})
+            entry['responses'] += 1
+            entry['bytes_in'] += bytes_in
+            entry['bytes_out'] += bytes_out
+
+    def skip(self):
+        with self._lock:
+            self._counters['skipped'] += 1
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['encodings'] = {name: dict(entry) for name, entry in self._by_encoding.items()}
+        stats['ratio'] = round(stats['bytes_out'] / stats['bytes_in'], 3) if stats['bytes_in'] else None
+        return stats
+
+compression_stats = CompressionStats()
+
+def get_compression_stats():
+    """Réponses compressées, octets avant/après et ratio moyen (par encodage)"""
+    return compression_stats.snapshot()
+
+def choose_encoding(accept_encoding, allow_brotli=True):
+    """Encodage à utiliser d'après l'en-tête Accept-Encoding, None si aucun"""
+    accepted = {}
+    for item in (accept_encoding or '').split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.lower()] = quality
+    if allow_brotli and brotli is not None and accepted.get('br', 0) > 0:
+        return 'br'
+    if accepted.get('gzip', accepted.get('*', 0)) > 0:
+        return 'gzip'
+    return None
+
+class _Compressor:
+    """Compresseur incrémental gzip ou brotli"""
+
+    def __init__(self, encoding, level):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._stream = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._stream = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        if self.encoding == 'br':
+            return self._stream.process(data)
+        return self._stream.compress(data)
+
+    def flush(self):
+        return self._stream.finish() if self.encoding == 'br' else self._stream.flush()
+
+class CompressionMiddleware:
+    """Middleware WSGI : compresse les réponses textuelles au fil de l'eau
+
+    Le corps est mis en attente jusqu'à min_size octets : une réponse plus courte
+    part non compressée avec ses en-têtes d'origine.
+    """
+
+    def __init__(self, app, min_size=COMPRESS_MIN_SIZE, level=GZIP_LEVEL, content_types=None,
+                 allow_brotli=True):
+        self.app = app
+        self.min_size = min_size
+        self.level = level
+        self.content_types = set(content_types or COMPRESSIBLE_TYPES)
+        self.allow_brotli = allow_brotli
+
+    def __call__(self, environ, start_response):
+        encoding = None
+        if environ.get('REQUEST_METHOD') != 'HEAD':
+            encoding = choose_encoding(environ.get('HTTP_ACCEPT_ENCODING'), self.allow_brotli)
+        if encoding is None:
+            return self.app(environ, start_response)
+
+        state = {}
+
+        def capture_start_response(status, headers, exc_info=None):
+            # Appel tardif (application paresseuse) : la réponse part telle quelle
+            if state.get('returned'):
+                return start_response(status, headers, exc_info)
+            state['status'], state['headers'], state['exc_info'] = status, headers, exc_info
+            state['compress'] = self._should_compress(status, headers)
+            if not state['compress']:
+                return start_response(status, headers, exc_info)
+
+            def write(data):
+                # write() (API WSGI historique) : la réponse part sans compression
+                if 'write' not in state:
+                    state['compress'] = False
+                    state['write'] = start_response(status, headers, exc_info)
+                return state['write'](data)
+            return write
+
+        result = self.app(environ, capture_start_response)
+        state['returned'] = True
+        if not state.get('compress'):
+            if 'status' in state:
+                compression_stats.skip()
+            return result
+        return self._compressed_body(result, state, encoding, start_response)
+
+    def _should_compress(self, status, headers):
+        if not status.startswith('200'):
+            return False
+        values = {name.lower(): value for name, value in headers}
+        if 'content-encoding' in values or 'content-range' in values:
+            return False
+        if 'no-transform' in values.get('cache-control', ''):
+            return False
+        content_type = values.get('content-type', '').split(';')[0].strip().lower()
+        if content_type not in self.content_types:
+            return False
+        length = values.get('content-length')
+        if length is not None and length.isdigit() and int(length) < self.min_size:
+            return False
+        return True
+
+    def _compressed_body(self, result, state, encoding, start_response):
+        iterator = iter(result)
+        try:
+            pending = []
+            size = 0
+            for chunk in iterator:
+                if chunk:
+                    pending.append(chunk)
+                    size += len(chunk)
+                if size >= self.min_size:
+                    break
+            else:
+                # Réponse courte : envoyée sans compression
+                compression_stats.skip()
+                start_response(state['status'], state['headers'], state['exc_info'])
+                yield b''.join(pending)
+                return
+
+            headers = [(name, value) for name, value in state['headers']
+                       if name.lower() not in ('content-length', 'etag')]
+            headers.append(('Content-Encoding', encoding))
+            vary = [value for name, value in state['headers'] if name.lower() == 'vary']
+            if not any('accept-encoding' in value.lower() for value in vary):
+                headers.append(('Vary', 'Accept-Encoding'))
+            # ETag faible : le contenu compressé n'est pas identique octet par octet
+            headers.extend(('ETag', value if value.startswith('W/') else 'W/' + value)
+                           for name, value in state['headers'] if name.lower() == 'etag')
+            start_response(state['status'], headers, state['exc_info'])
+
+            compressor = _Compressor(encoding, self.level)
+            bytes_in = size
+            bytes_out = 0
+            data = compressor.compress(b''.join(pending))
+            if data:
+                bytes_out += len(data)
+                yield data
+            for chunk in iterator:
+                if not chunk:
+                    continue
+                bytes_in += len(chunk)
+                data = compressor.compress(chunk)
+                if data:
+                    bytes_out += len(data)
+                    yield data
+            data = compressor.flush()
+            bytes_out += len(data)
+            yield data
+            compression_stats.record(encoding, bytes_in, bytes_out)
+        finally:
+            close = getattr(result, 'close', None)
+            if close is not None:
+                try:
+                    close()
+                except Exception as e:
+                    logging.warning(f"Fermeture de la réponse impossible: {e}")
@@ -13,6 +13,7 @@ from datetime import datetime
 from app import db
 from models import Courrier, CourrierForward
 from encryption_utils import encryption_manager, decrypt_sensitive_data, encrypt_sensitive_data
+from attachment_store_utils import attachment_store
 
 # Version du format d'export pour assurer la compatibilité
 EXPORT_FORMAT_VERSION = "1.0.0"
@@ -101,13 +102,14 @@ def export_courriers_to_json(courrier_ids=None, export_all=False):
             courrier_data["destinataire"] = courrier.destinataire
             courrier_data["numero_reference"] = courrier.numero_reference
         
-        # Gérer le fichier attaché principal
-        if courrier.fichier_chemin and os.path.exists(courrier.fichier_chemin):
+        # Gérer le fichier attaché principal (stockage par contenu ou ancien emplacement)
+        fichier_path = attachment_store.resolve(courrier.fichier_checksum, courrier.fichier_chemin) if courrier.fichier_chemin else None
+        if fichier_path:
             attachment_data = {
                 "courrier_id": courrier.id,
                 "type": "main",
                 "filename": courrier.fichier_nom,
-                "path": courrier.fichier_chemin,
+                "path": fichier_path,
                 "encrypted": courrier.fichier_encrypted,
                 "checksum": courrier.fichier_checksum
             }
@@ -128,13 +130,16 @@ def export_courriers_to_json(courrier_ids=None, export_all=False):
             }
             
             # Gérer les fichiers joints aux transmissions
-            if forward.attached_file and os.path.exists(forward.attached_file):
+            forward_path = attachment_store.resolve(
+                forward.attached_file_checksum, os.path.join('uploads', 'forwards', forward.attached_file)
+            ) if forward.attached_file else None
+            if forward_path:
                 attachment_data = {
                     "courrier_id": courrier.id,
                     "type": "forward",
                     "forward_id": forward.id,
                     "filename": forward.attached_file_original_name,
-                    "path": forward.attached_file,
+                    "path": forward_path,
                     "encrypted": False
                 }
                 export_data["attachments"].append(attachment_data)
@@ -400,23 +405,20 @@ def import_courriers_from_package(package_path, skip_existing=True, remap_users=
                         # Fichier principal
                         source_file = os.path.join(attachments_dir, f"{old_id}_{attachment['filename']}")
                         if os.path.exists(source_file):
-                            # Créer le chemin de destination
-                            uploads_dir = 'uploads'
-                            os.makedirs(uploads_dir, exist_ok=True)
-                            dest_file = os.path.join(uploads_dir, f"{new_courrier.id}_{attachment['filename']}")
-                            
                             # Rechiffrer le fichier avec la clé de cette instance
                             # Note: Le fichier source est déjà en clair (déchiffré à l'export)
                             if attachment.get("encrypted", False):
-                                # Re-chiffrer avec la nouvelle clé
-                                encryption_manager.encrypt_file(source_file, dest_file + ".encrypted")
-                                new_courrier.fichier_chemin = dest_file + ".encrypted"
+                                # Re-chiffrer avec la nouvelle clé puis ranger le fichier chiffré dans le stockage
+                                encrypted_file = os.path.join(temp_dir, f"{new_courrier.id}.encrypted")
+                                encryption_manager.encrypt_file(source_file, encrypted_file)
+                                checksum, _, stored_path = attachment_store.save_file(encrypted_file)
                                 new_courrier.fichier_encrypted = True
                             else:
-                                # Fichier non chiffré, copier tel quel
-                                shutil.copy2(source_file, dest_file)
-                                new_courrier.fichier_chemin = dest_file
+                                # Fichier non chiffré, stocké tel quel (partagé s'il existe déjà)
+                                checksum, _, stored_path = attachment_store.save_file(source_file)
                                 new_courrier.fichier_encrypted = False
+                            new_courrier.fichier_chemin = stored_path
+                            new_courrier.fichier_checksum = checksum
                         else:
                             # Fichier manquant dans l'export
                             result["details"].append(f"AVERTISSEMENT: Fichier manquant pour courrier {courrier_data['numero_accuse_reception']}: {attachment['filename']}")
@@ -0,0 +1,72 @@
+"""
+Politique de cache HTTP par route
+Par défaut les réponses (pages HTML authentifiées, JSON) ne sont pas stockées par le navigateur ;
+les fichiers statiques et les fichiers servis par certaines routes (pièces jointes, photos de
+profil, fichiers de langue) sont mis en cache ou revalidés par ETag / Last-Modified.
+"""
+import re
+from functools import wraps
+from flask import request, g, has_request_context, make_response
+
+# Valeurs de Cache-Control
+NO_STORE = 'no-cache, no-store, must-revalidate'
+REVALIDATE_PRIVATE = 'private, no-cache'          # copie navigateur, revalidée à chaque usage (304)
+REVALIDATE_PUBLIC = 'public, no-cache'
+PRIVATE_DAY = 'private, max-age=86400'             # fichiers renommés à chaque remplacement (photos de profil)
+IMMUTABLE = 'public, max-age=31536000, immutable'  # URL contenant l'empreinte du contenu
+VENDOR = 'public, max-age=604800'                  # bibliothèques tierces versionnées par dossier
+
+# Fichiers statiques dont le nom ou l'URL porte l'empreinte du contenu (app.3f2a9c1b.js ou ?v=3f2a9c1b)
+FINGERPRINT_PATTERN = re.compile(r'\.[0-9a-f]{8,32}\.[A-Za-z0-9]+$')
+FINGERPRINT_ARG = 'v'
+
+# Seules ces réponses peuvent être réutilisées ; redirections et erreurs ne sont jamais stockées
+CACHEABLE_STATUS = {200, 203, 206, 304}
+
+def cache_policy(cache_control, etag=False):
+    """Décorateur de vue : Cache-Control de la réponse
+
+    etag=True ajoute un ETag calculé sur le corps (réponses générées) et répond 304
+    si le navigateur possède déjà cette version ; send_file pose déjà ETag et Last-Modified.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            g.cache_control = cache_control
+            response = f(*args, **kwargs)
+            if etag:
+                response = make_response(response)
+                if (response.status_code == 200 and not response.direct_passthrough
+                        and 'ETag' not in response.headers):
+                    response.add_etag()
+                    response.make_conditional(request)
+            return response
+        return decorated_function
+    return decorator
+
+def static_cache_control(path, args=None):
+    """Politique d'un fichier du dossier static selon son chemin"""
+    if FINGERPRINT_PATTERN.search(path) or (args is not None and args.get(FINGERPRINT_ARG)):
+        return IMMUTABLE
+    if '/vendor/' in path:
+        return VENDOR
+    return REVALIDATE_PUBLIC
+
+def apply_cache_policy(response):
+    """Pose Cache-Control selon la route ; no-store si aucune politique n'a été déclarée"""
+    cache_control = None
+    if has_request_context() and response.status_code in CACHEABLE_STATUS:
+        if request.endpoint == 'static':
+            cache_control = static_cache_control(request.path, request.args)
+        else:
+            cache_control = g.get('cache_control')
+
+    if cache_control is None or cache_control == NO_STORE:
+        response.headers['Cache-Control'] = NO_STORE
+        response.headers['Pragma'] = 'no-cache'
+        response.headers['Expires'] = '0'
+    else:
+        response.headers['Cache-Control'] = cache_control
+        response.headers.pop('Pragma', None)
+        response.headers.pop('Expires', None)
+    return response
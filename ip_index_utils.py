@@ -0,0 +1,129 @@
+"""
+Index en mémoire des IP bloquées et autorisées (whitelist), adresses simples ou plages CIDR
+Les plages sont fusionnées en intervalles disjoints triés : une vérification est une
+recherche dichotomique. L'index est rechargé depuis la base quand la version des listes
+(table security_list_version) change, vérifiée au plus toutes les CHECK_INTERVAL secondes,
+ou immédiatement après une modification validée dans ce processus.
+"""
+import time
+import bisect
+import logging
+import ipaddress
+import threading
+from datetime import datetime
+
+CHECK_INTERVAL = 2.0  # secondes entre deux lectures de la version en base
+
+def parse_network(value):
+    """Réseau ipaddress pour une IP ou une plage CIDR, None si la valeur n'est pas une adresse"""
+    try:
+        return ipaddress.ip_network(str(value).strip(), strict=False)
+    except ValueError:
+        return None
+
+class IPRangeSet:
+    """Ensemble d'adresses et de plages, interrogé par recherche dichotomique"""
+
+    def __init__(self, values=()):
+        ranges = {4: [], 6: []}
+        self._literals = set()  # valeurs non analysables, comparées telles quelles
+        for value in values:
+            network = parse_network(value)
+            if network is None:
+                self._literals.add(str(value).strip())
+            else:
+                ranges[network.version].append((int(network.network_address), int(network.broadcast_address)))
+
+        self._starts, self._ends = {}, {}
+        for version, intervals in ranges.items():
+            merged = []
+            for start, end in sorted(intervals):
+                if merged and start <= merged[-1][1] + 1:
+                    merged[-1][1] = max(merged[-1][1], end)
+                else:
+                    merged.append([start, end])
+            self._starts[version] = [start for start, _ in merged]
+            self._ends[version] = [end for _, end in merged]
+
+    def __contains__(self, ip):
+        if ip in self._literals:
+            return True
+        try:
+            address = ipaddress.ip_address(str(ip).strip())
+        except ValueError:
+            return False
+        if address.version == 6 and address.ipv4_mapped is not None:
+            address = address.ipv4_mapped
+        starts = self._starts[address.version]
+        index = bisect.bisect_right(starts, int(address)) - 1
+        return index >= 0 and self._ends[address.version][index] >= int(address)
+
+    def __len__(self):
+        return len(self._literals) + sum(len(starts) for starts in self._starts.values())
+
+class IPAccessIndex:
+    """Listes d'IP bloquées et autorisées chargées en mémoire, synchronisées par numéro de version"""
+
+    def __init__(self, check_interval=CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._version = None
+        self._whitelist = IPRangeSet()
+        self._blocked = IPRangeSet()
+        self._next_expiry = None   # expiration (UTC) du premier blocage actif
+        self._next_check = 0.0
+
+    def is_whitelisted(self, ip):
+        self._refresh()
+        return ip in self._whitelist
+
+    def is_blocked(self, ip):
+        """Vrai si l'IP est couverte par un blocage actif et non expiré (sans tenir compte de la whitelist)"""
+        self._refresh()
+        return ip in self._blocked
+
+    def invalidate(self):
+        """Force un rechargement à la prochaine vérification (modification validée dans ce processus)"""
+        self._next_check = 0.0
+        self._version = None
+
+    def stats(self):
+        return {
+            'version': self._version,
+            'whitelist_ranges': len(self._whitelist),
+            'blocked_ranges': len(self._blocked),
+            'next_expiry': self._next_expiry.isoformat() if self._next_expiry else None,
+        }
+
+    def _refresh(self):
+        now = time.monotonic()
+        expired = self._next_expiry is not None and datetime.utcnow() >= self._next_expiry
+        if now < self._next_check and not expired:
+            return
+        with self._lock:
+            if now < self._next_check and not expired:
+                return
+            from models import SecurityListVersion
+            version = SecurityListVersion.current()
+            if version != self._version or expired:
+                self._load(version)
+            self._next_check = time.monotonic() + self.check_interval
+
+    def _load(self, version):
+        from models import IPBlock, IPWhitelist
+        from app import db
+
+        now = datetime.utcnow()
+        whitelist = db.session.query(IPWhitelist.ip_address).filter(IPWhitelist.is_active == True).all()
+        blocks = db.session.query(IPBlock.ip_address, IPBlock.expires_at).filter(
+            IPBlock.is_active == True, IPBlock.expires_at > now
+        ).all()
+
+        self._whitelist = IPRangeSet(row.ip_address for row in whitelist)
+        self._blocked = IPRangeSet(row.ip_address for row in blocks)
+        self._next_expiry = min((row.expires_at for row in blocks), default=None)
+        self._version = version
+        logging.debug(f"Index des IP rechargé (version {version}): {len(whitelist)} autorisée(s), "
+                      f"{len(blocks)} bloquée(s)")
+
+ip_access_index = IPAccessIndex()
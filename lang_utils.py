@@ -1,5 +1,7 @@
 import json
 import os
+import time
+import threading
 from flask import session, request
 
 # Configuration des langues par défaut (peut être étendue automatiquement)
@@ -16,54 +18,87 @@ DEFAULT_LANGUAGE_CONFIG = {
     'ru': {'name': 'Русский', 'flag': '🇷🇺', 'enabled': False}
 }
 
-def get_available_languages():
-    """Retourne la liste des langues disponibles en détectant automatiquement les fichiers JSON"""
+# Cache des tables de langues partagé par utils.py, lang_utils.py et utils/lang.py.
+# Chaque table est construite une seule fois (scan du dossier lang/ compris) puis
+# réutilisée jusqu'à invalidate_language_cache() (activation, upload, suppression)
+# ou expiration de LANGUAGE_CACHE_TTL pour détecter les fichiers déposés à la main.
+LANGUAGE_CACHE_TTL = 60  # secondes
+_language_cache = {}
+_language_cache_generation = 0  # incrémenté à chaque invalidation
+_language_cache_lock = threading.Lock()
+
+def get_cached_language_table(cache_key, builder):
+    """Retourne la table de langues associée à cache_key, construite par builder() si absente.
+    
+    La table retournée est partagée : elle ne doit pas être modifiée par l'appelant.
+    builder() est appelé hors du verrou : il peut lui-même lire une autre table du cache
+    (list_language_codes) ; deux constructions concurrentes produisent la même table.
+    Une table construite pendant une invalidation est retournée mais pas conservée.
+    """
+    now = time.monotonic()
+    entry = _language_cache.get(cache_key)
+    if entry is not None and now < entry[0]:
+        return entry[1]
+    
+    generation = _language_cache_generation
+    table = builder()
+    with _language_cache_lock:
+        if generation == _language_cache_generation:
+            _language_cache[cache_key] = (now + LANGUAGE_CACHE_TTL, table)
+    return table
+
+def invalidate_language_cache():
+    """Invalide toutes les tables de langues mises en cache"""
+    global _language_cache_generation
+    with _language_cache_lock:
+        _language_cache_generation += 1
+        _language_cache.clear()
+
+def list_language_codes(lang_dir):
+    """Retourne les codes de langue présents dans lang_dir (scan mis en cache)"""
+    def scan():
+        if not os.path.exists(lang_dir):
+            return ()
+        return tuple(sorted(
+            filename[:-5] for filename in os.listdir(lang_dir)
+            if filename.endswith('.json')
+        ))
+    return get_cached_language_table(('codes', lang_dir), scan)
+
+def _get_lang_dir():
+    """Retourne le dossier contenant les fichiers de langue"""
+    return os.path.join(os.path.dirname(__file__), 'lang')
+
+def _build_language_table(only_enabled):
+    """Construit la table des langues à partir des fichiers JSON présents"""
     languages = {}
-    lang_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'lang')
     
-    if os.path.exists(lang_dir):
-        for filename in os.listdir(lang_dir):
-            if filename.endswith('.json'):
-                lang_code = filename[:-5]  # Remove .json
-                
-                # Utiliser la configuration par défaut si disponible, sinon générer automatiquement
-                if lang_code in DEFAULT_LANGUAGE_CONFIG:
-                    lang_config = DEFAULT_LANGUAGE_CONFIG[lang_code].copy()
-                    # Vérifier si la langue est activée
-                    if lang_config.get('enabled', True):
-                        languages[lang_code] = lang_config
-                else:
-                    # Génération automatique pour les nouvelles langues (activées par défaut)
-                    languages[lang_code] = {
-                        'name': lang_code.upper(),  # Nom par défaut
-                        'flag': '🌐',  # Drapeau générique
-                        'enabled': True
-                    }
+    for lang_code in list_language_codes(_get_lang_dir()):
+        # Utiliser la configuration par défaut si disponible, sinon générer automatiquement
+        if lang_code in DEFAULT_LANGUAGE_CONFIG:
+            lang_config = DEFAULT_LANGUAGE_CONFIG[lang_code].copy()
+            # Vérifier si la langue est activée
+            if not only_enabled or lang_config.get('enabled', True):
+                languages[lang_code] = lang_config
+        else:
+            # Génération automatique pour les nouvelles langues (activées par défaut)
+            languages[lang_code] = {
+                'name': lang_code.upper(),  # Nom par défaut
+                'flag': '🌐',  # Drapeau générique
+                'enabled': True
+            }
     
     return languages
 
+def get_available_languages():
+    """Retourne la liste des langues disponibles en détectant automatiquement les fichiers JSON"""
+    return get_cached_language_table(('lang_utils', 'available'),
+                                     lambda: _build_language_table(only_enabled=True))
+
 def get_all_languages():
     """Retourne toutes les langues (activées et désactivées)"""
-    languages = {}
-    lang_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'lang')
-    
-    if os.path.exists(lang_dir):
-        for filename in os.listdir(lang_dir):
-            if filename.endswith('.json'):
-                lang_code = filename[:-5]  # Remove .json
-                
-                # Utiliser la configuration par défaut si disponible, sinon générer automatiquement
-                if lang_code in DEFAULT_LANGUAGE_CONFIG:
-                    languages[lang_code] = DEFAULT_LANGUAGE_CONFIG[lang_code].copy()
-                else:
-                    # Génération automatique pour les nouvelles langues
-                    languages[lang_code] = {
-                        'name': lang_code.upper(),  # Nom par défaut
-                        'flag': '🌐',  # Drapeau générique
-                        'enabled': True
-                    }
-    
-    return languages
+    return get_cached_language_table(('lang_utils', 'all'),
+                                     lambda: _build_language_table(only_enabled=False))
 
 def get_language_info(lang_code):
     """Obtient les informations d'une langue spécifique"""
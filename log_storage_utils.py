@@ -0,0 +1,515 @@
+"""
+Stockage des journaux d'activité par mois (table log_activite)
+PostgreSQL : table partitionnée par mois (log_activite_pAAAAMM, plus une partition par défaut),
+les partitions des mois à venir étant créées à l'avance. SQLite, sans partitionnement natif :
+la table est une fenêtre glissante dont les mois anciens sont retirés en bloc.
+Les mois plus anciens que LOG_HOT_MONTHS sont compactés en archives NDJSON compressées
+(une par mois dans LOG_ARCHIVE_FOLDER), consultables à la demande depuis le journal des
+activités et l'export PDF.
+"""
+import os
+import re
+import gzip
+import json
+import time
+import logging
+import threading
+from datetime import datetime, date
+from sqlalchemy import text, select, and_
+from cache_utils import create_cache
+
+LOG_TABLE = 'log_activite'
+DEFAULT_PARTITION = 'log_activite_default'
+LOG_HOT_MONTHS = int(os.environ.get('LOG_HOT_MONTHS', 6))
+LOG_ARCHIVE_FOLDER = os.environ.get('LOG_ARCHIVE_FOLDER', 'log_archives')
+LOG_COMPACTION_INTERVAL_HOURS = float(os.environ.get('LOG_COMPACTION_INTERVAL_HOURS', 24))
+PARTITIONS_AHEAD = 2           # mois créés à l'avance après le mois courant
+COMPACTION_START_DELAY = 300   # secondes avant la première compaction après le démarrage
+LOCK_STALE_SECONDS = 3600      # verrou abandonné par un processus interrompu
+ARCHIVE_BATCH = 2000           # lignes lues par aller-retour lors de l'archivage
+
+ARCHIVE_COLUMNS = ['id', 'action', 'description', 'date_action', 'ip_address', 'utilisateur_id', 'courrier_id']
+ARCHIVE_PATTERN = re.compile(r'^log_activite_(\d{4})-(\d{2})\.ndjson\.gz$')
+
+# ===== MOIS =====
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+def month_bounds(month):
+    """Début (inclus) et fin (exclue) du mois, en datetime"""
+    end = add_months(month, 1)
+    return datetime(month.year, month.month, 1), datetime(end.year, end.month, 1)
+
+def partition_name(month):
+    return f"{LOG_TABLE}_p{month.year:04d}{month.month:02d}"
+
+# ===== PARTITIONS (POSTGRESQL) =====
+
+def ensure_log_partitions(engine, today=None):
+    """PostgreSQL : convertit log_activite en table partitionnée et crée les partitions à venir"""
+    if engine.dialect.name != 'postgresql':
+        return
+    current = month_start(today or datetime.utcnow())
+    try:
+        with engine.begin() as connection:
+            if not _is_partitioned(connection):
+                logging.info("Conversion de log_activite en table partitionnée par mois...")
+                _convert_to_partitioned(connection, current)
+            for offset in range(PARTITIONS_AHEAD + 1):
+                _create_partition(connection, add_months(current, offset))
+    except Exception as e:
+        logging.warning(f"Partitionnement du journal des activités impossible: {e}")
+
+def _is_partitioned(connection):
+    return connection.execute(
+        text("SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"),
+        {'table': LOG_TABLE}
+    ).first() is not None
+
+def _create_partition(connection, month):
+    """Crée la partition du mois ; les lignes déjà rangées dans la partition par défaut y sont déplacées"""
+    name = partition_name(month)
+    if connection.execute(text("SELECT to_regclass(:name)"), {'name': name}).scalar():
+        return
+    start, end = month_bounds(month)
+    bounds = {'start': start, 'end': end}
+    in_month = "date_action >= :start AND date_action < :end"
+    has_default = connection.execute(text("SELECT to_regclass(:name)"), {'name': DEFAULT_PARTITION}).scalar()
+    stray = has_default and connection.execute(
+        text(f"SELECT 1 FROM {DEFAULT_PARTITION} WHERE {in_month} LIMIT 1"), bounds
+    ).first()
+
+    if stray:
+        connection.execute(text(f"ALTER TABLE {LOG_TABLE} DETACH PARTITION {DEFAULT_PARTITION}"))
+    connection.execute(text(
+        f"CREATE TABLE {name} PARTITION OF {LOG_TABLE} "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    ))
+    if stray:
+        connection.execute(text(f"INSERT INTO {name} SELECT * FROM {DEFAULT_PARTITION} WHERE {in_month}"), bounds)
+        connection.execute(text(f"DELETE FROM {DEFAULT_PARTITION} WHERE {in_month}"), bounds)
+        connection.execute(text(f"ALTER TABLE {LOG_TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+
+def _convert_to_partitioned(connection, current):
+    """Remplace log_activite par une table partitionnée (même colonnes, séquence et index)"""
+    legacy = f"{LOG_TABLE}_legacy"
+    sequence = connection.execute(text("SELECT pg_get_serial_sequence(:table, 'id')"), {'table': LOG_TABLE}).scalar()
+
+    connection.execute(text(f"ALTER TABLE {LOG_TABLE} RENAME TO {legacy}"))
+    if sequence:
+        connection.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY NONE"))
+    connection.execute(text(f"UPDATE {legacy} SET date_action = (now() AT TIME ZONE 'utc') WHERE date_action IS NULL"))
+
+    # La clé de partitionnement doit faire partie de la clé primaire : (id, date_action)
+    connection.execute(text(f"CREATE TABLE {LOG_TABLE} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE (date_action)"))
+    connection.execute(text(f"ALTER TABLE {LOG_TABLE} ALTER COLUMN date_action SET NOT NULL"))
+    connection.execute(text(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {LOG_TABLE} DEFAULT"))
+
+    oldest = connection.execute(text(f"SELECT MIN(date_action) FROM {legacy}")).scalar()
+    month = month_start(oldest) if oldest else current
+    while month <= current:
+        _create_partition(connection, month)
+        month = add_months(month, 1)
+
+    connection.execute(text(f"INSERT INTO {LOG_TABLE} SELECT * FROM {legacy}"))
+    connection.execute(text(f"DROP TABLE {legacy}"))
+
+    connection.execute(text(f"ALTER TABLE {LOG_TABLE} ADD PRIMARY KEY (id, date_action)"))
+    for column in ('action', 'date_action', 'utilisateur_id', 'courrier_id'):
+        connection.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{LOG_TABLE}_{column} ON {LOG_TABLE} ({column})"))
+    connection.execute(text(f'ALTER TABLE {LOG_TABLE} ADD FOREIGN KEY (utilisateur_id) REFERENCES "user" (id)'))
+    connection.execute(text(f"ALTER TABLE {LOG_TABLE} ADD FOREIGN KEY (courrier_id) REFERENCES courrier (id)"))
+    if sequence:
+        connection.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {LOG_TABLE}.id"))
+
+# ===== COMPACTION =====
+
+def compact_logs(engine, hot_months=None, today=None):
+    """Archive les mois antérieurs à l'horizon (hot_months mois avant le mois courant)
+
+    Retourne la liste des (mois, lignes archivées).
+    """
+    from models import LogActivite
+    from cache_utils import invalidate_tags
+
+    hot_months = LOG_HOT_MONTHS if hot_months is None else hot_months
+    cutoff = add_months(month_start(today or datetime.utcnow()), -hot_months)
+    table = LogActivite.__table__
+    with engine.connect() as connection:
+        oldest = connection.execute(
+            select(table.c.date_action).where(table.c.date_action < month_bounds(cutoff)[0])
+            .order_by(table.c.date_action).limit(1)
+        ).scalar()
+
+    archived = []
+    month = month_start(oldest) if oldest else cutoff
+    while month < cutoff:
+        count = archive_month(engine, month)
+        if count:
+            archived.append((month, count))
+        month = add_months(month, 1)
+
+    if archived:
+        invalidate_tags('LogActivite')
+    return archived
+
+def archive_month(engine, month):
+    """Écrit les lignes du mois dans son archive puis les retire de la table ; retourne leur nombre
+
+    L'archive est remplacée de façon atomique avant la suppression : après une interruption,
+    les lignes encore présentes en base sont ignorées au passage suivant (identifiants déjà archivés).
+    """
+    from models import LogActivite
+
+    table = LogActivite.__table__
+    start, end = month_bounds(month)
+    in_month = and_(table.c.date_action >= start, table.c.date_action < end)
+    path = archive_path(month)
+    os.makedirs(LOG_ARCHIVE_FOLDER, exist_ok=True)
+
+    with engine.begin() as connection:
+        rows = connection.execution_options(yield_per=ARCHIVE_BATCH).execute(
+            select(table).where(in_month).order_by(table.c.date_action, table.c.id)
+        )
+        count = _write_archive(path, rows)
+
+        if engine.dialect.name == 'postgresql':
+            name = partition_name(month)
+            if connection.execute(text("SELECT to_regclass(:name)"), {'name': name}).scalar():
+                connection.execute(text(f"ALTER TABLE {LOG_TABLE} DETACH PARTITION {name}"))
+                connection.execute(text(f"DROP TABLE {name}"))
+        # SQLite : la fenêtre glissante ; PostgreSQL : lignes restées dans la partition par défaut
+        connection.execute(table.delete().where(in_month))
+
+    if count:
+        logging.info(f"Journal des activités {month:%Y-%m} archivé: {count} ligne(s)")
+    return count
+
+def _write_archive(path, rows):
+    """Ajoute les lignes à l'archive du mois (réécrite via un fichier temporaire) ; retourne le nombre ajouté"""
+    temporary = f"{path}.{os.getpid()}.tmp"
+    archived_ids = set()
+    count = 0
+    with open(temporary, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as archive:
+            if os.path.exists(path):
+                with gzip.open(path, 'rb') as existing:
+                    for line in existing:
+                        archived_ids.add(json.loads(line)['id'])
+                        archive.write(line)
+            for row in rows:
+                if row.id in archived_ids:
+                    continue
+                archive.write(_encode_row(row))
+                count += 1
+        raw.flush()
+        os.fsync(raw.fileno())
+
+    if count:
+        os.replace(temporary, path)
+    else:
+        os.remove(temporary)
+    return count
+
+def _encode_row(row):
+    values = {column: getattr(row, column) for column in ARCHIVE_COLUMNS}
+    if values['date_action'] is not None:
+        values['date_action'] = values['date_action'].isoformat()
+    return (json.dumps(values, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+
+def run_log_compaction(engine, hot_months=None):
+    """Compaction protégée par un verrou fichier (un seul processus à la fois) ; None si déjà en cours"""
+    os.makedirs(LOG_ARCHIVE_FOLDER, exist_ok=True)
+    lock_path = os.path.join(LOG_ARCHIVE_FOLDER, '.compaction.lock')
+    if not _acquire_lock(lock_path):
+        return None
+    try:
+        ensure_log_partitions(engine)
+        return compact_logs(engine, hot_months)
+    finally:
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+
+def _acquire_lock(lock_path):
+    for _ in range(2):
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            os.write(fd, str(os.getpid()).encode())
+            os.close(fd)
+            return True
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) < LOCK_STALE_SECONDS:
+                    return False
+                os.remove(lock_path)
+            except OSError:
+                return False
+    return False
+
+def start_log_compaction(app, interval_hours=LOG_COMPACTION_INTERVAL_HOURS):
+    """Compaction périodique dans un thread du processus (interval_hours=0 : désactivée, voir compact_logs.py)"""
+    if interval_hours <= 0:
+        return None
+
+    def run():
+        from app import db
+        time.sleep(COMPACTION_START_DELAY)
+        while True:
+            try:
+                with app.app_context():
+                    archived = run_log_compaction(db.engine)
+                if archived:
+                    logging.info(f"Compaction du journal des activités: {len(archived)} mois archivé(s)")
+            except Exception as e:
+                logging.error(f"Compaction du journal des activités impossible: {e}")
+            time.sleep(interval_hours * 3600)
+
+    thread = threading.Thread(target=run, name='log-compaction', daemon=True)
+    thread.start()
+    return thread
+
+# ===== LECTURE DES ARCHIVES =====
+
+def archive_path(month):
+    return os.path.join(LOG_ARCHIVE_FOLDER, f"{LOG_TABLE}_{month.year:04d}-{month.month:02d}.ndjson.gz")
+
+def archived_months():
+    """Mois disponibles en archive, du plus récent au plus ancien"""
+    try:
+        names = os.listdir(LOG_ARCHIVE_FOLDER)
+    except OSError:
+        return []
+    months = []
+    for name in names:
+        match = ARCHIVE_PATTERN.match(name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months, reverse=True)
+
+class _UnknownUser:
+    """Auteur d'une entrée archivée dont le compte a été supprimé"""
+
+    def __init__(self, user_id):
+        self.id = user_id
+        self.username = f"#{user_id}"
+        self.nom_complet = f"Utilisateur #{user_id}"
+        self.role = None
+
+class ArchivedLog:
+    """Entrée d'archive présentée comme un LogActivite (journal des activités, export PDF)"""
+    __slots__ = ('id', 'action', 'description', 'date_action', 'ip_address', 'utilisateur_id',
+                 'courrier_id', 'utilisateur')
+
+    def __init__(self, values, utilisateur):
+        self.id = values['id']
+        self.action = values['action']
+        self.description = values.get('description')
+        self.date_action = datetime.fromisoformat(values['date_action']) if values.get('date_action') else None
+        self.ip_address = values.get('ip_address')
+        self.utilisateur_id = values.get('utilisateur_id')
+        self.courrier_id = values.get('courrier_id')
+        self.utilisateur = utilisateur
+
+    @property
+    def courrier(self):
+        if not self.courrier_id:
+            return None
+        from models import Courrier
+        from app import db
+        return db.session.get(Courrier, self.courrier_id)
+
+ARCHIVE_CURSOR = 'journal+archives'   # signature des curseurs (date_action, id) du journal avec archives
+ARCHIVE_COUNT_TTL = 600                 # total des archives par filtres, recalculé si une archive change
+
+_archive_counts = create_cache('comptages_archives', max_entries=200, default_ttl=ARCHIVE_COUNT_TTL)
+
+class ArchivePagination:
+    """Page du journal avec archives (mêmes attributs que KeysetPagination), curseur (date_action, id)"""
+
+    def __init__(self, items, per_page, next_cursor, prev_cursor, count_loader):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.has_next = next_cursor is not None
+        self.has_prev = prev_cursor is not None
+        self.total_estimated = False
+        self._count_loader = count_loader
+        self._total = None
+
+    @property
+    def total(self):
+        """Nombre total de résultats, calculé uniquement si le gabarit l'affiche"""
+        if self._total is None:
+            self._total = self._count_loader()
+        return self._total
+
+class _ArchiveFilters:
+    """Filtres du journal appliqués aux entrées d'archive (dictionnaires NDJSON)"""
+
+    def __init__(self, search, action, user_id, date_from, date_to):
+        from models import User
+        from app import db
+
+        self.action = action or None
+        self.user_id = int(user_id) if user_id else None
+        self.date_from = date_from
+        self.date_to = date_to
+        self.needle = search.lower() if search else None
+        self.matching_users = set()
+        if self.needle:
+            # Auteurs dont le nom correspond : une requête filtrée, pas le chargement de tous les comptes
+            self.matching_users = {user_id for (user_id,) in db.session.query(User.id).filter(db.or_(
+                db.func.lower(User.username).contains(self.needle, autoescape=True),
+                db.func.lower(User.nom_complet).contains(self.needle, autoescape=True),
+            ))}
+        self.first_month = month_start(date_from) if date_from else None
+        self.last_month = month_start(date_to) if date_to else None
+
+    def signature(self):
+        return (self.action, self.user_id, self.date_from, self.date_to, self.needle)
+
+    def months(self, before=None, after=None, newest_first=True):
+        """Mois archivés couverts par les filtres, bornés par le mois du curseur"""
+        months = [month for month in archived_months()
+                  if not (self.first_month and month < self.first_month)
+                  and not (self.last_month and month > self.last_month)
+                  and not (before and month > before) and not (after and month < after)]
+        return months if newest_first else months[::-1]
+
+    def matches(self, values):
+        if self.action and values['action'] != self.action:
+            return False
+        if self.user_id and values.get('utilisateur_id') != self.user_id:
+            return False
+        if self.date_from or self.date_to:
+            moment = _archive_moment(values)
+            if moment is None or (self.date_from and moment < self.date_from) \
+                    or (self.date_to and moment > self.date_to):
+                return False
+        if self.needle and values.get('utilisateur_id') not in self.matching_users \
+                and self.needle not in (values['action'] or '').lower() \
+                and self.needle not in (values.get('description') or '').lower():
+            return False
+        return True
+
+def _archive_moment(values):
+    return datetime.fromisoformat(values['date_action']) if values.get('date_action') else None
+
+def _archive_key(values):
+    return (_archive_moment(values) or datetime.min, values['id'])
+
+def _read_archive(month, filters):
+    with gzip.open(archive_path(month), 'rt', encoding='utf-8') as archive:
+        for line in archive:
+            values = json.loads(line)
+            if filters.matches(values):
+                yield values
+
+def _scan_archives(filters, key, newest_first, limit):
+    """Au plus limit entrées d'archive au-delà de key dans le sens demandé
+
+    Les mois sont lus un à un depuis celui du curseur : seuls les mois qui contiennent
+    la page sont décompressés, quelle que soit sa profondeur.
+    """
+    key_month = month_start(key[0]) if key and key[0] != datetime.min else None
+    if newest_first:
+        months = filters.months(before=key_month)
+    else:
+        months = filters.months(after=key_month, newest_first=False)
+    found = []
+    for month in months:
+        entries = [values for values in _read_archive(month, filters)
+                   if key is None or (_archive_key(values) < key if newest_first else _archive_key(values) > key)]
+        entries.sort(key=_archive_key, reverse=newest_first)
+        found.extend(entries[:limit - len(found)])
+        if len(found) >= limit:
+            break
+    return found
+
+def _count_archives(filters):
+    """Total des entrées d'archive filtrées, mis en cache tant qu'aucune archive ne change"""
+    months = filters.months()
+    versions = []
+    for month in months:
+        try:
+            versions.append((month.isoformat(), os.path.getmtime(archive_path(month))))
+        except OSError:
+            continue
+    key = repr((filters.signature(), versions))
+    return _archive_counts.get_or_load(
+        key, lambda: sum(sum(1 for _ in _read_archive(month, filters)) for month in months)
+    )
+
+def search_archived_logs(search='', action=None, user_id=None, date_from=None, date_to=None,
+                         per_page=50, cursor=None, live_query=None):
+    """Journal des activités avec archives, les plus récentes d'abord
+
+    live_query (requête LogActivite déjà filtrée) fournit les entrées encore en base : les mois
+    archivés étant tous antérieurs, elles précèdent les archives dans une même pagination par clé
+    (date_action, id). La recherche textuelle porte, comme en base, sur l'action, la description
+    et l'auteur ; seuls les auteurs des entrées affichées sont chargés.
+    """
+    from models import User, LogActivite
+    from app import db
+    from performance_utils import encode_cursor, decode_cursor, cached_count
+
+    filters = _ArchiveFilters(search, action, user_id, date_from, date_to)
+    state = decode_cursor(cursor, ARCHIVE_CURSOR)
+    direction, key = 'n', None
+    if state is not None and len(state[1]) == 2 and isinstance(state[1][0], datetime):
+        direction, key = state[0], (state[1][0], state[1][1])
+    newest_first = direction == 'n'
+    limit = per_page + 1
+
+    live = []
+    if live_query is not None:
+        ordering = [LogActivite.date_action.desc(), LogActivite.id.desc()] if newest_first \
+            else [LogActivite.date_action.asc(), LogActivite.id.asc()]
+        query = live_query.order_by(None)
+        if key is not None:
+            moment, last_id = key
+            if newest_first:
+                query = query.filter(db.or_(LogActivite.date_action < moment,
+                                            and_(LogActivite.date_action == moment, LogActivite.id < last_id)))
+            else:
+                query = query.filter(db.or_(LogActivite.date_action > moment,
+                                            and_(LogActivite.date_action == moment, LogActivite.id > last_id)))
+        live = query.order_by(*ordering).limit(limit).all()
+
+    # Les archives sont plus anciennes que la base : lues après elle vers le passé, avant elle vers le présent
+    if newest_first:
+        archived = _scan_archives(filters, key, True, limit - len(live)) if len(live) < limit else []
+    else:
+        archived = _scan_archives(filters, key, False, limit)
+        live = live[:max(limit - len(archived), 0)]
+
+    user_ids = {values.get('utilisateur_id') for values in archived if values.get('utilisateur_id')}
+    users = {user.id: user for user in User.query.filter(User.id.in_(user_ids))} if user_ids else {}
+    archived = [ArchivedLog(values, users.get(values.get('utilisateur_id'))
+                            or _UnknownUser(values.get('utilisateur_id'))) for values in archived]
+
+    items = live + archived if newest_first else archived + live
+    more = len(items) > per_page
+    items = items[:per_page]
+    if not newest_first:
+        items.reverse()
+
+    has_next = more if newest_first else key is not None
+    has_prev = key is not None if newest_first else more
+    next_cursor = encode_cursor('n', ARCHIVE_CURSOR, [items[-1].date_action or datetime.min, items[-1].id]) \
+        if has_next and items else None
+    prev_cursor = encode_cursor('p', ARCHIVE_CURSOR, [items[0].date_action or datetime.min, items[0].id]) \
+        if has_prev and items else None
+
+    def count():
+        return (cached_count(live_query) if live_query is not None else 0) + _count_archives(filters)
+
+    return ArchivePagination(items, per_page, next_cursor, prev_cursor, count)
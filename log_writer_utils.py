@@ -0,0 +1,218 @@
+"""
+Écriture asynchrone des journaux (LogActivite, CourrierModification)
+Les lignes sont mises en file pendant la requête puis insérées par lots par un thread
+d'arrière-plan, toutes les LOG_FLUSH_INTERVAL_MS millisecondes ou dès LOG_BATCH_SIZE lignes,
+sur sa propre connexion : la requête ne paie plus de commit pour ses journaux.
+La file est bornée : quand elle est pleine, l'appelant attend jusqu'à QUEUE_WAIT secondes
+puis écrit sa ligne lui-même. Elle est vidée à l'arrêt du processus (atexit).
+"""
+import os
+import queue
+import atexit
+import logging
+import threading
+import time
+from datetime import datetime
+
+LOG_BATCH_SIZE = int(os.environ.get('LOG_BATCH_SIZE', 200))
+LOG_FLUSH_INTERVAL_MS = int(os.environ.get('LOG_FLUSH_INTERVAL_MS', 250))
+LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))
+QUEUE_WAIT = 0.5       # secondes d'attente d'une place dans la file pleine
+CLOSE_TIMEOUT = 10.0   # secondes accordées au vidage de la file à l'arrêt
+
+# Colonne d'horodatage de chaque modèle journalisé, fixée à la mise en file
+TIMESTAMP_COLUMNS = {
+    'LogActivite': 'date_action',
+    'CourrierModification': 'date_modification',
+}
+
+_STOP = object()
+
+class _FlushRequest:
+    """Marqueur placé dans la file : signalé quand les lignes qui le précèdent sont écrites"""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+class LogWriter:
+    """File bornée de lignes de journal et thread d'insertion par lots"""
+
+    def __init__(self, batch_size=LOG_BATCH_SIZE, flush_interval_ms=LOG_FLUSH_INTERVAL_MS,
+                 max_queue=LOG_QUEUE_SIZE):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._app = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._counters = {'queued': 0, 'written': 0, 'batches': 0, 'direct_writes': 0,
+                          'errors': 0, 'max_depth': 0}
+
+    def init_app(self, app):
+        """Associe l'application (contexte du thread d'écriture) et vide la file à l'arrêt"""
+        self._app = app
+        atexit.register(self.close)
+
+    def write(self, model_name, values):
+        """Met une ligne en file ; écriture directe si le writer n'est pas actif ou la file pleine"""
+        values = dict(values)
+        values.setdefault(TIMESTAMP_COLUMNS[model_name], datetime.utcnow())
+        item = (model_name, values)
+
+        if self._app is None or not self._ensure_thread():
+            self._write_direct([item])
+            return
+        try:
+            self._queue.put(item, timeout=QUEUE_WAIT)
+        except queue.Full:
+            # Contre-pression : le thread d'écriture ne suit pas, l'appelant écrit lui-même
+            logging.warning("File des journaux pleine : écriture directe")
+            self._write_direct([item])
+            return
+        with self._lock:
+            self._counters['queued'] += 1
+            self._counters['max_depth'] = max(self._counters['max_depth'], self._queue.qsize())
+
+    def flush(self, timeout=CLOSE_TIMEOUT):
+        """Attend que les lignes déjà en file soient écrites ; False si le délai est dépassé"""
+        if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+            return True
+        marker = _FlushRequest()
+        try:
+            self._queue.put(marker, timeout=timeout)
+        except queue.Full:
+            return False
+        return marker.done.wait(timeout)
+
+    def close(self):
+        """Arrête le thread et écrit les lignes restantes"""
+        thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            try:
+                self._queue.put(_STOP, timeout=CLOSE_TIMEOUT)
+                thread.join(CLOSE_TIMEOUT)
+            except queue.Full:
+                logging.error("Arrêt du writer des journaux : file toujours pleine")
+        self._thread = None
+
+        remaining = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, tuple):
+                remaining.append(item)
+        if remaining:
+            self._write_direct(remaining)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+        stats['depth'] = self._queue.qsize()
+        stats['running'] = self._thread is not None and self._thread.is_alive()
+        return stats
+
+    def _ensure_thread(self):
+        """Démarre le thread au premier usage dans ce processus (y compris après un fork)"""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return True
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return True
+            if self._pid is not None and self._pid != os.getpid():
+                # Processus fils : la file héritée appartient au parent
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            try:
+                thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+                thread.start()
+            except RuntimeError as e:  # arrêt de l'interpréteur en cours
+                logging.warning(f"Thread d'écriture des journaux non démarré: {e}")
+                return False
+            self._thread = thread
+            self._pid = os.getpid()
+            return True
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            batch, markers, stop = [], [], False
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    stop = True
+                    break
+                if isinstance(item, _FlushRequest):
+                    markers.append(item)
+                    break
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._write_batch(batch)
+            for marker in markers:
+                marker.done.set()
+            if stop:
+                return
+
+    def _write_direct(self, items):
+        with self._lock:
+            self._counters['direct_writes'] += len(items)
+        self._write_batch(items)
+
+    def _write_batch(self, items):
+        """Insère les lignes groupées par table (executemany), ligne par ligne en cas d'échec"""
+        try:
+            self._insert(items)
+        except Exception as e:
+            logging.error(f"Écriture groupée de {len(items)} journaux impossible: {e}")
+            for item in items:
+                try:
+                    self._insert([item])
+                except Exception as item_error:
+                    with self._lock:
+                        self._counters['errors'] += 1
+                    logging.error(f"Journal {item[0]} perdu: {item_error} ({item[1]})")
+
+    def _insert(self, items):
+        if self._app is not None:
+            with self._app.app_context():
+                self._insert_rows(items)
+        else:
+            self._insert_rows(items)
+
+    def _insert_rows(self, items):
+        import models
+        from app import db
+        from cache_utils import invalidate_tags
+
+        rows_by_model = {}
+        for model_name, values in items:
+            rows_by_model.setdefault(model_name, []).append(values)
+        with db.engine.begin() as connection:
+            for model_name, rows in rows_by_model.items():
+                connection.execute(getattr(models, model_name).__table__.insert(), rows)
+        invalidate_tags(*rows_by_model)
+
+        with self._lock:
+            self._counters['written'] += len(items)
+            self._counters['batches'] += 1
+
+log_writer = LogWriter()
+
+def queue_log(model_name, **values):
+    """Journalise une ligne de LogActivite ou CourrierModification sans commit dans la requête"""
+    log_writer.write(model_name, values)
+
+def get_log_writer_stats():
+    """Lignes en file, écrites, lots, écritures directes (file pleine) et erreurs"""
+    return log_writer.stats()
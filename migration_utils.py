@@ -60,6 +60,84 @@ def create_table_safely(engine, table_name, create_sql):
         logging.error(f"Erreur lors de la création de la table {table_name}: {e}")
         return False
 
+def check_index_exists(engine, table_name, index_name):
+    """Vérifie si un index existe sur une table"""
+    try:
+        inspector = inspect(engine)
+        indexes = [idx['name'] for idx in inspector.get_indexes(table_name)]
+        return index_name in indexes
+    except Exception as e:
+        logging.warning(f"Impossible de vérifier l'index {index_name} sur {table_name}: {e}")
+        return False
+
+def create_index_safely(engine, table_name, index_name, columns):
+    """Crée un index de manière sécurisée s'il n'existe pas"""
+    try:
+        if not check_index_exists(engine, table_name, index_name):
+            sql = f"CREATE INDEX {index_name} ON {table_name} ({', '.join(columns)})"
+            logging.info(f"Création de l'index {index_name} sur {table_name}")
+            with engine.connect() as connection:
+                connection.execute(text(sql))
+                connection.commit()
+            return True
+        else:
+            logging.debug(f"Index {index_name} existe déjà sur {table_name}")
+            return False
+    except Exception as e:
+        logging.error(f"Erreur lors de la création de l'index {index_name}: {e}")
+        return False
+
+def courrier_owner_departement_missing(engine):
+    """Indique s'il reste des courriers sans owner_departement_id dont l'auteur a un département"""
+    try:
+        with engine.connect() as connection:
+            row = connection.execute(text("""
+                SELECT 1 FROM courrier
+                JOIN "user" u ON u.id = courrier.utilisateur_id
+                WHERE courrier.owner_departement_id IS NULL AND u.departement_id IS NOT NULL
+                LIMIT 1
+            """)).fetchone()
+        return row is not None
+    except Exception as e:
+        logging.error(f"Erreur lors de la vérification de owner_departement_id: {e}")
+        return False
+
+def backfill_courrier_owner_departement(engine, batch_size=1000):
+    """Renseigne courrier.owner_departement_id par lots d'identifiants
+    
+    Chaque lot est validé séparément pour ne pas verrouiller la table
+    pendant toute la durée du remplissage.
+    """
+    try:
+        with engine.connect() as connection:
+            bounds = connection.execute(text("SELECT MIN(id), MAX(id) FROM courrier")).fetchone()
+        
+        if not bounds or bounds[0] is None:
+            return 0
+        
+        min_id, max_id = bounds
+        updated = 0
+        sql = text("""
+            UPDATE courrier
+            SET owner_departement_id = (
+                SELECT u.departement_id FROM "user" u WHERE u.id = courrier.utilisateur_id
+            )
+            WHERE id BETWEEN :start_id AND :end_id
+              AND owner_departement_id IS NULL
+        """)
+        
+        for start_id in range(min_id, max_id + 1, batch_size):
+            with engine.connect() as connection:
+                result = connection.execute(sql, {"start_id": start_id, "end_id": start_id + batch_size - 1})
+                connection.commit()
+                updated += max(result.rowcount or 0, 0)
+        
+        logging.info(f"owner_departement_id renseigné pour {updated} courrier(s)")
+        return updated
+    except Exception as e:
+        logging.error(f"Erreur lors du remplissage de owner_departement_id: {e}")
+        return 0
+
 def run_automatic_migrations(app, db):
     """
     Exécute toutes les migrations automatiques nécessaires
@@ -136,6 +214,7 @@ def run_automatic_migrations(app, db):
             ('parametres_systeme', 'email_provider', 'VARCHAR(20) DEFAULT \'sendgrid\''),
             ('parametres_systeme', 'notify_superadmin_new_mail', 'BOOLEAN DEFAULT 1'),
             ('parametres_systeme', 'titre_responsable_structure', 'VARCHAR(100) DEFAULT \'Secrétaire Général\''),
+            ('parametres_systeme', 'cache_version', 'INTEGER NOT NULL DEFAULT 1'),
         ]
         
         for table, column, definition in critical_columns:
@@ -148,6 +227,7 @@ def run_automatic_migrations(app, db):
             ('courrier_forward', 'attached_file', 'VARCHAR(255)'),
             ('courrier_forward', 'attached_file_original_name', 'VARCHAR(255)'),
             ('courrier_forward', 'attached_file_size', 'INTEGER'),
+            ('courrier_forward', 'attached_file_checksum', 'VARCHAR(64)'),
         ]
         
         for table, column, definition in forward_attachment_columns:
@@ -155,6 +235,22 @@ def run_automatic_migrations(app, db):
                 migrations_applied += 1
                 logging.info(f"✓ Migration: Colonne de pièce jointe {column} ajoutée à {table}")
         
+        # Migration 5: Département propriétaire dénormalisé pour le filtrage d'accès aux courriers
+        if add_column_safely(engine, 'courrier', 'owner_departement_id', 'INTEGER REFERENCES departement(id)'):
+            migrations_applied += 1
+            logging.info("✓ Migration: Colonne owner_departement_id ajoutée")
+        
+        # Remplissage repris tant qu'il reste des courriers à compléter (démarrage interrompu, ajout hors application)
+        if courrier_owner_departement_missing(engine):
+            migrations_applied += 1
+            backfill_courrier_owner_departement(engine)
+            logging.info("✓ Migration: Colonne owner_departement_id remplie")
+        
+        if create_index_safely(engine, 'courrier', 'ix_courrier_acces_departement',
+                               ['is_deleted', 'owner_departement_id', 'date_enregistrement']):
+            migrations_applied += 1
+            logging.info("✓ Migration: Index ix_courrier_acces_departement créé")
+        
         if migrations_applied > 0:
             logging.info(f"🔄 {migrations_applied} migration(s) automatique(s) appliquée(s) avec succès")
             # Commit les changements
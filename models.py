@@ -1,10 +1,19 @@
 from app import db
+from flask import g, has_request_context
 from flask_login import UserMixin
 from datetime import datetime, timedelta
 import uuid
 import os
 import logging
+import time
+import threading
+from sqlalchemy import event, select, update, inspect as sa_inspect
+from sqlalchemy.orm import Session
 from encryption_utils import encryption_manager, encrypt_sensitive_data, decrypt_sensitive_data
+from search_utils import SUGGESTION_FIELDS, build_suggestion_rows
+from stats_utils import STATS_ATTRIBUTES, courrier_stats_contribution, add_contribution, apply_stats_deltas
+from cache_utils import invalidate_tags
+from ip_index_utils import ip_access_index, parse_network
 import os
 
 class Departement(db.Model):
@@ -165,10 +174,10 @@ class User(UserMixin, db.Model):
         if self.role == 'super_admin':
             return True
             
-        # Obtenir le rôle de l'utilisateur
-        role = Role.query.filter_by(nom=self.role).first()
-        if role:
-            return role.has_permission(permission)
+        # Obtenir les permissions du rôle depuis la matrice compilée (sans requête SQL)
+        role_permissions = Role.get_permission_matrix().get(self.role)
+        if role_permissions is not None:
+            return permission in role_permissions
         
         # Fallback sur l'ancien système si pas de rôle en base
         permissions = {
@@ -446,6 +455,14 @@ class Courrier(db.Model):
     modifie_par = db.relationship('User', foreign_keys=[modifie_par_id], backref='courriers_modifies')
     deleted_by = db.relationship('User', foreign_keys=[deleted_by_id], backref='courriers_deleted')
     
+    # Département de l'utilisateur ayant enregistré le courrier (dénormalisé pour le
+    # filtrage d'accès, maintenu par les événements before_insert/after_update ci-dessous)
+    owner_departement_id = db.Column(db.Integer, db.ForeignKey('departement.id'), nullable=True)
+    
+    __table_args__ = (
+        db.Index('ix_courrier_acces_departement', 'is_deleted', 'owner_departement_id', 'date_enregistrement'),
+    )
+    
     def __repr__(self):
         return f'<Courrier {self.numero_accuse_reception}>'
     
@@ -571,6 +588,148 @@ class Courrier(db.Model):
             logging.error(f"Erreur lors de la vérification de l'intégrité: {e}")
             return False
 
+@event.listens_for(Courrier, 'before_insert')
+@event.listens_for(Courrier, 'before_update')
+def _sync_courrier_owner_departement(mapper, connection, target):
+    """Renseigne owner_departement_id depuis le département du créateur"""
+    if target.utilisateur_id is None:
+        return
+    
+    utilisateur_changed = sa_inspect(target).attrs.utilisateur_id.history.has_changes()
+    if target.owner_departement_id is None or utilisateur_changed:
+        target.owner_departement_id = connection.execute(
+            select(User.departement_id).where(User.id == target.utilisateur_id)
+        ).scalar()
+
+@event.listens_for(User, 'after_update')
+def _propagate_user_departement(mapper, connection, target):
+    """Répercute un changement de département sur les courriers de l'utilisateur"""
+    if not sa_inspect(target).attrs.departement_id.history.has_changes():
+        return
+    
+    courrier_table = Courrier.__table__
+    
+    # Déplacer les statistiques agrégées de ses courriers vers le nouveau département
+    deltas = {}
+    rows = connection.execute(
+        select(*[courrier_table.c[name] for name in STATS_ATTRIBUTES])
+        .where(courrier_table.c.utilisateur_id == target.id, courrier_table.c.is_deleted == False)
+    ).fetchall()
+    for row in rows:
+        values = dict(zip(STATS_ATTRIBUTES, row))
+        add_contribution(deltas, courrier_stats_contribution(values), -1)
+        values['owner_departement_id'] = target.departement_id
+        add_contribution(deltas, courrier_stats_contribution(values), 1)
+    apply_stats_deltas(connection, deltas)
+    
+    connection.execute(
+        courrier_table.update()
+        .where(courrier_table.c.utilisateur_id == target.id)
+        .values(owner_departement_id=target.departement_id)
+    )
+    _tag_session(sa_inspect(target).session, 'Courrier')
+
+class CourrierSuggestion(db.Model):
+    """Index de préfixes pour l'autocomplétion de la recherche"""
+    __tablename__ = 'courrier_suggestion'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    cle = db.Column(db.String(120), nullable=False)  # Clé normalisée (minuscules, sans accents)
+    terme = db.Column(db.String(200), nullable=False)  # Valeur affichée
+    type_terme = db.Column(db.String(20), nullable=False)  # accuse, reference, objet, contact
+    courrier_id = db.Column(db.Integer, db.ForeignKey('courrier.id'), nullable=False, index=True)
+    
+    __table_args__ = (
+        db.Index('ix_courrier_suggestion_cle', 'cle', postgresql_ops={'cle': 'varchar_pattern_ops'}),
+    )
+    
+    def __repr__(self):
+        return f'<CourrierSuggestion {self.cle}>'
+
+def _insert_courrier_suggestions(connection, target):
+    """Insère les entrées de suggestion d'un courrier"""
+    values = {field: getattr(target, field) for field, _ in SUGGESTION_FIELDS}
+    rows = build_suggestion_rows(target.id, values)
+    if rows:
+        connection.execute(CourrierSuggestion.__table__.insert(), rows)
+
+@event.listens_for(Courrier, 'after_insert')
+def _index_new_courrier_suggestions(mapper, connection, target):
+    _insert_courrier_suggestions(connection, target)
+
+@event.listens_for(Courrier, 'after_update')
+def _reindex_courrier_suggestions(mapper, connection, target):
+    """Met à jour les suggestions uniquement si un champ indexé a changé"""
+    attrs = sa_inspect(target).attrs
+    if not any(attrs[field].history.has_changes() for field, _ in SUGGESTION_FIELDS):
+        return
+    
+    suggestion_table = CourrierSuggestion.__table__
+    connection.execute(suggestion_table.delete().where(suggestion_table.c.courrier_id == target.id))
+    _insert_courrier_suggestions(connection, target)
+
+@event.listens_for(Courrier, 'before_delete')
+def _remove_courrier_suggestions(mapper, connection, target):
+    suggestion_table = CourrierSuggestion.__table__
+    connection.execute(suggestion_table.delete().where(suggestion_table.c.courrier_id == target.id))
+
+class CourrierDailyStats(db.Model):
+    """Statistiques quotidiennes agrégées des courriers non supprimés"""
+    __tablename__ = 'courrier_daily_stats'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    jour = db.Column(db.Date, nullable=False)  # Jour d'enregistrement
+    type_courrier = db.Column(db.String(20), nullable=False)
+    statut = db.Column(db.String(50), nullable=False)
+    departement_id = db.Column(db.Integer, nullable=False, default=0)  # 0 = aucun département
+    type_courrier_sortant_id = db.Column(db.Integer, nullable=False, default=0)  # 0 = non précisé
+    nombre = db.Column(db.Integer, nullable=False, default=0)
+    delai_total_jours = db.Column(db.Integer, nullable=False, default=0)  # Somme rédaction -> enregistrement
+    
+    __table_args__ = (
+        db.UniqueConstraint('jour', 'type_courrier', 'statut', 'departement_id', 'type_courrier_sortant_id',
+                            name='uq_courrier_daily_stats_cle'),
+    )
+    
+    def __repr__(self):
+        return f'<CourrierDailyStats {self.jour} {self.type_courrier} {self.statut}: {self.nombre}>'
+
+def _courrier_stats_values(target, previous=False):
+    """Valeurs des attributs statistiques du courrier, avant modification si previous"""
+    attrs = sa_inspect(target).attrs
+    values = {}
+    for name in STATS_ATTRIBUTES:
+        history = attrs[name].history
+        if previous and history.deleted:
+            values[name] = history.deleted[0]
+        else:
+            values[name] = getattr(target, name)
+    return values
+
+@event.listens_for(Courrier, 'after_insert')
+def _count_new_courrier(mapper, connection, target):
+    deltas = {}
+    add_contribution(deltas, courrier_stats_contribution(_courrier_stats_values(target)), 1)
+    apply_stats_deltas(connection, deltas)
+
+@event.listens_for(Courrier, 'after_update')
+def _recount_updated_courrier(mapper, connection, target):
+    """Changement de statut, de date, de type, suppression ou restauration"""
+    attrs = sa_inspect(target).attrs
+    if not any(attrs[name].history.has_changes() for name in STATS_ATTRIBUTES):
+        return
+    
+    deltas = {}
+    add_contribution(deltas, courrier_stats_contribution(_courrier_stats_values(target, previous=True)), -1)
+    add_contribution(deltas, courrier_stats_contribution(_courrier_stats_values(target)), 1)
+    apply_stats_deltas(connection, deltas)
+
+@event.listens_for(Courrier, 'after_delete')
+def _uncount_deleted_courrier(mapper, connection, target):
+    deltas = {}
+    add_contribution(deltas, courrier_stats_contribution(_courrier_stats_values(target, previous=True)), -1)
+    apply_stats_deltas(connection, deltas)
+
 class CourrierModification(db.Model):
     """Historique des modifications des courriers"""
     __tablename__ = 'courrier_modification'
@@ -708,9 +867,15 @@ class IPWhitelist(db.Model):
     
     @staticmethod
     def add_to_whitelist(ip_address, description="", created_by="system"):
-        """Add an IP to the whitelist"""
+        """Add an IP or a CIDR range (e.g. 10.0.0.0/24) to the whitelist"""
         from app import db
         
+        # Normalize CIDR ranges (10.0.0.7/24 -> 10.0.0.0/24)
+        if '/' in ip_address:
+            network = parse_network(ip_address)
+            if network is not None:
+                ip_address = str(network)
+        
         # Check if already exists
         existing = IPWhitelist.query.filter_by(ip_address=ip_address).first()
         if existing:
@@ -749,6 +914,29 @@ class IPWhitelist(db.Model):
     def __repr__(self):
         return f'<IPWhitelist {self.ip_address}>'
 
+class SecurityListVersion(db.Model):
+    """Version des listes d'IP bloquées et autorisées, incrémentée à chaque modification validée
+    pour que chaque worker recharge son index en mémoire (ip_index_utils)"""
+    __tablename__ = 'security_list_version'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    @staticmethod
+    def current():
+        """Version courante (0 si les listes n'ont jamais été modifiées)"""
+        return db.session.query(SecurityListVersion.version).filter_by(id=1).scalar() or 0
+    
+    @staticmethod
+    def bump(session):
+        """Incrémente la version dans la transaction en cours"""
+        result = session.execute(
+            update(SecurityListVersion).where(SecurityListVersion.id == 1)
+            .values(version=SecurityListVersion.version + 1)
+        )
+        if result.rowcount == 0:
+            session.add(SecurityListVersion(id=1, version=1))
+
 class ParametresSysteme(db.Model):
     """Paramètres de configuration du système"""
     id = db.Column(db.Integer, primary_key=True)
@@ -798,10 +986,19 @@ class ParametresSysteme(db.Model):
     
     date_modification = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Version du cache des paramètres : incrémentée à chaque sauvegarde pour que
+    # tous les workers rechargent leur copie en mémoire
+    cache_version = db.Column(db.Integer, nullable=False, default=1)
+    
     # Clé étrangère pour tracer qui a modifié
     modifie_par_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     modifie_par = db.relationship('User', backref='parametres_modifies')
     
+    # Copie en lecture seule des paramètres, partagée par le processus
+    _cache_lock = threading.Lock()
+    _cached_snapshot = None
+    _cached_version = None
+    
     def __repr__(self):
         return f'<ParametresSysteme {self.nom_logiciel}>'
     
@@ -840,8 +1037,28 @@ class ParametresSysteme(db.Model):
         return self.sendgrid_api_key if self.sendgrid_api_key else None
     
     @staticmethod
-    def get_parametres():
-        """Récupère les paramètres système ou crée des valeurs par défaut"""
+    def get_parametres(for_update=False):
+        """Récupère les paramètres système ou crée des valeurs par défaut
+        
+        Par défaut, retourne une copie en lecture seule mise en cache dans le processus
+        et rechargée uniquement quand cache_version change. La version n'est vérifiée
+        qu'une fois par requête. Utiliser for_update=True pour obtenir une instance
+        attachée à la session afin de la modifier.
+        """
+        if for_update:
+            return ParametresSysteme._load_parametres()
+        
+        if has_request_context() and '_parametres_snapshot' in g:
+            return g._parametres_snapshot
+        
+        snapshot = ParametresSysteme._get_cached_snapshot()
+        if has_request_context():
+            g._parametres_snapshot = snapshot
+        return snapshot
+    
+    @staticmethod
+    def _load_parametres():
+        """Charge (ou initialise) la ligne des paramètres depuis la base"""
         parametres = ParametresSysteme.query.first()
         if not parametres:
             parametres = ParametresSysteme()
@@ -859,6 +1076,53 @@ class ParametresSysteme(db.Model):
             db.session.commit()
         return parametres
     
+    @staticmethod
+    def _get_cached_snapshot():
+        """Retourne la copie en cache, rechargée si la version en base a changé"""
+        try:
+            version = db.session.query(ParametresSysteme.cache_version).order_by(ParametresSysteme.id).limit(1).scalar()
+        except Exception as e:
+            logging.warning(f"Impossible de lire la version des paramètres: {e}")
+            db.session.rollback()
+            return ParametresSysteme._load_parametres()
+        
+        cls = ParametresSysteme
+        snapshot = cls._cached_snapshot
+        if snapshot is not None and version is not None and version == cls._cached_version:
+            return snapshot
+        
+        with cls._cache_lock:
+            if cls._cached_snapshot is not None and version is not None and version == cls._cached_version:
+                return cls._cached_snapshot
+            
+            parametres = cls._load_parametres()
+            snapshot = parametres._make_snapshot()
+            # Ne pas mettre en cache des modifications non encore validées
+            if parametres not in db.session.dirty:
+                cls._cached_snapshot = snapshot
+                cls._cached_version = parametres.cache_version
+            return snapshot
+    
+    def _make_snapshot(self):
+        """Copie les colonnes dans une instance hors session (lecture seule)"""
+        snapshot = ParametresSysteme()
+        for attr in sa_inspect(ParametresSysteme).column_attrs:
+            setattr(snapshot, attr.key, getattr(self, attr.key))
+        return snapshot
+    
+    @staticmethod
+    def invalidate_cache():
+        """Vide la copie en cache des paramètres dans ce processus"""
+        with ParametresSysteme._cache_lock:
+            ParametresSysteme._cached_snapshot = None
+            ParametresSysteme._cached_version = None
+        if has_request_context():
+            g.pop('_parametres_snapshot', None)
+    
+    def bump_cache_version(self):
+        """Incrémente la version du cache pour forcer le rechargement dans tous les workers"""
+        self.cache_version = (self.cache_version or 0) + 1
+    
     @staticmethod
     def get_valeur(param_name, default_value=None):
         """Récupère une valeur spécifique des paramètres système"""
@@ -920,6 +1184,11 @@ class StatutCourrier(db.Model):
             db.session.rollback()
 
 
+# Matrice compilée rôle -> permissions (voir Role.get_permission_matrix)
+PERMISSION_MATRIX_TTL = 60  # secondes
+_permission_matrix = {'roles': None, 'expires': 0}
+_permission_matrix_lock = threading.Lock()
+
 class Role(db.Model):
     """Rôles personnalisés du système"""
     __tablename__ = 'role'
@@ -952,6 +1221,46 @@ class Role(db.Model):
         """Retourne la liste des noms de permissions"""
         return [p.permission_nom for p in self.permissions]
     
+    @staticmethod
+    def get_permission_matrix():
+        """Retourne la matrice rôle -> frozenset de permissions, construite en une requête
+        
+        La matrice est partagée par le processus et reconstruite après
+        invalidate_permission_matrix() (création, modification ou suppression d'un rôle)
+        ou après PERMISSION_MATRIX_TTL secondes pour suivre les changements faits
+        par les autres workers.
+        """
+        now = time.monotonic()
+        matrix = _permission_matrix['roles']
+        if matrix is not None and now < _permission_matrix['expires']:
+            return matrix
+        
+        with _permission_matrix_lock:
+            matrix = _permission_matrix['roles']
+            if matrix is not None and now < _permission_matrix['expires']:
+                return matrix
+            
+            grouped = {}
+            rows = db.session.query(Role.nom, RolePermission.permission_nom).outerjoin(
+                RolePermission, RolePermission.role_id == Role.id
+            ).all()
+            for role_nom, permission_nom in rows:
+                role_perms = grouped.setdefault(role_nom, set())
+                if permission_nom:
+                    role_perms.add(permission_nom)
+            
+            matrix = {role_nom: frozenset(perms) for role_nom, perms in grouped.items()}
+            _permission_matrix['roles'] = matrix
+            _permission_matrix['expires'] = now + PERMISSION_MATRIX_TTL
+            return matrix
+    
+    @staticmethod
+    def invalidate_permission_matrix():
+        """Force la reconstruction de la matrice des permissions"""
+        with _permission_matrix_lock:
+            _permission_matrix['roles'] = None
+            _permission_matrix['expires'] = 0
+    
     @staticmethod
     def init_default_roles():
         """Initialise les rôles par défaut"""
@@ -994,6 +1303,7 @@ class Role(db.Model):
         
         try:
             db.session.commit()
+            Role.invalidate_permission_matrix()
         except Exception as e:
             db.session.rollback()
             print(f"Erreur lors de l'initialisation des rôles: {e}")
@@ -1053,6 +1363,7 @@ class RolePermission(db.Model):
         
         try:
             db.session.commit()
+            Role.invalidate_permission_matrix()
         except Exception as e:
             db.session.rollback()
             print(f"Erreur lors de l'initialisation des permissions: {e}")
@@ -1158,6 +1469,7 @@ class CourrierForward(db.Model):
     attached_file = db.Column(db.String(255), nullable=True)  # Nom du fichier joint (optionnel)
     attached_file_original_name = db.Column(db.String(255), nullable=True)  # Nom original du fichier
     attached_file_size = db.Column(db.Integer, nullable=True)  # Taille du fichier en bytes
+    attached_file_checksum = db.Column(db.String(64), nullable=True)  # SHA-256 (stockage par contenu)
     date_transmission = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     lu = db.Column(db.Boolean, default=False, index=True)
     date_lecture = db.Column(db.DateTime, nullable=True)
@@ -1190,6 +1502,18 @@ class CourrierForward(db.Model):
         
         db.session.commit()
 
+class FichierStocke(db.Model):
+    """Fichier du stockage par contenu et nombre de courriers/transmissions qui le référencent"""
+    __tablename__ = 'fichier_stocke'
+    
+    checksum = db.Column(db.String(64), primary_key=True)  # SHA-256 du contenu
+    taille = db.Column(db.Integer, nullable=False, default=0)
+    nb_references = db.Column(db.Integer, nullable=False, default=0)
+    date_creation = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<FichierStocke {self.checksum[:12]} x{self.nb_references}>'
+
 class EmailTemplate(db.Model):
     """Templates d'email pour les notifications multi-langues"""
     __tablename__ = 'email_template'
@@ -1376,6 +1700,50 @@ Secrétariat Général - République Démocratique du Congo''',
             print(f"Erreur lors de l'initialisation des templates email: {e}")
             db.session.rollback()
 
+# ===== INVALIDATION DU CACHE À LA VALIDATION DES TRANSACTIONS =====
+# Les modèles modifiés sont collectés dans session.info pendant la transaction ;
+# leurs étiquettes de cache ne sont invalidées qu'après le commit (rien en cas de rollback).
+
+_CACHE_TAGS_KEY = 'cache_tags'
+_SECURITY_LIST_MODELS = {'IPBlock', 'IPWhitelist'}
+
+def _tag_session(session, *names):
+    if session is not None:
+        session.info.setdefault(_CACHE_TAGS_KEY, set()).update(names)
+
+@event.listens_for(Session, 'after_flush')
+def _collect_flushed_models(session, flush_context):
+    """Modèles insérés, modifiés ou supprimés par le flush"""
+    _tag_session(session, *{type(obj).__name__ for obj in (*session.new, *session.dirty, *session.deleted)})
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk_statements(orm_execute_state):
+    """UPDATE/DELETE/INSERT en masse (query.update(), query.delete()) qui ne passent pas par le flush"""
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        mapper = orm_execute_state.bind_mapper
+        if mapper is not None:
+            _tag_session(orm_execute_state.session, mapper.class_.__name__)
+
+@event.listens_for(Session, 'before_commit')
+def _bump_security_list_version(session):
+    """Une modification des IP bloquées ou autorisées change la version des listes"""
+    changed = {type(obj).__name__ for obj in (*session.new, *session.dirty, *session.deleted)}
+    changed |= session.info.get(_CACHE_TAGS_KEY, set())
+    if changed & _SECURITY_LIST_MODELS:
+        SecurityListVersion.bump(session)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed_models(session):
+    tags = session.info.pop(_CACHE_TAGS_KEY, None)
+    if tags:
+        invalidate_tags(*tags)
+        if tags & _SECURITY_LIST_MODELS:
+            ip_access_index.invalidate()
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back_models(session):
+    session.info.pop(_CACHE_TAGS_KEY, None)
+
 # Fonction d'initialisation globale
 def init_default_data():
     """Initialise toutes les données par défaut"""
@@ -2,91 +2,300 @@
 Performance utilities for GEC application
 """
 import time
+import json
+import base64
 import functools
+from datetime import datetime, date
 from flask import current_app, g
-from sqlalchemy import text
+from sqlalchemy import text, func, or_, and_, false, String, DateTime
 from app import db
+from cache_utils import create_cache, tag_versions
 
-# Simple in-memory cache for development (use Redis in production)
-_cache = {}
-_cache_ttl = {}
+# Cache of function results: bounded, per-key TTL, single-flight loading; backend set by CACHE_BACKEND
+RESULT_CACHE_MAX_ENTRIES = 512
+RESULT_CACHE_MAX_BYTES = 32 * 1024 * 1024
+_result_cache = create_cache('resultats', max_entries=RESULT_CACHE_MAX_ENTRIES,
+                             max_bytes=RESULT_CACHE_MAX_BYTES)
 
-def cache_result(ttl=300):  # 5 minutes default TTL
-    """Simple caching decorator for function results"""
+def cache_result(ttl=300, tags=()):  # 5 minutes default TTL
+    """Caching decorator for function results (only one caller recomputes an expired entry)
+    
+    tags: model names the result depends on; committing a change to one of them
+    invalidates the entry (see cache_utils.invalidate_tags and the listeners in models.py).
+    """
     def decorator(func):
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            # Create cache key from function name and arguments
+            # Create cache key from function name, arguments and tag versions
             cache_key = f"{func.__name__}:{str(args)}:{str(sorted(kwargs.items()))}"
-            
-            current_time = time.time()
-            
-            # Check if cached result exists and is still valid
-            if (cache_key in _cache and 
-                cache_key in _cache_ttl and 
-                current_time < _cache_ttl[cache_key]):
-                return _cache[cache_key]
-            
-            # Execute function and cache result
-            result = func(*args, **kwargs)
-            _cache[cache_key] = result
-            _cache_ttl[cache_key] = current_time + ttl
-            
-            return result
+            if tags:
+                cache_key += f":{tag_versions(tags)}"
+            return _result_cache.get_or_load(cache_key, lambda: func(*args, **kwargs), ttl=ttl)
         return wrapper
     return decorator
 
 def clear_cache():
     """Clear all cached results"""
-    global _cache, _cache_ttl
-    _cache.clear()
-    _cache_ttl.clear()
+    _result_cache.clear()
+    clear_count_cache()
 
 def clean_expired_cache():
     """Remove expired cache entries"""
-    current_time = time.time()
-    expired_keys = [
-        key for key, expiry in _cache_ttl.items()
-        if current_time >= expiry
-    ]
-    for key in expired_keys:
-        _cache.pop(key, None)
-        _cache_ttl.pop(key, None)
+    return _result_cache.purge_expired() + _count_cache.purge_expired()
+
+def get_cache_stats():
+    """Hit/miss/eviction counters and occupancy of the result and count caches"""
+    return {cache.name: cache.stats() for cache in (_result_cache, _count_cache)}
+
+def encode_cursor(direction, signature, values):
+    """Encode un curseur de pagination opaque (base64 URL-safe)"""
+    payload = {'d': direction, 's': signature, 'v': [_cursor_value(value) for value in values]}
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(token, signature):
+    """Décode un curseur ; retourne (direction, valeurs) ou None s'il est invalide ou d'un autre tri"""
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(raw.decode('utf-8'))
+        if payload.get('s') != signature or payload.get('d') not in ('n', 'p'):
+            return None
+        return payload['d'], [_cursor_value_from_json(value) for value in payload['v']]
+    except Exception:
+        return None
+
+def _cursor_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    return value
+
+def _cursor_value_from_json(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'd' in value:
+            return date.fromisoformat(value['d'])
+    return value
+
+# ===== COMPTAGES EN CACHE ET ESTIMÉS =====
+
+COUNT_CACHE_TTL = 300             # durée de vie d'un comptage exact (secondes), invalidé par étiquettes
+COUNT_CACHE_MAX_ENTRIES = 1000    # combinaisons de filtres conservées au plus
+ESTIMATE_MIN_ROWS = 10000         # en dessous, le comptage exact reste bon marché
+
+_count_cache = create_cache('comptages', max_entries=COUNT_CACHE_MAX_ENTRIES, default_ttl=COUNT_CACHE_TTL)
 
-def optimize_query_for_pagination(query, page, per_page, count_query=None):
-    """Optimize pagination queries to avoid expensive COUNT operations"""
-    # Use a more efficient counting method for large datasets
+def _count_cache_key(query):
+    """Clé d'une combinaison de filtres : SQL compilé, paramètres (inclut les restrictions d'accès)
+    et versions des modèles lus par la requête"""
+    statement = query.order_by(None).statement
+    compiled = statement.compile(dialect=db.engine.dialect)
+    params = tuple(sorted((name, repr(value)) for name, value in compiled.params.items()))
+    tags = query_model_tags(statement)
+    return str(compiled), params, tags, tag_versions(tags)
+
+def query_model_tags(statement):
+    """Noms des modèles dont les tables apparaissent dans la requête (sous-requêtes comprises)"""
+    from sqlalchemy.sql.util import find_tables
+    tables = {table.name for table in find_tables(statement, include_joins=True, include_aliases=True)
+              if hasattr(table, 'name')}
+    return tuple(sorted(
+        mapper.class_.__name__ for mapper in db.Model.registry.mappers
+        if mapper.local_table is not None and mapper.local_table.name in tables
+    ))
+
+def cached_count(query, ttl=COUNT_CACHE_TTL):
+    """COUNT(*) exact d'une requête filtrée, mis en cache quelques secondes par combinaison de filtres"""
+    return _count_cache.get_or_load(_count_cache_key(query), lambda: query.order_by(None).count(), ttl=ttl)
+
+def estimate_table_rows(table_name):
+    """Nombre de lignes estimé par le planificateur (pg_class.reltuples ou sqlite_stat1), None si inconnu"""
+    try:
+        if db.engine.dialect.name == 'postgresql':
+            value = db.session.execute(
+                text("SELECT reltuples::bigint FROM pg_class WHERE relname = :table_name AND relkind = 'r'"),
+                {"table_name": table_name}
+            ).scalar()
+            return int(value) if value is not None and value >= 0 else None
+        
+        stat = db.session.execute(
+            text("SELECT stat FROM sqlite_stat1 WHERE tbl = :table_name ORDER BY idx IS NOT NULL LIMIT 1"),
+            {"table_name": table_name}
+        ).scalar()
+        return int(stat.split()[0]) if stat else None
+    except Exception:
+        # sqlite_stat1 n'existe qu'après un ANALYZE
+        db.session.rollback()
+        return None
+
+def clear_count_cache():
+    """Vide le cache des comptages"""
+    _count_cache.clear()
+
+def get_listing_count(query, estimate_table=None, estimate_excluded=None):
+    """Total d'une liste paginée ; retourne (nombre, estimé)
+    
+    estimate_table n'est fourni que pour une liste non filtrée : le total de la table est
+    alors lu dans les statistiques du planificateur lorsqu'elle est volumineuse.
+    estimate_excluded compte les lignes de la table absentes de la liste (corbeille) :
+    ce comptage exact et sélectif est retranché de l'estimation.
+    """
+    if estimate_table:
+        estimate = estimate_table_rows(estimate_table)
+        if estimate is not None and estimate >= ESTIMATE_MIN_ROWS:
+            if estimate_excluded is not None:
+                estimate = max(estimate - cached_count(estimate_excluded), 0)
+            return estimate, True
+    return cached_count(query), False
+
+class KeysetPagination:
+    """Page de résultats obtenue par pagination par clé (keyset), sans OFFSET"""
+    
+    def __init__(self, items, per_page, next_cursor, prev_cursor, count_query, estimate_table=None,
+                 estimate_excluded=None):
+        self.items = items
+        self.per_page = per_page
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.has_next = next_cursor is not None
+        self.has_prev = prev_cursor is not None
+        self._count_query = count_query
+        self._estimate_table = estimate_table
+        self._estimate_excluded = estimate_excluded
+        self._total = None
+        self._total_estimated = False
+    
+    def _load_total(self):
+        if self._total is None:
+            self._total, self._total_estimated = get_listing_count(self._count_query, self._estimate_table,
+                                                                        self._estimate_excluded)
+    
+    @property
+    def total(self):
+        """Nombre total de résultats, calculé uniquement si le gabarit l'affiche"""
+        self._load_total()
+        return self._total
+    
+    @property
+    def total_estimated(self):
+        """Vrai si le total provient des statistiques du planificateur ("environ N")"""
+        self._load_total()
+        return self._total_estimated
+
+def optimize_query_for_pagination(query, model, sort_keys, per_page, cursor=None, count_query=None,
+                                  estimate_table=None, estimate_excluded=None):
+    """Pagination par clé (keyset/seek) réutilisable par les pages de liste
+    
+    sort_keys : liste de (nom_attribut, descendant) ; l'identifiant est ajouté comme
+    départage pour garantir un ordre total. Chaque page filtre sur la clé de tri de la
+    dernière (ou première) ligne affichée au lieu d'utiliser OFFSET, ce qui garde un coût
+    constant quelle que soit la profondeur.
+    
+    sort_keys=None conserve l'ordre déjà appliqué à la requête (tri par pertinence, sans
+    clé stable) : le curseur transporte alors un décalage.
+    
+    Le total est mis en cache par combinaison de filtres (voir get_listing_count) ;
+    estimate_table autorise une estimation pour une liste non filtrée (estimate_excluded :
+    lignes de la table que la liste ne montre pas).
+    """
     if count_query is None:
         count_query = query
     
-    # Get total count with optimization
-    try:
-        # Use approximate count for better performance on large tables
-        total = count_query.count()
-    except Exception:
-        # Fallback to basic count
-        total = query.count()
-    
-    # Calculate offset
-    offset = (page - 1) * per_page
-    
-    # Get items with limit and offset
-    items = query.offset(offset).limit(per_page).all()
-    
-    # Create pagination object-like structure
-    class PaginationResult:
-        def __init__(self, items, page, per_page, total):
-            self.items = items
-            self.page = page
-            self.per_page = per_page
-            self.total = total
-            self.pages = (total + per_page - 1) // per_page
-            self.has_prev = page > 1
-            self.has_next = page < self.pages
-            self.prev_num = page - 1 if self.has_prev else None
-            self.next_num = page + 1 if self.has_next else None
-    
-    return PaginationResult(items, page, per_page, total)
+    if sort_keys is None:
+        return _paginate_by_offset(query, per_page, cursor, count_query, estimate_table, estimate_excluded)
+    
+    keys = []
+    for name, descending in sort_keys:
+        expression, null_value = _sort_expression(model, name)
+        keys.append((name, expression, descending, null_value))
+    if not any(key[0] == 'id' for key in keys):
+        keys.append(('id', model.id, keys[-1][2] if keys else True, None))
+    signature = ','.join(f"{key[0]}:{'d' if key[2] else 'a'}" for key in keys)
+    
+    state = decode_cursor(cursor, signature)
+    backwards = state is not None and state[0] == 'p'
+    
+    query = query.order_by(None)
+    if state is not None:
+        query = query.filter(_seek_condition(keys, state[1], backwards))
+    
+    ordering = []
+    for _, expression, descending, _ in keys:
+        ordering.append(expression.desc() if descending != backwards else expression.asc())
+    rows = query.order_by(*ordering).limit(per_page + 1).all()
+    
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+        has_prev, has_next = more, True
+    else:
+        has_prev, has_next = state is not None, more
+    
+    next_cursor = prev_cursor = None
+    if rows and has_next:
+        next_cursor = encode_cursor('n', signature, _row_key(rows[-1], keys))
+    if rows and has_prev:
+        prev_cursor = encode_cursor('p', signature, _row_key(rows[0], keys))
+    
+    return KeysetPagination(rows, per_page, next_cursor, prev_cursor, count_query, estimate_table,
+                            estimate_excluded)
+
+def _sort_expression(model, name):
+    """Colonne de tri ; les valeurs NULL sont remplacées pour que la comparaison reste totale"""
+    attribute = getattr(model, name)
+    column = attribute.property.columns[0]
+    if not column.nullable or column.primary_key:
+        return attribute, None
+    if isinstance(column.type, String):
+        null_value = ''
+    elif isinstance(column.type, DateTime):
+        null_value = datetime(1970, 1, 1)
+    else:
+        return attribute, None
+    return func.coalesce(attribute, null_value), null_value
+
+def _row_key(row, keys):
+    values = []
+    for name, _, _, null_value in keys:
+        value = getattr(row, name)
+        values.append(null_value if value is None else value)
+    return values
+
+def _seek_condition(keys, values, backwards):
+    """(k1, k2, ...) strictement après (ou avant) la ligne de référence, direction par colonne"""
+    if len(values) != len(keys):
+        return false()
+    
+    alternatives = []
+    for position, (_, expression, descending, _) in enumerate(keys):
+        equal_prefix = [keys[i][1] == values[i] for i in range(position)]
+        if descending != backwards:
+            step = expression < values[position]
+        else:
+            step = expression > values[position]
+        alternatives.append(and_(*equal_prefix, step))
+    return or_(*alternatives)
+
+def _paginate_by_offset(query, per_page, cursor, count_query, estimate_table=None, estimate_excluded=None):
+    signature = 'offset'
+    state = decode_cursor(cursor, signature)
+    offset = 0
+    if state is not None and state[1] and isinstance(state[1][0], int):
+        offset = max(state[1][0], 0)
+    
+    rows = query.offset(offset).limit(per_page + 1).all()
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+    
+    next_cursor = encode_cursor('n', signature, [offset + per_page]) if has_next else None
+    prev_cursor = encode_cursor('p', signature, [max(offset - per_page, 0)]) if offset > 0 else None
+    return KeysetPagination(rows, per_page, next_cursor, prev_cursor, count_query, estimate_table,
+                            estimate_excluded)
 
 def get_database_stats():
     """Get database statistics for monitoring"""
@@ -197,23 +406,21 @@ def monitor_query_performance(func):
         return result
     return wrapper
 
-@cache_result(ttl=600)  # Cache for 10 minutes
+@cache_result(ttl=3600, tags=('Courrier', 'User', 'LogActivite'))  # invalidated on commit
 def get_dashboard_statistics():
     """Get cached dashboard statistics"""
-    from models import Courrier, User, LogActivite
+    from models import User, LogActivite
+    from stats_utils import query_daily_stats
     from datetime import datetime, timedelta
     
     today = datetime.now().date()
     week_ago = today - timedelta(days=7)
     
+    # Comptages lus dans la table agrégée courrier_daily_stats (courriers non supprimés)
     stats = {
-        'total_courriers': Courrier.query.count(),
-        'courriers_today': Courrier.query.filter(
-            Courrier.date_enregistrement >= today
-        ).count(),
-        'courriers_this_week': Courrier.query.filter(
-            Courrier.date_enregistrement >= week_ago
-        ).count(),
+        'total_courriers': query_daily_stats()[0].nombre,
+        'courriers_today': query_daily_stats(start=today)[0].nombre,
+        'courriers_this_week': query_daily_stats(start=week_ago)[0].nombre,
         'total_users': User.query.filter_by(actif=True).count(),
         'recent_activities': LogActivite.query.order_by(
             LogActivite.date_action.desc()
@@ -0,0 +1,36 @@
+"""
+Script de maintenance du stockage des pièces jointes par contenu (uploads/store)
+Range dans le stockage les fichiers encore à l'ancien emplacement (uploads/, uploads/forwards),
+recalcule les références depuis les courriers et transmissions puis supprime les fichiers
+qui ne sont plus référencés. À lancer après une mise à jour, une restauration ou un import.
+
+Usage: python rebuild_attachment_store.py
+"""
+import sys
+from app import app
+from attachment_store_utils import attachment_store, migrate_legacy_attachments
+
+def main():
+    print("=" * 60)
+    print("MAINTENANCE DU STOCKAGE DES PIÈCES JOINTES")
+    print("=" * 60 + "\n")
+
+    with app.app_context():
+        try:
+            migrated = migrate_legacy_attachments()
+            print(f"   ✓ {migrated} fichier(s) rangé(s) dans le stockage")
+            result = attachment_store.rebuild_references()
+            print(f"   ✓ {result['files']} fichier(s) distinct(s), {result['references']} référence(s)")
+            print(f"   ✓ {result['orphans_removed']} fichier(s) non référencé(s) supprimé(s)")
+            temporary = attachment_store.clean_temporary()
+            print(f"   ✓ {temporary} fichier(s) temporaire(s) supprimé(s)")
+            stats = attachment_store.stats()
+        except Exception as e:
+            print(f"\n❌ Erreur lors de la maintenance du stockage: {e}")
+            return 1
+
+    print(f"\n✨ Stockage à jour : {stats['saved_bytes'] / 1024 / 1024:.1f} Mo économisés par la déduplication.\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,28 @@
+"""
+Script de recalcul des statistiques quotidiennes des courriers (table courrier_daily_stats)
+À lancer après une restauration, un import massif ou une modification directe en base
+
+Usage: python rebuild_daily_stats.py
+"""
+import sys
+from app import app, db
+from stats_utils import rebuild_daily_stats
+
+def main():
+    print("=" * 60)
+    print("RECALCUL DES STATISTIQUES QUOTIDIENNES")
+    print("=" * 60 + "\n")
+
+    with app.app_context():
+        try:
+            count = rebuild_daily_stats(db.engine)
+            print(f"   ✓ {count} ligne(s) de statistiques recalculée(s)")
+        except Exception as e:
+            print(f"\n❌ Erreur lors du recalcul des statistiques: {e}")
+            return 1
+
+    print("\n✨ Statistiques quotidiennes recalculées.\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
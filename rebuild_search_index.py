@@ -0,0 +1,31 @@
+"""
+Script de reconstruction des index de recherche des courriers
+FTS5 sur SQLite, index GIN tsvector sur PostgreSQL, index de suggestions (autocomplétion)
+
+Usage: python rebuild_search_index.py
+"""
+import sys
+from app import app, db
+from search_utils import rebuild_search_index, rebuild_suggestion_index
+
+def main():
+    print("=" * 60)
+    print("RECONSTRUCTION DE L'INDEX DE RECHERCHE")
+    print("=" * 60 + "\n")
+
+    with app.app_context():
+        try:
+            print(f"🔄 Moteur de base de données: {db.engine.dialect.name}")
+            count = rebuild_search_index(db.engine)
+            print(f"   ✓ {count} courrier(s) indexé(s)")
+            count = rebuild_suggestion_index(db.engine)
+            print(f"   ✓ {count} entrée(s) de suggestion indexée(s)")
+        except Exception as e:
+            print(f"\n❌ Erreur lors de la reconstruction de l'index: {e}")
+            return 1
+
+    print("\n✨ Index de recherche reconstruit.\n")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
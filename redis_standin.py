@@ -0,0 +1,253 @@
+"""
+Serveur local compatible Redis (sous-ensemble du protocole RESP2) pour tester le backend
+de cache partagé sans installer Redis : données en mémoire, expiration en millisecondes.
+
+Usage: python redis_standin.py [--port 6379]
+       puis CACHE_BACKEND=redis REDIS_URL=redis://localhost:6379/0
+"""
+import sys
+import time
+import fnmatch
+import argparse
+import threading
+import socketserver
+
+class _Store:
+    """Données du serveur : clé -> (valeur, expiration monotone ou None)"""
+
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def lookup(self, key):
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.monotonic():
+            del self.data[key]
+            return None
+        return entry
+
+class _Error(Exception):
+    pass
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        queued = None   # commandes en attente entre MULTI et EXEC
+        while True:
+            try:
+                args = self._read_command()
+            except (EOFError, ConnectionError):
+                return
+            command = args[0].upper() if args else b''
+            try:
+                if command == b'MULTI':
+                    if queued is not None:
+                        raise _Error("MULTI imbriqué")
+                    queued, reply = [], 'OK'
+                elif command == b'EXEC':
+                    if queued is None:
+                        raise _Error("EXEC sans MULTI")
+                    commands, queued = queued, None
+                    reply = self.server.dispatch_transaction(commands)
+                elif command == b'DISCARD':
+                    if queued is None:
+                        raise _Error("DISCARD sans MULTI")
+                    queued, reply = None, 'OK'
+                elif queued is not None:
+                    queued.append(args)
+                    reply = 'QUEUED'
+                else:
+                    reply = self.server.dispatch(args)
+            except _Error as e:
+                reply = e
+            self.wfile.write(_encode(reply))
+            self.wfile.flush()
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            raise EOFError
+        if not line.startswith(b'*'):
+            return line.split()
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+def _encode(reply):
+    if isinstance(reply, _Error):
+        return b'-ERR %s\r\n' % str(reply).encode('utf-8')
+    if reply is None:
+        return b'$-1\r\n'
+    if isinstance(reply, bool):
+        return b'+OK\r\n' if reply else b'$-1\r\n'
+    if isinstance(reply, int):
+        return b':%d\r\n' % reply
+    if isinstance(reply, str):
+        return b'+%s\r\n' % reply.encode('utf-8')
+    if isinstance(reply, list):
+        return b'*%d\r\n' % len(reply) + b''.join(_encode(item) for item in reply)
+    return b'$%d\r\n%s\r\n' % (len(reply), reply)
+
+class LocalRedisServer(socketserver.ThreadingTCPServer):
+    """Serveur de substitution : PING, AUTH, SELECT, GET, SET (PX/EX/NX/XX), DEL, INCR, INCRBY,
+    PEXPIRE, PTTL, SCAN, DBSIZE, FLUSHDB, et MULTI/EXEC/DISCARD"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host='127.0.0.1', port=0):
+        super().__init__((host, port), _Handler)
+        self.store = _Store()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self):
+        """Démarre le serveur dans un thread d'arrière-plan et retourne l'URL de connexion"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def dispatch(self, args):
+        handler = self._handler(args)
+        with self.store.lock:
+            return handler(*args[1:])
+
+    def dispatch_transaction(self, commands):
+        """Exécute les commandes d'un MULTI/EXEC sans qu'aucun autre client ne s'intercale"""
+        handlers = [self._handler(args) for args in commands]
+        replies = []
+        with self.store.lock:
+            for handler, args in zip(handlers, commands):
+                try:
+                    replies.append(handler(*args[1:]))
+                except _Error as e:
+                    replies.append(e)
+        return replies
+
+    def _handler(self, args):
+        if not args:
+            raise _Error("commande vide")
+        command = args[0].decode('ascii').upper()
+        handler = getattr(self, f"_cmd_{command.lower()}", None)
+        if handler is None:
+            raise _Error(f"commande inconnue '{command}'")
+        return handler
+
+    def _cmd_ping(self, *args):
+        return args[0] if args else 'PONG'
+
+    def _cmd_auth(self, *args):
+        return 'OK'
+
+    def _cmd_select(self, index):
+        return 'OK'
+
+    def _cmd_get(self, key):
+        entry = self.store.lookup(key)
+        return None if entry is None else entry[0]
+
+    def _cmd_set(self, key, value, *options):
+        expires, only_new, only_existing = None, False, False
+        options = [option.upper() if option.isalpha() else option for option in options]
+        index = 0
+        while index < len(options):
+            option = options[index]
+            if option in (b'PX', b'EX'):
+                delay = int(options[index + 1]) / (1000.0 if option == b'PX' else 1.0)
+                expires = time.monotonic() + delay
+                index += 1
+            elif option == b'NX':
+                only_new = True
+            elif option == b'XX':
+                only_existing = True
+            else:
+                raise _Error("option SET non prise en charge")
+            index += 1
+        exists = self.store.lookup(key) is not None
+        if (only_new and exists) or (only_existing and not exists):
+            return None
+        self.store.data[key] = (value, expires)
+        return 'OK'
+
+    def _cmd_del(self, *keys):
+        removed = 0
+        for key in keys:
+            if self.store.lookup(key) is not None:
+                del self.store.data[key]
+                removed += 1
+        return removed
+
+    def _cmd_incr(self, key):
+        return self._cmd_incrby(key, b'1')
+
+    def _cmd_incrby(self, key, amount):
+        entry = self.store.lookup(key)
+        value, expires = (b'0', None) if entry is None else entry
+        try:
+            value = int(value) + int(amount)
+        except ValueError:
+            raise _Error("la valeur n'est pas un entier")
+        self.store.data[key] = (str(value).encode('ascii'), expires)
+        return value
+
+    def _cmd_pexpire(self, key, milliseconds):
+        entry = self.store.lookup(key)
+        if entry is None:
+            return 0
+        self.store.data[key] = (entry[0], time.monotonic() + int(milliseconds) / 1000.0)
+        return 1
+
+    def _cmd_pttl(self, key):
+        entry = self.store.lookup(key)
+        if entry is None:
+            return -2
+        if entry[1] is None:
+            return -1
+        return int((entry[1] - time.monotonic()) * 1000)
+
+    def _cmd_scan(self, cursor, *options):
+        pattern = b'*'
+        for name, value in zip(options[::2], options[1::2]):
+            if name.upper() == b'MATCH':
+                pattern = value
+        keys = [key for key in list(self.store.data) if self.store.lookup(key) is not None
+                and fnmatch.fnmatchcase(key.decode('utf-8', 'replace'), pattern.decode('utf-8', 'replace'))]
+        return [b'0', keys]
+
+    def _cmd_dbsize(self):
+        return sum(1 for key in list(self.store.data) if self.store.lookup(key) is not None)
+
+    def _cmd_flushdb(self, *args):
+        self.store.data.clear()
+        return 'OK'
+
+def main():
+    parser = argparse.ArgumentParser(description="Serveur local compatible Redis pour le cache GEC")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6379)
+    options = parser.parse_args()
+
+    server = LocalRedisServer(options.host, options.port)
+    print(f"🔄 Serveur de cache local à l'écoute sur {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
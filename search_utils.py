@@ -0,0 +1,352 @@
+"""
+Index de recherche plein texte pour les courriers
+FTS5 sur SQLite, index GIN sur une expression tsvector pour PostgreSQL
+Index de préfixes (table courrier_suggestion) pour l'autocomplétion
+"""
+import re
+import logging
+import unicodedata
+from sqlalchemy import text, func, literal_column, Integer, Float
+
+# Colonnes indexées, dans l'ordre de la table virtuelle FTS5
+SEARCH_COLUMNS = [
+    'numero_accuse_reception',
+    'numero_reference',
+    'objet',
+    'expediteur',
+    'destinataire',
+    'autres_informations',
+    'fichier_nom',
+    'statut',
+]
+
+# Poids par colonne pour le classement (bm25 sur SQLite, setweight sur PostgreSQL)
+SEARCH_WEIGHTS = {
+    'numero_accuse_reception': ('A', 10.0),
+    'numero_reference': ('A', 10.0),
+    'objet': ('A', 5.0),
+    'expediteur': ('B', 3.0),
+    'destinataire': ('B', 3.0),
+    'autres_informations': ('C', 1.0),
+    'fichier_nom': ('D', 1.0),
+    'statut': ('D', 1.0),
+}
+
+FTS_TABLE = 'courrier_fts'
+PG_INDEX_NAME = 'ix_courrier_recherche_fts'
+# Configuration 'simple' sans accents, comme remove_diacritics 2 côté FTS5 : "reception" trouve "réception"
+PG_TS_CONFIG = 'gec_simple_unaccent'
+
+# Expression tsvector partagée par l'index GIN et les requêtes PostgreSQL :
+# elle doit être strictement identique des deux côtés pour que l'index soit utilisé
+PG_SEARCH_VECTOR = " || ".join(
+    f"setweight(to_tsvector('{PG_TS_CONFIG}', coalesce(courrier.{column}, '')), '{SEARCH_WEIGHTS[column][0]}')"
+    for column in SEARCH_COLUMNS
+)
+
+# Jetons alphanumériques, découpés comme le font unicode61 (FTS5) et l'analyseur PostgreSQL
+_TOKEN_PATTERN = re.compile(r'[^\W_]+', re.UNICODE)
+
+# Disponibilité de l'index par moteur (évite de réinterroger le catalogue à chaque recherche)
+_index_available = {}
+
+def _dialect(engine):
+    return engine.dialect.name
+
+def _sqlite_fts_statements():
+    columns = ', '.join(SEARCH_COLUMNS)
+    new_values = ', '.join(f"new.{column}" for column in SEARCH_COLUMNS)
+    return [
+        f"""
+        CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+            {columns},
+            tokenize = 'unicode61 remove_diacritics 2'
+        )
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON courrier BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {new_values});
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON courrier BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF {columns} ON courrier BEGIN
+            DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+            INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES (new.id, {new_values});
+        END
+        """,
+    ]
+
+def _sqlite_fts_exists(connection):
+    result = connection.execute(
+        text("SELECT name FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": FTS_TABLE}
+    ).fetchone()
+    return result is not None
+
+def _pg_ts_config_statements():
+    # unaccent() seul n'est pas IMMUTABLE : il passe par un dictionnaire de la configuration de recherche
+    return [
+        "CREATE EXTENSION IF NOT EXISTS unaccent",
+        f"""
+        DO $$
+        BEGIN
+            IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = '{PG_TS_CONFIG}') THEN
+                CREATE TEXT SEARCH CONFIGURATION {PG_TS_CONFIG} (COPY = simple);
+                ALTER TEXT SEARCH CONFIGURATION {PG_TS_CONFIG}
+                    ALTER MAPPING FOR word, hword, hword_part WITH unaccent, simple;
+            END IF;
+        END
+        $$
+        """,
+    ]
+
+def ensure_search_index(engine):
+    """Crée l'index plein texte et ses déclencheurs s'ils n'existent pas
+
+    Sur SQLite, la table FTS5 est remplie depuis la table courrier lors de sa création.
+    Retourne True si l'index est utilisable.
+    """
+    dialect = _dialect(engine)
+    try:
+        if dialect == 'sqlite':
+            with engine.connect() as connection:
+                created = not _sqlite_fts_exists(connection)
+                for statement in _sqlite_fts_statements():
+                    connection.execute(text(statement))
+                connection.commit()
+            if created:
+                logging.info(f"Table {FTS_TABLE} créée, indexation des courriers existants...")
+                rebuild_search_index(engine)
+        elif dialect == 'postgresql':
+            with engine.connect() as connection:
+                for statement in _pg_ts_config_statements():
+                    connection.execute(text(statement))
+                connection.execute(text(
+                    f"CREATE INDEX IF NOT EXISTS {PG_INDEX_NAME} ON courrier USING GIN (({PG_SEARCH_VECTOR}))"
+                ))
+                connection.commit()
+        else:
+            _index_available[dialect] = False
+            return False
+
+        _index_available[dialect] = True
+        return True
+    except Exception as e:
+        # FTS5 absent de la build SQLite, droits insuffisants, etc. : la recherche ILIKE reste disponible
+        logging.warning(f"Index de recherche plein texte indisponible: {e}")
+        _index_available[dialect] = False
+        return False
+
+def rebuild_search_index(engine):
+    """Reconstruit entièrement l'index plein texte et retourne le nombre de courriers indexés"""
+    dialect = _dialect(engine)
+    columns = ', '.join(SEARCH_COLUMNS)
+
+    if dialect == 'sqlite':
+        with engine.connect() as connection:
+            for statement in _sqlite_fts_statements():
+                connection.execute(text(statement))
+            connection.execute(text(f"DELETE FROM {FTS_TABLE}"))
+            connection.execute(text(
+                f"INSERT INTO {FTS_TABLE}(rowid, {columns}) SELECT id, {columns} FROM courrier"
+            ))
+            connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')"))
+            count = connection.execute(text(f"SELECT COUNT(*) FROM {FTS_TABLE}")).scalar()
+            connection.commit()
+        _index_available[dialect] = True
+        return count
+
+    if dialect == 'postgresql':
+        with engine.connect() as connection:
+            for statement in _pg_ts_config_statements():
+                connection.execute(text(statement))
+            connection.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {PG_INDEX_NAME} ON courrier USING GIN (({PG_SEARCH_VECTOR}))"
+            ))
+            connection.execute(text(f"REINDEX INDEX {PG_INDEX_NAME}"))
+            count = connection.execute(text("SELECT COUNT(*) FROM courrier")).scalar()
+            connection.commit()
+        _index_available[dialect] = True
+        return count
+
+    raise ValueError(f"Moteur de base de données non supporté pour l'index de recherche: {dialect}")
+
+def is_search_index_available(engine):
+    """Indique si l'index plein texte a été initialisé pour ce moteur"""
+    return _index_available.get(_dialect(engine), False)
+
+def tokenize_search_term(search_term):
+    """Découpe la saisie en mots (séparés par des espaces) d'au moins 2 caractères,
+    chacun réduit à la suite de ses jetons : "GEC-2025-0001 mines" -> [['gec', '2025', '0001'], ['mines']]
+    """
+    if not search_term:
+        return []
+    words = []
+    for word in search_term.split():
+        tokens = _TOKEN_PATTERN.findall(word.lower())
+        if len(word) >= 2 and tokens:
+            words.append(tokens)
+    return words
+
+def _build_fts5_match(words):
+    # Chaque mot devient une phrase citée (aucun opérateur FTS5 injectable) recherchée en préfixe :
+    # "gec 2025 0001"* trouve GEC-2025-0001 sans retenir tous les courriers de 2025
+    return ' OR '.join('"{}"*'.format(' '.join(tokens)) for tokens in words)
+
+def _build_tsquery(words):
+    # Même logique : jetons consécutifs (<->), préfixe sur le dernier
+    return ' | '.join('({}:*)'.format(' <-> '.join(tokens)) for tokens in words)
+
+def apply_fulltext_search(query, search_term, model, engine, order_by_rank=False):
+    """Filtre une requête Courrier avec l'index plein texte
+
+    Retourne (query, True) si l'index a été utilisé, ou (query, False) si la recherche
+    doit se rabattre sur optimize_search_query (index absent ou saisie vide).
+    Avec order_by_rank=True, les résultats sont triés par pertinence.
+    """
+    words = tokenize_search_term(search_term)
+    if not words or not is_search_index_available(engine):
+        return query, False
+
+    dialect = _dialect(engine)
+
+    if dialect == 'sqlite':
+        weights = ', '.join(str(SEARCH_WEIGHTS[column][1]) for column in SEARCH_COLUMNS)
+        matches = text(
+            f"SELECT rowid AS courrier_id, bm25({FTS_TABLE}, {weights}) AS rank "
+            f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :fts_query"
+        ).bindparams(fts_query=_build_fts5_match(words)).columns(
+            courrier_id=Integer, rank=Float
+        ).subquery('fts_matches')
+        query = query.join(matches, matches.c.courrier_id == model.id)
+        if order_by_rank:
+            # bm25 retourne un score négatif : plus il est petit, plus le document est pertinent
+            query = query.order_by(matches.c.rank.asc(), model.date_enregistrement.desc())
+        return query, True
+
+    if dialect == 'postgresql':
+        vector = literal_column(PG_SEARCH_VECTOR)
+        tsquery = func.to_tsquery(literal_column(f"'{PG_TS_CONFIG}'::regconfig"), _build_tsquery(words))
+        query = query.filter(vector.op('@@')(tsquery))
+        if order_by_rank:
+            query = query.order_by(func.ts_rank(vector, tsquery).desc(), model.date_enregistrement.desc())
+        return query, True
+
+    return query, False
+
+# ===== INDEX DE SUGGESTIONS (AUTOCOMPLÉTION) =====
+
+# Champs proposés en suggestion et catégorie associée
+SUGGESTION_FIELDS = [
+    ('numero_accuse_reception', 'accuse'),
+    ('numero_reference', 'reference'),
+    ('objet', 'objet'),
+    ('expediteur', 'contact'),
+    ('destinataire', 'contact'),
+]
+SUGGESTION_MAX_WORDS = 8        # débuts de mots indexés par valeur
+SUGGESTION_KEY_LENGTH = 120     # longueur maximale d'une clé normalisée
+SUGGESTION_TERM_LENGTH = 200    # longueur maximale d'un terme affiché
+SUGGESTION_SCAN_LIMIT = 1000    # entrées lues au plus, dans l'ordre de l'index, pour classer les suggestions
+
+# Caractère supérieur à tout autre en comparaison binaire UTF-8 (borne haute des préfixes)
+_PREFIX_UPPER_BOUND = '\U0010ffff'
+_WORD_PATTERN = re.compile(r'\w+')
+
+def normalize_suggestion_key(value):
+    """Normalise une valeur pour la comparaison par préfixe (minuscules, sans accents)"""
+    if not value:
+        return ''
+    decomposed = unicodedata.normalize('NFKD', str(value))
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    return ' '.join(stripped.lower().split())[:SUGGESTION_KEY_LENGTH]
+
+def build_suggestion_rows(courrier_id, values):
+    """Construit les lignes courrier_suggestion d'un courrier
+
+    Chaque valeur est indexée à partir du début de chacun de ses premiers mots,
+    pour que "mines" suggère "Ministère des Mines" et "0042" suggère "ACC-2024-0042".
+    """
+    rows = []
+    seen = set()
+    for field, type_terme in SUGGESTION_FIELDS:
+        value = values.get(field)
+        if not value:
+            continue
+        terme = ' '.join(str(value).split())[:SUGGESTION_TERM_LENGTH]
+        key = normalize_suggestion_key(terme)
+        starts = [m.start() for m in _WORD_PATTERN.finditer(key) if len(m.group()) >= 2]
+        for start in starts[:SUGGESTION_MAX_WORDS]:
+            cle = key[start:]
+            if (cle, terme) in seen:
+                continue
+            seen.add((cle, terme))
+            rows.append({
+                'cle': cle,
+                'terme': terme,
+                'type_terme': type_terme,
+                'courrier_id': courrier_id,
+            })
+    return rows
+
+def prefix_condition(column, prefix, dialect):
+    """Condition "column commence par prefix" servie par l'index de la colonne
+
+    SQLite : comparaison par intervalle (l'optimisation LIKE exige une collation NOCASE).
+    PostgreSQL : LIKE 'prefix%' (index créé avec varchar_pattern_ops).
+    """
+    if dialect == 'postgresql':
+        escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        return column.like(escaped + '%', escape='\\')
+    return (column >= prefix) & (column < prefix + _PREFIX_UPPER_BOUND)
+
+def rebuild_suggestion_index(engine, batch_size=1000):
+    """Reconstruit la table courrier_suggestion par lots et retourne le nombre d'entrées"""
+    fields = [field for field, _ in SUGGESTION_FIELDS]
+    select_sql = text(
+        f"SELECT id, {', '.join(fields)} FROM courrier WHERE id > :last_id ORDER BY id LIMIT :batch_size"
+    )
+    insert_sql = text(
+        "INSERT INTO courrier_suggestion (cle, terme, type_terme, courrier_id) "
+        "VALUES (:cle, :terme, :type_terme, :courrier_id)"
+    )
+
+    with engine.connect() as connection:
+        connection.execute(text("DELETE FROM courrier_suggestion"))
+        connection.commit()
+
+    total = 0
+    last_id = 0
+    while True:
+        with engine.connect() as connection:
+            courriers = connection.execute(select_sql, {"last_id": last_id, "batch_size": batch_size}).fetchall()
+            if not courriers:
+                break
+            rows = []
+            for courrier in courriers:
+                rows.extend(build_suggestion_rows(courrier[0], dict(zip(fields, courrier[1:]))))
+            if rows:
+                connection.execute(insert_sql, rows)
+            connection.commit()
+        total += len(rows)
+        last_id = courriers[-1][0]
+
+    return total
+
+def ensure_suggestion_index(engine):
+    """Remplit l'index de suggestions s'il est vide alors que des courriers existent"""
+    try:
+        with engine.connect() as connection:
+            has_suggestions = connection.execute(text("SELECT 1 FROM courrier_suggestion LIMIT 1")).fetchone()
+            has_courriers = connection.execute(text("SELECT 1 FROM courrier LIMIT 1")).fetchone()
+        if has_courriers and not has_suggestions:
+            logging.info("Construction de l'index de suggestions de recherche...")
+            count = rebuild_suggestion_index(engine)
+            logging.info(f"Index de suggestions construit: {count} entrée(s)")
+    except Exception as e:
+        logging.warning(f"Index de suggestions indisponible: {e}")
@@ -0,0 +1,158 @@
+"""
+Journal de sécurité en mémoire (page Logs de Sécurité)
+Tampon circulaire de taille fixe : chaque entrée reçoit un numéro de séquence croissant et
+occupe la case numéro % capacité ; les plus anciennes sont écrasées. Des index par niveau et
+par type d'événement (listes de numéros triées, dont la longueur sert de compteur) sont tenus
+à jour à chaque ajout : filtres, pagination et statistiques coûtent O(résultat), pas O(tampon).
+"""
+import time
+import bisect
+import threading
+from datetime import datetime
+
+SECURITY_LOG_CAPACITY = 1000
+
+class SecurityLogRecord:
+    """Entrée du journal ; l'horodatage est conservé en secondes epoch (heure locale à l'affichage)"""
+    __slots__ = ('seq', 'epoch', 'level', 'event_type', 'message', 'username', 'ip_address', 'source')
+
+    def __init__(self, seq, epoch, level, event_type, message, username, ip_address, source):
+        self.seq = seq
+        self.epoch = epoch
+        self.level = level
+        self.event_type = event_type
+        self.message = message
+        self.username = username
+        self.ip_address = ip_address
+        self.source = source
+
+    @property
+    def timestamp(self):
+        return datetime.fromtimestamp(self.epoch)
+
+class _SeqIndex:
+    """Numéros de séquence d'une valeur indexée, croissants ; les numéros écrasés sont retirés en tête"""
+    __slots__ = ('seqs', 'head')
+
+    def __init__(self):
+        self.seqs = []
+        self.head = 0
+
+    def append(self, seq):
+        self.seqs.append(seq)
+
+    def discard_before(self, first_seq):
+        while self.head < len(self.seqs) and self.seqs[self.head] < first_seq:
+            self.head += 1
+        # Compactage amorti : la liste ne garde pas indéfiniment les numéros écrasés
+        if self.head > 64 and self.head * 2 > len(self.seqs):
+            del self.seqs[:self.head]
+            self.head = 0
+
+    def __len__(self):
+        return len(self.seqs) - self.head
+
+class SecurityLogStore:
+    """Tampon circulaire d'entrées de sécurité avec index par niveau et par type d'événement"""
+
+    def __init__(self, capacity=SECURITY_LOG_CAPACITY):
+        self.capacity = capacity
+        self._slots = [None] * capacity
+        self._next_seq = 0
+        self._last_epoch = 0
+        self._by_level = {}
+        self._by_event = {}
+        self._lock = threading.Lock()
+
+    def append(self, level, event_type, message, username=None, ip_address=None, source=None, epoch=None):
+        epoch = int(time.time()) if epoch is None else int(epoch)
+        with self._lock:
+            # Horodatages croissants (recul d'horloge ignoré) : les filtres de dates sont dichotomiques
+            epoch = max(epoch, self._last_epoch)
+            self._last_epoch = epoch
+            seq = self._next_seq
+            position = seq % self.capacity
+            evicted = self._slots[position]
+            self._slots[position] = SecurityLogRecord(seq, epoch, level, event_type, message,
+                                                      username, ip_address, source)
+            self._next_seq += 1
+            if evicted is not None:
+                self._forget(evicted)
+            self._by_level.setdefault(level, _SeqIndex()).append(seq)
+            self._by_event.setdefault(event_type, _SeqIndex()).append(seq)
+
+    def count_event(self, event_type):
+        """Nombre d'entrées présentes pour ce type d'événement"""
+        index = self._by_event.get(event_type)
+        return len(index) if index is not None else 0
+
+    def __len__(self):
+        return min(self._next_seq, self.capacity)
+
+    def query(self, level=None, event_type=None, start_epoch=None, end_epoch=None, offset=0, limit=None):
+        """Entrées filtrées, les plus récentes d'abord : (total, page d'entrées)
+
+        start_epoch inclus, end_epoch exclu ; offset/limit découpent le résultat trié.
+        """
+        with self._lock:
+            first_seq = self._next_seq - len(self)
+            candidates, lo, hi = self._candidates(level, event_type, first_seq)
+
+            # Bornes de dates par dichotomie sur les numéros (horodatages croissants)
+            if start_epoch is not None:
+                lo = bisect.bisect_left(candidates, start_epoch, lo, hi, key=self._epoch_of)
+            if end_epoch is not None:
+                hi = bisect.bisect_left(candidates, end_epoch, lo, hi, key=self._epoch_of)
+
+            records = self._slots
+            capacity = self.capacity
+            if level and event_type:
+                # Deux filtres : parcours de l'index le plus court, vérification de l'autre attribut
+                matches = [seq for seq in candidates[lo:hi]
+                           if records[seq % capacity].level == level
+                           and records[seq % capacity].event_type == event_type]
+                candidates, lo, hi = matches, 0, len(matches)
+
+            total = max(0, hi - lo)
+            newest = hi - offset
+            oldest = lo if limit is None else max(lo, newest - limit)
+            page = [records[candidates[i] % capacity] for i in range(newest - 1, oldest - 1, -1)]
+            return total, page
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self),
+                'capacity': self.capacity,
+                'levels': {level: len(index) for level, index in self._by_level.items()},
+                'events': {event_type: len(index) for event_type, index in self._by_event.items()},
+            }
+
+    def _candidates(self, level, event_type, first_seq):
+        """Numéros à examiner (séquence triée, début, fin) : index le plus sélectif, ou tout le tampon"""
+        indexes = []
+        if level:
+            indexes.append(self._by_level.get(level))
+        if event_type:
+            indexes.append(self._by_event.get(event_type))
+        if any(index is None for index in indexes):
+            return [], 0, 0
+        if not indexes:
+            return range(first_seq, self._next_seq), 0, self._next_seq - first_seq
+        index = min(indexes, key=len)
+        return index.seqs, index.head, len(index.seqs)
+
+    def _epoch_of(self, seq):
+        return self._slots[seq % self.capacity].epoch
+
+    def _forget(self, record):
+        """Retire des index l'entrée écrasée (toujours la plus ancienne)"""
+        first_seq = record.seq + 1
+        for indexes, key in ((self._by_level, record.level), (self._by_event, record.event_type)):
+            index = indexes.get(key)
+            if index is not None:
+                index.discard_before(first_seq)
+                if not len(index):
+                    del indexes[key]
+
+security_log_store = SecurityLogStore()
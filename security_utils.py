@@ -7,35 +7,53 @@ import uuid
 import json
 import logging
 import hashlib
+import math
+import heapq
 import secrets
 import threading
+import time
 import os
 from datetime import datetime, timedelta
 from functools import wraps
-from collections import defaultdict
+from collections import defaultdict, deque
 from flask import request, session, abort, current_app, flash, redirect, url_for, g
 from flask_login import current_user
 from werkzeug.security import generate_password_hash, check_password_hash
 import ipaddress
-
-# Security storage (in production, use Redis or similar)
-_rate_limit_storage = {}
-_failed_login_attempts = defaultdict(dict)  # Changed to dict to store more info
+from cache_utils import create_cache
+from http_cache_utils import apply_cache_policy
+from ip_index_utils import ip_access_index
+from log_writer_utils import queue_log
+from security_log_utils import security_log_store
+
+# Security storage
+# Compteurs partagés entre workers selon CACHE_BACKEND (mémoire, fichier SQLite ou Redis)
+_rate_limits = create_cache('limites_requetes', max_entries=20000, max_bytes=4 * 1024 * 1024)
+_failed_logins = create_cache('echecs_connexion', max_entries=20000, max_bytes=4 * 1024 * 1024)
 _blocked_ips = set()
-_suspicious_activities = defaultdict(list)
+# Activités suspectes : les dernières par IP (deque bornée) et un tas (horodatage, IP) qui ne
+# contient qu'une entrée par IP suivie : la date de sa plus ancienne activité encore conservée
+_suspicious_activities = defaultdict(lambda: deque(maxlen=SUSPICIOUS_ACTIVITY_THRESHOLD))
+_suspicious_expiry = []
+_security_storage_lock = threading.Lock()
+_last_counter_purge = 0.0
 _session_tokens = {}
-_security_logs = []  # Store security logs in memory
+
+# Attack patterns, matched against the lowercased input in a single scan (see scan_attacks).
+# Every pattern starts with a literal character so that the regex engine only tries the
+# alternation at positions that can start a match; a leading word boundary is therefore
+# written as a lookbehind after the first letter (u(?<!\wu)nion == \bunion).
 
 # SQL injection patterns - Plus précis
 SQL_INJECTION_PATTERNS = [
-    r"(\\'|(\\\\)+\')|(--;)|(-\s*-)",  # SQL comments et échappements 
-    r"\b(union\s+select|union\s+all\s+select)\b",  # UNION attacks
-    r"\b(drop\s+table|drop\s+database|truncate\s+table)\b",  # Destructive operations
-    r"\b(exec\s*\(|execute\s*\(|sp_executesql)\b",  # Stored procedures
-    r"(0x[0-9a-fA-F]+)|(\bhex\s*\()",  # Hex encoding
-    r"(\bor\s+1\s*=\s*1)|(\band\s+1\s*=\s*0)",  # Boolean SQL injection
-    r"(script.*?/script)|(javascript\s*:)|(vbscript\s*:)",  # Script injections
-    r"(eval\s*\(.*?\))|(expression\s*\(.*?\))",  # Code execution
+    r"\\\\*'", r"--;", r"-\s*-",  # SQL comments et échappements
+    r"u(?<!\wu)nion\s+(?:all\s+)?select\b",  # UNION attacks
+    r"d(?<!\wd)rop\s+(?:table|database)\b", r"t(?<!\wt)runcate\s+table\b",  # Destructive operations
+    r"e(?<!\we)xec(?:ute)?\s*\(\b", r"s(?<!\ws)p_executesql\b",  # Stored procedures
+    r"0x[0-9a-f]+", r"h(?<!\wh)ex\s*\(",  # Hex encoding
+    r"o(?<!\wo)r\s+1\s*=\s*1", r"a(?<!\wa)nd\s+1\s*=\s*0",  # Boolean SQL injection
+    r"script.*?/script", r"javascript\s*:", r"vbscript\s*:",  # Script injections
+    r"eval\s*\(.*?\)", r"expression\s*\(.*?\)",  # Code execution
 ]
 
 # XSS patterns
@@ -51,40 +69,61 @@ XSS_PATTERNS = [
     r"<meta[^>]*>",
 ]
 
+# Other dangerous patterns, stripped by sanitize_input without being reported
+ADDITIONAL_PATTERNS = [
+    r"eval\s*\(",
+    r"expression\s*\(",
+    r"url\s*\(",
+    r"@import",
+    r"\\x[0-9a-f]+",
+    r"&#[0-9]+;",
+]
+
+# One alternation per category, and all of them combined: at a given position the SQL
+# patterns are tried first, then XSS, then the additional ones. Named groups would tell
+# which pattern matched but prevent the first-character skipping, so the category of a
+# match is found afterwards with an anchored match of the category regexes.
+_SQL_INJECTION_RE = re.compile('|'.join(SQL_INJECTION_PATTERNS))
+_XSS_RE = re.compile('|'.join(XSS_PATTERNS))
+_ATTACK_RE = re.compile('|'.join(SQL_INJECTION_PATTERNS + XSS_PATTERNS + ADDITIONAL_PATTERNS))
+_ATTACK_LABELS = {
+    'sql': ('SQL_INJECTION_ATTEMPT', 'SQL injection'),
+    'xss': ('XSS_ATTEMPT', 'XSS'),
+}
+
 # Security configuration - Made less restrictive
 MAX_LOGIN_ATTEMPTS = 8  # Increased from 5 to 8 attempts
 LOGIN_LOCKOUT_DURATION = 15  # Reduced from 30 to 15 minutes
 SUSPICIOUS_ACTIVITY_THRESHOLD = 15  # Increased from 10 to 15
 AUTO_BLOCK_DURATION = 30  # Reduced from 60 to 30 minutes
+SUSPICIOUS_ACTIVITY_WINDOW = timedelta(hours=24)
+COUNTER_PURGE_INTERVAL = 5  # seconds between purges of the expired request/login counters
 
 def clean_security_storage():
-    """Clean expired security entries"""
-    now = datetime.now()
-    
-    # Clean rate limit storage
-    expired_keys = [
-        key for key, (count, timestamp) in _rate_limit_storage.items()
-        if now - timestamp > timedelta(minutes=15)
-    ]
-    for key in expired_keys:
-        del _rate_limit_storage[key]
-    
-    # Clean failed login attempts
-    expired_attempts = [
-        ip for ip, data in _failed_login_attempts.items()
-        if isinstance(data, dict) and now - data.get('timestamp', now) > timedelta(minutes=LOGIN_LOCKOUT_DURATION)
-    ]
-    for ip in expired_attempts:
-        del _failed_login_attempts[ip]
-    
-    # Clean suspicious activities
-    for ip in list(_suspicious_activities.keys()):
-        _suspicious_activities[ip] = [
-            activity for activity in _suspicious_activities[ip]
-            if now - activity['timestamp'] < timedelta(hours=24)
-        ]
-        if not _suspicious_activities[ip]:
-            del _suspicious_activities[ip]
+    """Clean expired security entries (only the expired ones are visited)"""
+    global _last_counter_purge
+    cutoff = datetime.now() - SUSPICIOUS_ACTIVITY_WINDOW
+    
+    # Clean suspicious activities: pop the expired IPs from the heap, re-arm those still active
+    with _security_storage_lock:
+        while _suspicious_expiry and _suspicious_expiry[0][0] < cutoff:
+            _, ip = heapq.heappop(_suspicious_expiry)
+            activities = _suspicious_activities.get(ip)
+            if activities is None:
+                continue
+            while activities and activities[0]['timestamp'] < cutoff:
+                activities.popleft()
+            if activities:
+                heapq.heappush(_suspicious_expiry, (activities[0]['timestamp'], ip))
+            else:
+                del _suspicious_activities[ip]
+    
+    # Request and login counters: expiry-ordered purge, throttled for shared backends
+    now = time.monotonic()
+    if now - _last_counter_purge >= COUNTER_PURGE_INTERVAL:
+        _last_counter_purge = now
+        _rate_limits.purge_expired()
+        _failed_logins.purge_expired()
 
 def get_client_ip():
     """Get the real client IP address"""
@@ -96,21 +135,25 @@ def get_client_ip():
     return request.environ.get('REMOTE_ADDR', 'unknown')
 
 def is_ip_blocked(ip):
-    """Check if IP is blocked - but never block whitelisted IPs"""
-    from models import IPBlock, IPWhitelist
-    
-    # Check whitelist first
-    if IPWhitelist.is_ip_whitelisted(ip):
-        return False
-    
-    return IPBlock.is_ip_blocked(ip)
+    """Check if IP is blocked - but never block whitelisted IPs (addresses or CIDR ranges)"""
+    try:
+        # In-memory index, reloaded when the block/whitelist version changes
+        if ip_access_index.is_whitelisted(ip):
+            return False
+        return ip_access_index.is_blocked(ip)
+    except Exception as e:
+        logging.error(f"IP index unavailable, checking database: {e}")
+        from models import IPBlock, IPWhitelist
+        if IPWhitelist.is_ip_whitelisted(ip):
+            return False
+        return IPBlock.is_ip_blocked(ip)
 
 def block_ip(ip, duration_minutes=AUTO_BLOCK_DURATION):
     """Block an IP address temporarily using database storage - but never block whitelisted IPs"""
-    from models import IPBlock, IPWhitelist
+    from models import IPBlock
     
     # Never block whitelisted IPs
-    if IPWhitelist.is_ip_whitelisted(ip):
+    if ip_access_index.is_whitelisted(ip):
         logging.info(f"IP {ip} is whitelisted, skipping block")
         return False
     
@@ -127,26 +170,66 @@ def block_ip(ip, duration_minutes=AUTO_BLOCK_DURATION):
 def log_suspicious_activity(ip, activity_type, details=""):
     """Log suspicious activity"""
     now = datetime.now()
-    _suspicious_activities[ip].append({
-        'timestamp': now,
-        'type': activity_type,
-        'details': details,
-        'user_agent': request.headers.get('User-Agent', 'Unknown')
-    })
+    with _security_storage_lock:
+        if ip not in _suspicious_activities:
+            heapq.heappush(_suspicious_expiry, (now, ip))
+        activities = _suspicious_activities[ip]
+        activities.append({
+            'timestamp': now,
+            'type': activity_type,
+            'details': details,
+            'user_agent': request.headers.get('User-Agent', 'Unknown')
+        })
+        count = len(activities)
     
     # Auto-block if too many suspicious activities
-    if len(_suspicious_activities[ip]) >= SUSPICIOUS_ACTIVITY_THRESHOLD:
+    if count >= SUSPICIOUS_ACTIVITY_THRESHOLD:
         block_ip(ip)
         logging.warning(f"IP auto-blocked due to suspicious activity: {ip}")
 
-def rate_limit(max_requests=10, per_minutes=15):
-    """Enhanced rate limiting decorator with IP blocking"""
+def check_rate_limit(key, max_requests, window_seconds, now=None):
+    """Sliding-window limiter shared by all workers (CACHE_BACKEND); returns (allowed, retry_after)
+    
+    The count is the current fixed window plus the previous one weighted by the part of it
+    still inside the sliding window. Updates are atomic increments; a rejected request is
+    not counted.
+    """
+    now = time.time() if now is None else now
+    window_index = int(now // window_seconds)
+    elapsed = now - window_index * window_seconds
+    current_key = f"{key}:{window_index}"
+    
+    count = _rate_limits.incr(current_key, ttl=2 * window_seconds)
+    previous = _rate_limits.get(f"{key}:{window_index - 1}") or 0
+    if previous * (1 - elapsed / window_seconds) + count <= max_requests:
+        return True, 0
+    
+    _rate_limits.incr(current_key, -1, ttl=2 * window_seconds)
+    return False, _retry_after(previous, count - 1, max_requests, window_seconds, elapsed)
+
+def _retry_after(previous, accepted, max_requests, window_seconds, elapsed):
+    """Seconds until one more request fits in the sliding window"""
+    if accepted + 1 <= max_requests:
+        # The weight of the previous window has to decrease
+        wait = window_seconds * (1 - (max_requests - accepted - 1) / previous) - elapsed
+    else:
+        # Wait for the next window, then for the current one to fade out
+        wait = window_seconds - elapsed + window_seconds * (1 - (max_requests - 1) / accepted)
+    return max(1, math.ceil(wait))
+
+def rate_limit(max_requests=10, per_minutes=15, group=None):
+    """Enhanced rate limiting decorator with IP blocking
+    
+    Limits apply per route group (the view name by default) and per user/IP; a rejected
+    request gets a 429 with Retry-After.
+    """
     def decorator(f):
+        limit_group = group or f.__name__
+        
         @wraps(f)
         def decorated_function(*args, **kwargs):
             if not current_app.config.get('TESTING', False):
-                clean_security_storage()
-                
+                # Expired entries are cleaned once per request in app.before_request
                 client_ip = get_client_ip()
                 
                 # Check if IP is blocked
@@ -160,87 +243,78 @@ def rate_limit(max_requests=10, per_minutes=15):
                     client_id = f"user_{current_user.id}_{client_ip}"
                 
                 # Check rate limit
-                now = datetime.now()
-                if client_id in _rate_limit_storage:
-                    count, first_request = _rate_limit_storage[client_id]
-                    if now - first_request < timedelta(minutes=per_minutes):
-                        if count >= max_requests:
-                            log_suspicious_activity(client_ip, "RATE_LIMIT_EXCEEDED", 
-                                                  f"Exceeded {max_requests} requests in {per_minutes} minutes")
-                            logging.warning(f"Rate limit exceeded for {client_id}")
-                            abort(429)
-                        _rate_limit_storage[client_id] = (count + 1, first_request)
-                    else:
-                        _rate_limit_storage[client_id] = (1, now)
-                else:
-                    _rate_limit_storage[client_id] = (1, now)
+                allowed, retry_after = check_rate_limit(f"{limit_group}:{client_id}", max_requests,
+                                                        per_minutes * 60)
+                if not allowed:
+                    log_suspicious_activity(client_ip, "RATE_LIMIT_EXCEEDED", 
+                                          f"Exceeded {max_requests} requests in {per_minutes} minutes "
+                                          f"({limit_group})")
+                    logging.warning(f"Rate limit exceeded for {client_id} on {limit_group}")
+                    abort(429, retry_after=retry_after)
             
             return f(*args, **kwargs)
         return decorated_function
     return decorator
 
+def _lowercase(text):
+    """Lowercased text with the same length, so that match positions apply to the original"""
+    lowered = text.lower()
+    if len(lowered) != len(text):
+        # A few characters lowercase to several (İ -> i + combining dot): keep the last one,
+        # which is not a word character either way
+        lowered = ''.join(char.lower()[-1] for char in text)
+    return lowered
+
 def detect_sql_injection(input_text):
     """Detect potential SQL injection attempts"""
     if not input_text:
         return False
-    
-    input_lower = input_text.lower()
-    for pattern in SQL_INJECTION_PATTERNS:
-        if re.search(pattern, input_lower, re.IGNORECASE):
-            return True
-    return False
+    return _SQL_INJECTION_RE.search(_lowercase(input_text)) is not None
 
 def detect_xss_attack(input_text):
     """Detect potential XSS attacks"""
     if not input_text:
         return False
-    
-    for pattern in XSS_PATTERNS:
-        if re.search(pattern, input_text, re.IGNORECASE):
-            return True
-    return False
+    return _XSS_RE.search(_lowercase(input_text)) is not None
+
+def scan_attacks(text):
+    """Strip every dangerous pattern in a single scan; returns (cleaned text, detected categories)
+    
+    Categories are 'sql' and 'xss'; ADDITIONAL_PATTERNS are stripped without being reported.
+    """
+    lowered = _lowercase(text)
+    detected = set()
+    parts = []
+    position = 0
+    for match in _ATTACK_RE.finditer(lowered):
+        start, end = match.span()
+        if _SQL_INJECTION_RE.match(lowered, start):
+            detected.add('sql')
+        elif _XSS_RE.match(lowered, start):
+            detected.add('xss')
+        parts.append(text[position:start])
+        position = end
+    if position == 0:
+        return text, detected
+    parts.append(text[position:])
+    return ''.join(parts), detected
 
 def sanitize_input(text, strict=False):
     """Enhanced input sanitization with attack detection"""
     if not text:
         return text
     
-    client_ip = get_client_ip()
-    
-    # Detect SQL injection
-    if detect_sql_injection(text):
-        log_suspicious_activity(client_ip, "SQL_INJECTION_ATTEMPT", f"Detected in: {text[:100]}")
-        logging.warning(f"SQL injection attempt from {client_ip}: {text[:100]}")
-        if strict:
-            abort(400)  # Bad Request
-        # Remove dangerous SQL patterns
-        for pattern in SQL_INJECTION_PATTERNS:
-            text = re.sub(pattern, '', text, flags=re.IGNORECASE)
-    
-    # Detect XSS
-    if detect_xss_attack(text):
-        log_suspicious_activity(client_ip, "XSS_ATTEMPT", f"Detected in: {text[:100]}")
-        logging.warning(f"XSS attempt from {client_ip}: {text[:100]}")
+    cleaned, detected = scan_attacks(text)
+    if detected:
+        client_ip = get_client_ip()
+        for category in sorted(detected):
+            activity, label = _ATTACK_LABELS[category]
+            log_suspicious_activity(client_ip, activity, f"Detected in: {text[:100]}")
+            logging.warning(f"{label} attempt from {client_ip}: {text[:100]}")
         if strict:
             abort(400)  # Bad Request
-        # Remove dangerous XSS patterns
-        for pattern in XSS_PATTERNS:
-            text = re.sub(pattern, '', text, flags=re.IGNORECASE)
-    
-    # Additional dangerous patterns
-    additional_patterns = [
-        r'eval\s*\(',
-        r'expression\s*\(',
-        r'url\s*\(',
-        r'@import',
-        r'\\x[0-9a-fA-F]+',
-        r'&#[0-9]+;',
-    ]
-    
-    for pattern in additional_patterns:
-        text = re.sub(pattern, '', text, flags=re.IGNORECASE)
     
-    return text.strip()
+    return cleaned.strip()
 
 def validate_file_upload(file):
     """Validate uploaded files for security"""
@@ -299,36 +373,35 @@ def check_permission(permission_required, redirect_route='dashboard'):
 
 def record_failed_login(ip, username=""):
     """Record failed login attempt"""
-    now = datetime.now()
-    
-    if ip not in _failed_login_attempts:
-        _failed_login_attempts[ip] = {'count': 0, 'timestamp': now, 'usernames': set()}
-    
-    _failed_login_attempts[ip]['count'] += 1
-    _failed_login_attempts[ip]['timestamp'] = now
+    count = _failed_logins.incr(ip, ttl=LOGIN_LOCKOUT_DURATION * 60)
     if username:
-        _failed_login_attempts[ip]['usernames'].add(username)
+        logging.info(f"Failed login attempt {count} from {ip} for '{username}'")
     
     # Auto-block after too many failures
-    if _failed_login_attempts[ip]['count'] >= MAX_LOGIN_ATTEMPTS:
+    if count >= MAX_LOGIN_ATTEMPTS:
         block_ip(ip, LOGIN_LOCKOUT_DURATION)
         log_suspicious_activity(ip, "BRUTE_FORCE_LOGIN", 
-                              f"Too many failed login attempts: {_failed_login_attempts[ip]['count']}")
+                              f"Too many failed login attempts: {count}")
         return True  # Blocked
     
     return False  # Not blocked yet
 
 def is_login_locked(ip):
     """Check if login is locked for this IP"""
-    if ip in _failed_login_attempts:
-        attempts_data = _failed_login_attempts[ip]
-        return attempts_data.get('count', 0) >= MAX_LOGIN_ATTEMPTS
-    return False
+    return (_failed_logins.get(ip) or 0) >= MAX_LOGIN_ATTEMPTS
 
 def reset_failed_login_attempts(ip):
     """Reset failed login attempts for IP (on successful login)"""
-    if ip in _failed_login_attempts:
-        del _failed_login_attempts[ip]
+    _failed_logins.delete(ip)
+
+def clear_failed_login_attempts():
+    """Reset failed login attempts for all IPs"""
+    _failed_logins.clear()
+
+def count_failed_login_ips():
+    """Number of IPs with recent failed login attempts"""
+    _failed_logins.purge_expired()
+    return _failed_logins.stats().get('entries', 0)
 
 def validate_password_strength(password):
     """Enhanced password strength validation"""
@@ -407,9 +480,6 @@ def validate_password_strength(password):
 def log_security_event(event_type, description, user_id=None, ip_address=None):
     """Log security events"""
     try:
-        from app import db
-        from models import LogActivite
-        
         if not ip_address:
             ip_address = request.environ.get('HTTP_X_FORWARDED_FOR', request.environ.get('REMOTE_ADDR'))
         
@@ -417,13 +487,8 @@ def log_security_event(event_type, description, user_id=None, ip_address=None):
             user_id = current_user.id
         
         if user_id:  # Only log if we have a user
-            log = LogActivite()
-            log.utilisateur_id = user_id
-            log.action = f"SECURITY_{event_type}"
-            log.description = description
-            log.ip_address = ip_address
-            db.session.add(log)
-            db.session.commit()
+            queue_log('LogActivite', utilisateur_id=user_id, action=f"SECURITY_{event_type}",
+                      description=description, ip_address=ip_address)
             
     except Exception as e:
         logging.error(f"Failed to log security event: {e}")
@@ -568,36 +633,21 @@ def audit_log(action, details="", severity="INFO"):
             f"AUDIT: {json.dumps(audit_entry)}"
         )
         
-        # Store in memory for web interface
-        from datetime import datetime as dt
-        security_log_entry = {
-            "timestamp": dt.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "level": severity,
-            "event_type": action,
-            "message": details,
-            "username": current_user.username if current_user and current_user.is_authenticated else "SYSTEM",
-            "ip_address": client_ip,
-            "source": "GEC_AUDIT"
-        }
-        _security_logs.append(security_log_entry)
-        
-        # Keep only last 1000 logs in memory
-        if len(_security_logs) > 1000:
-            _security_logs.pop(0)
+        # Store in memory for web interface (ring buffer of the last SECURITY_LOG_CAPACITY entries)
+        security_log_store.append(
+            level=severity,
+            event_type=action,
+            message=details,
+            username=current_user.username if current_user and current_user.is_authenticated else "SYSTEM",
+            ip_address=client_ip,
+            source="GEC_AUDIT"
+        )
         
-        # Store in database if possible
+        # Store in database if possible (batched by the background log writer)
         try:
-            from app import db
-            from models import LogActivite
-            
             if current_user.is_authenticated:
-                log = LogActivite()
-                log.utilisateur_id = current_user.id
-                log.action = f"AUDIT_{action}"
-                log.description = details
-                log.ip_address = client_ip
-                db.session.add(log)
-                db.session.commit()
+                queue_log('LogActivite', utilisateur_id=current_user.id, action=f"AUDIT_{action}",
+                          description=details, ip_address=client_ip)
         except Exception as db_e:
             logging.error(f"Failed to store audit log in database: {db_e}")
             
@@ -625,11 +675,8 @@ def add_security_headers(response):
         "camera=(), microphone=(), geolocation=(), "
         "accelerometer=(), gyroscope=(), magnetometer=()"
     )
-    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-    response.headers['Pragma'] = 'no-cache'
-    response.headers['Expires'] = '0'
-    
-    return response
+    # Cache-Control selon la politique de la route (no-store par défaut)
+    return apply_cache_policy(response)
 
 def require_https():
     """Require HTTPS for sensitive operations"""
@@ -638,53 +685,26 @@ def require_https():
     return None
 
 def get_security_logs(filters=None):
-    """Get security logs with filtering and pagination"""
-    logs = _security_logs.copy()
-    
-    if filters:
-        # Filter by level
-        if filters.get('level'):
-            logs = [log for log in logs if log['level'] == filters['level']]
-        
-        # Filter by event type
-        if filters.get('event_type'):
-            logs = [log for log in logs if log['event_type'] == filters['event_type']]
-        
-        # Filter by date range
-        if filters.get('date_start'):
-            from datetime import datetime
-            start_date = datetime.strptime(filters['date_start'], '%Y-%m-%d').date()
-            logs = [log for log in logs if datetime.strptime(log['timestamp'], '%Y-%m-%d %H:%M:%S').date() >= start_date]
-        
-        if filters.get('date_end'):
-            from datetime import datetime
-            end_date = datetime.strptime(filters['date_end'], '%Y-%m-%d').date()
-            logs = [log for log in logs if datetime.strptime(log['timestamp'], '%Y-%m-%d %H:%M:%S').date() <= end_date]
-    
-    # Sort by timestamp (newest first)
-    logs.sort(key=lambda x: x['timestamp'], reverse=True)
-    
-    # Pagination
-    page = filters.get('page', 1) if filters else 1
-    per_page = filters.get('per_page', 50) if filters else 50
-    
-    total = len(logs)
-    start = (page - 1) * per_page
-    end = start + per_page
-    paginated_logs = logs[start:end]
-    
-    # Create mock log objects for template
-    class MockLog:
-        def __init__(self, data):
-            from datetime import datetime
-            self.timestamp = datetime.strptime(data['timestamp'], '%Y-%m-%d %H:%M:%S')
-            self.level = data['level']
-            self.event_type = data['event_type']
-            self.message = data['message']
-            self.username = data.get('username')
-            self.ip_address = data.get('ip_address')
-    
-    mock_logs = [MockLog(log) for log in paginated_logs]
+    """Get security logs with filtering and pagination (indexed ring buffer, newest first)"""
+    filters = filters or {}
+    page = filters.get('page', 1)
+    per_page = filters.get('per_page', 50)
+    
+    # Date range as epoch bounds: start of date_start, start of the day after date_end
+    start_epoch = end_epoch = None
+    if filters.get('date_start'):
+        start_epoch = datetime.strptime(filters['date_start'], '%Y-%m-%d').timestamp()
+    if filters.get('date_end'):
+        end_epoch = (datetime.strptime(filters['date_end'], '%Y-%m-%d') + timedelta(days=1)).timestamp()
+    
+    total, logs = security_log_store.query(
+        level=filters.get('level') or None,
+        event_type=filters.get('event_type') or None,
+        start_epoch=start_epoch,
+        end_epoch=end_epoch,
+        offset=(page - 1) * per_page,
+        limit=per_page
+    )
     
     # Mock pagination object
     class MockPagination:
@@ -709,19 +729,17 @@ def get_security_logs(filters=None):
     pagination = MockPagination(page, per_page, total)
     
     return {
-        'logs': mock_logs,
+        'logs': logs,
         'pagination': pagination
     }
 
 def get_security_stats():
-    """Get security statistics"""
-    logs = _security_logs
-    
+    """Get security statistics (running counts of the in-memory security log)"""
     stats = {
-        'successful_logins': len([log for log in logs if log['event_type'] == 'LOGIN_SUCCESS']),
-        'failed_logins': len([log for log in logs if log['event_type'] == 'LOGIN_FAILED']),
-        'blocked_ips': len([log for log in logs if log['event_type'] == 'LOGIN_BLOCKED']),
-        'encrypted_files': len([log for log in logs if log['event_type'] == 'FILE_ENCRYPTED']),
+        'successful_logins': security_log_store.count_event('LOGIN_SUCCESS'),
+        'failed_logins': security_log_store.count_event('LOGIN_FAILED'),
+        'blocked_ips': security_log_store.count_event('LOGIN_BLOCKED'),
+        'encrypted_files': security_log_store.count_event('FILE_ENCRYPTED'),
     }
     
     return stats
\ No newline at end of file
@@ -0,0 +1,174 @@
+"""
+Fichiers statiques : empreintes de contenu, bundles et variantes précompressées
+Au démarrage, les fichiers de static/ sont hachés (empreinte ajoutée à l'URL par static_url(),
+ce qui permet un cache navigateur "immutable"), les bundles sont assemblés et des variantes
+gzip/brotli sont écrites à côté des fichiers texte. Le handler static sert la variante
+compressée acceptée par le navigateur.
+"""
+import os
+import gzip
+import hashlib
+import logging
+import mimetypes
+from flask import request, url_for, send_from_directory, current_app
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+except ImportError:  # brotli est optionnel : seules les variantes gzip sont produites
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.json', '.svg', '.html', '.txt', '.map', '.xml'}
+COMPRESS_MIN_SIZE = 1024     # en dessous, l'en-tête de compression coûte plus qu'il ne rapporte
+FINGERPRINT_LENGTH = 12
+
+# Variantes précompressées : encodage HTTP -> suffixe de fichier, par ordre de préférence
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+# Bundles chargés par les pages : nom -> fichiers concaténés dans static/dist/
+BUNDLE_FOLDER = 'dist'
+BUNDLES = {
+    'base.js': [
+        'vendor/jquery/jquery-3.7.1.min.js',
+        'vendor/datatables/jquery.dataTables.min.js',
+    ],
+}
+
+# Feuille Tailwind purgée produite par build_static.py (à défaut : compilation dans le navigateur)
+TAILWIND_CSS = 'css/tailwind.min.css'
+
+_manifest = {}   # chemin relatif -> empreinte du contenu
+_bundles = {}    # nom du bundle -> chemin relatif du fichier assemblé
+
+def prepare_static_assets(static_folder):
+    """Assemble les bundles, écrit les variantes compressées et calcule les empreintes"""
+    _bundles.clear()
+    for name, members in BUNDLES.items():
+        try:
+            _bundles[name] = build_bundle(static_folder, name, members)
+        except OSError as e:
+            logging.warning(f"Bundle statique {name} non construit: {e}")
+
+    manifest = {}
+    for root, _, files in os.walk(static_folder):
+        for filename in files:
+            if filename.endswith(tuple(suffix for _, suffix in ENCODINGS)) or filename.endswith('.tmp'):
+                continue
+            path = os.path.join(root, filename)
+            relative = os.path.relpath(path, static_folder).replace(os.sep, '/')
+            with open(path, 'rb') as f:
+                data = f.read()
+            manifest[relative] = hashlib.sha256(data).hexdigest()[:FINGERPRINT_LENGTH]
+            if os.path.splitext(filename)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+                try:
+                    compress_variants(path, data)
+                except OSError as e:
+                    logging.warning(f"Variantes compressées de {relative} non écrites: {e}")
+
+    _manifest.clear()
+    _manifest.update(manifest)
+    return len(manifest)
+
+def build_bundle(static_folder, name, members):
+    """Concatène les fichiers du bundle dans static/dist/<name> ; retourne son chemin relatif"""
+    separator = b'\n;\n' if name.endswith('.js') else b'\n'
+    parts = []
+    for member in members:
+        with open(os.path.join(static_folder, member), 'rb') as f:
+            parts.append(f.read().rstrip())
+    content = separator.join(parts) + b'\n'
+
+    relative = f"{BUNDLE_FOLDER}/{name}"
+    path = os.path.join(static_folder, BUNDLE_FOLDER, name)
+    if not _same_content(path, content):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_atomic(path, content)
+    return relative
+
+def compress_variants(path, data):
+    """Écrit path.gz (et path.br si brotli est installé) lorsqu'ils sont absents ou périmés"""
+    if len(data) < COMPRESS_MIN_SIZE:
+        return
+    source_mtime = os.path.getmtime(path)
+    for encoding, suffix in ENCODINGS:
+        target = path + suffix
+        if os.path.exists(target) and os.path.getmtime(target) >= source_mtime:
+            continue
+        if encoding == 'br':
+            if brotli is None:
+                continue
+            compressed = brotli.compress(data, quality=11)
+        else:
+            compressed = gzip.compress(data, compresslevel=9, mtime=0)
+        if len(compressed) < len(data):
+            _write_atomic(target, compressed)
+
+def static_url(filename):
+    """URL d'un fichier statique avec l'empreinte de son contenu (?v=...)"""
+    fingerprint = _manifest.get(filename)
+    if fingerprint:
+        return url_for('static', filename=filename, v=fingerprint)
+    return url_for('static', filename=filename)
+
+def static_bundle(name):
+    """URLs à charger pour un bundle : le fichier assemblé, ou ses membres s'il n'a pu être construit"""
+    if name in _bundles:
+        return [static_url(_bundles[name])]
+    return [static_url(member) for member in BUNDLES[name]]
+
+def tailwind_stylesheet():
+    """URL de la feuille Tailwind purgée, None si elle n'a pas été générée"""
+    return static_url(TAILWIND_CSS) if TAILWIND_CSS in _manifest else None
+
+def send_static_precompressed(filename):
+    """Handler static : variante brotli/gzip si le navigateur l'accepte et qu'elle est à jour"""
+    static_folder = current_app.static_folder
+    source = safe_join(static_folder, filename)
+    if source and filename in _manifest:
+        for encoding, suffix in ENCODINGS:
+            if request.accept_encodings[encoding] <= 0:
+                continue
+            variant = source + suffix
+            try:
+                if os.path.getmtime(variant) < os.path.getmtime(source):
+                    continue
+            except OSError:
+                continue
+            mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+            response = send_from_directory(static_folder, filename + suffix, mimetype=mimetype)
+            response.headers['Content-Encoding'] = encoding
+            response.vary.add('Accept-Encoding')
+            return response
+
+    response = current_app.send_static_file(filename)
+    response.vary.add('Accept-Encoding')
+    return response
+
+def init_static_assets(app):
+    """Prépare les fichiers statiques et installe static_url() et le handler précompressé"""
+    try:
+        count = prepare_static_assets(app.static_folder)
+        logging.info(f"Fichiers statiques préparés: {count} empreinte(s)")
+    except Exception as e:
+        logging.warning(f"Préparation des fichiers statiques impossible: {e}")
+
+    app.jinja_env.globals.update(
+        static_url=static_url,
+        static_bundle=static_bundle,
+        tailwind_stylesheet=tailwind_stylesheet,
+    )
+    app.view_functions['static'] = send_static_precompressed
+
+def _same_content(path, content):
+    try:
+        with open(path, 'rb') as f:
+            return f.read() == content
+    except OSError:
+        return False
+
+def _write_atomic(path, content):
+    """Écrit via un fichier temporaire : plusieurs workers peuvent démarrer en même temps"""
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'wb') as f:
+        f.write(content)
+    os.replace(temporary, path)
@@ -0,0 +1,177 @@
+"""
+Statistiques quotidiennes agrégées des courriers (table courrier_daily_stats)
+Une ligne par (jour, type, statut, département, type de courrier sortant), maintenue
+dans la même transaction que le courrier par les événements du modèle Courrier
+"""
+import logging
+from datetime import datetime, date
+from sqlalchemy import text, bindparam, func, Date
+
+STATS_TABLE = 'courrier_daily_stats'
+
+# Attributs du courrier qui déterminent sa contribution aux statistiques
+STATS_ATTRIBUTES = [
+    'date_enregistrement', 'date_redaction', 'type_courrier', 'statut',
+    'owner_departement_id', 'type_courrier_sortant_id', 'is_deleted',
+]
+
+_UPSERT_SQL = text(f"""
+    INSERT INTO {STATS_TABLE} (jour, type_courrier, statut, departement_id, type_courrier_sortant_id,
+                               nombre, delai_total_jours)
+    VALUES (:jour, :type_courrier, :statut, :departement_id, :type_courrier_sortant_id,
+            :nombre, :delai_total_jours)
+    ON CONFLICT (jour, type_courrier, statut, departement_id, type_courrier_sortant_id)
+    DO UPDATE SET nombre = {STATS_TABLE}.nombre + excluded.nombre,
+                  delai_total_jours = {STATS_TABLE}.delai_total_jours + excluded.delai_total_jours
+""").bindparams(bindparam('jour', type_=Date))
+
+_PURGE_SQL = text(f"DELETE FROM {STATS_TABLE} WHERE nombre <= 0")
+
+def courrier_stats_contribution(values):
+    """Clé et délai de traitement d'un courrier, None s'il n'est pas compté (supprimé)
+
+    Le délai (en jours) va de la date de rédaction à l'enregistrement, 0 sans date de rédaction.
+    """
+    date_enregistrement = values.get('date_enregistrement')
+    if values.get('is_deleted') or date_enregistrement is None:
+        return None
+
+    jour = date_enregistrement.date() if isinstance(date_enregistrement, datetime) else date_enregistrement
+    date_redaction = values.get('date_redaction')
+    if isinstance(date_redaction, datetime):
+        date_redaction = date_redaction.date()
+    delai = (jour - date_redaction).days if isinstance(date_redaction, date) else 0
+
+    key = (
+        jour,
+        values.get('type_courrier') or '',
+        values.get('statut') or '',
+        values.get('owner_departement_id') or 0,
+        values.get('type_courrier_sortant_id') or 0,
+    )
+    return key, delai
+
+def apply_stats_deltas(connection, deltas):
+    """Applique des variations {clé: [nombre, délai]} à la table agrégée"""
+    rows = []
+    for (jour, type_courrier, statut, departement_id, type_courrier_sortant_id), (nombre, delai) in deltas.items():
+        if nombre == 0 and delai == 0:
+            continue
+        rows.append({
+            'jour': jour,
+            'type_courrier': type_courrier,
+            'statut': statut,
+            'departement_id': departement_id,
+            'type_courrier_sortant_id': type_courrier_sortant_id,
+            'nombre': nombre,
+            'delai_total_jours': delai,
+        })
+    if not rows:
+        return
+    connection.execute(_UPSERT_SQL, rows)
+    if any(row['nombre'] < 0 for row in rows):
+        connection.execute(_PURGE_SQL)
+
+def add_contribution(deltas, contribution, sign):
+    """Ajoute (sign=1) ou retire (sign=-1) la contribution d'un courrier aux variations"""
+    if contribution is None:
+        return
+    key, delai = contribution
+    entry = deltas.setdefault(key, [0, 0])
+    entry[0] += sign
+    entry[1] += sign * delai
+
+def rebuild_daily_stats(engine, batch_size=5000):
+    """Recalcule tout l'historique de la table agrégée et retourne le nombre de lignes produites"""
+    columns = ', '.join(STATS_ATTRIBUTES)
+    select_sql = text(
+        f"SELECT id, {columns} FROM courrier WHERE id > :last_id AND is_deleted = :deleted "
+        "ORDER BY id LIMIT :batch_size"
+    )
+    date_columns = {'date_enregistrement': datetime, 'date_redaction': date}
+
+    deltas = {}
+    last_id = 0
+    with engine.connect() as connection:
+        while True:
+            rows = connection.execute(select_sql, {"last_id": last_id, "deleted": False,
+                                                   "batch_size": batch_size}).fetchall()
+            if not rows:
+                break
+            for row in rows:
+                values = dict(zip(STATS_ATTRIBUTES, row[1:]))
+                for name, kind in date_columns.items():
+                    values[name] = _parse_date(values[name], kind)
+                add_contribution(deltas, courrier_stats_contribution(values), 1)
+            last_id = rows[-1][0]
+
+        connection.execute(text(f"DELETE FROM {STATS_TABLE}"))
+        apply_stats_deltas(connection, deltas)
+        connection.commit()
+
+    return len(deltas)
+
+def ensure_daily_stats(engine):
+    """Construit la table agrégée si elle est vide alors que des courriers existent"""
+    try:
+        with engine.connect() as connection:
+            has_stats = connection.execute(text(f"SELECT 1 FROM {STATS_TABLE} LIMIT 1")).fetchone()
+            has_courriers = connection.execute(
+                text("SELECT 1 FROM courrier WHERE is_deleted = :deleted LIMIT 1"), {"deleted": False}
+            ).fetchone()
+        if has_courriers and not has_stats:
+            logging.info("Construction des statistiques quotidiennes des courriers...")
+            count = rebuild_daily_stats(engine)
+            logging.info(f"Statistiques quotidiennes construites: {count} ligne(s)")
+    except Exception as e:
+        logging.warning(f"Statistiques quotidiennes indisponibles: {e}")
+
+# ===== LECTURE =====
+
+def query_daily_stats(*group_by, start=None, end=None, **filters):
+    """Agrège la table journalière : une ligne (colonnes groupées..., nombre, delai_total_jours)
+
+    start/end bornent le jour (inclus) ; un filtre liste devient un IN.
+    """
+    from app import db
+    from models import CourrierDailyStats
+
+    columns = [getattr(CourrierDailyStats, name) for name in group_by]
+    query = db.session.query(
+        *columns,
+        func.coalesce(func.sum(CourrierDailyStats.nombre), 0).label('nombre'),
+        func.coalesce(func.sum(CourrierDailyStats.delai_total_jours), 0).label('delai_total_jours'),
+    )
+    if start is not None:
+        query = query.filter(CourrierDailyStats.jour >= start)
+    if end is not None:
+        query = query.filter(CourrierDailyStats.jour <= end)
+    for name, value in filters.items():
+        column = getattr(CourrierDailyStats, name)
+        query = query.filter(column.in_(value) if isinstance(value, (list, tuple, set)) else column == value)
+    if columns:
+        query = query.group_by(*columns).order_by(*columns)
+    return query.all()
+
+def month_starts(count, today=None):
+    """Premiers jours des `count` derniers mois calendaires, du plus ancien au mois courant"""
+    today = today or date.today()
+    year, month = today.year, today.month
+    starts = []
+    for _ in range(count):
+        starts.append(date(year, month, 1))
+        month -= 1
+        if month == 0:
+            year, month = year - 1, 12
+    starts.reverse()
+    return starts
+
+def _parse_date(value, kind):
+    """Les requêtes brutes SQLite retournent les dates sous forme de texte"""
+    if value is None or isinstance(value, (datetime, date)):
+        return value
+    try:
+        parsed = datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+    return parsed if kind is datetime else parsed.date()
@@ -0,0 +1,27 @@
+/** Configuration Tailwind pour la feuille purgée générée par build_static.py */
+module.exports = {
+  content: [
+    './templates/**/*.html',
+    './static/js/**/*.js',
+    // Classes définies en Python (models.py : statut_color, get_type_color ; views.py : couleurs_disponibles)
+    './*.py',
+  ],
+  // Couleurs des rôles et statuts enregistrées en base (Role.couleur, StatutCourrier.couleur) :
+  // elles n'apparaissent dans aucun fichier source une fois choisies par un administrateur
+  safelist: [
+    {
+      pattern: /^(bg|text)-(blue|green|yellow|red|purple|gray|indigo|pink)-(100|800)$/,
+    },
+  ],
+  theme: {
+    extend: {
+      colors: {
+        'rdc-blue': '#003087',
+        'rdc-yellow': '#FFD700',
+        'rdc-red': '#CE1126',
+        'rdc-green': '#009639'
+      }
+    }
+  },
+  plugins: [],
+}
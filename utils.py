@@ -1,9 +1,11 @@
 import os
 import uuid
 import json
+import time
 import logging
+import threading
 from datetime import datetime
-from flask import request, session
+from flask import request, session, g, has_request_context
 from reportlab.lib.pagesizes import A4, landscape
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
@@ -11,83 +13,19 @@ from reportlab.lib.units import inch
 from reportlab.lib import colors
 from reportlab.pdfgen import canvas
 
+from lang_utils import (DEFAULT_LANGUAGE_CONFIG, get_available_languages, get_all_languages, get_language_info,
+                        invalidate_language_cache)
+
 # Import moved to function level to avoid circular import
 # from models import LogActivite
 
 ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg', 'tiff', 'tif', 'svg'}
 
-# Configuration des langues par défaut (peut être étendue automatiquement)
-DEFAULT_LANGUAGE_CONFIG = {
-    'fr': {'name': 'Français', 'flag': '🇫🇷', 'enabled': True},
-    'en': {'name': 'English', 'flag': '🇺🇸', 'enabled': True},
-    'es': {'name': 'Español', 'flag': '🇪🇸', 'enabled': True},
-    'de': {'name': 'Deutsch', 'flag': '🇩🇪', 'enabled': True},
-    'it': {'name': 'Italiano', 'flag': '🇮🇹', 'enabled': False},
-    'pt': {'name': 'Português', 'flag': '🇵🇹', 'enabled': False},
-    'ar': {'name': 'العربية', 'flag': '🇸🇦', 'enabled': False},
-    'zh': {'name': '中文', 'flag': '🇨🇳', 'enabled': False},
-    'ja': {'name': '日本語', 'flag': '🇯🇵', 'enabled': False},
-    'ru': {'name': 'Русский', 'flag': '🇷🇺', 'enabled': False}
-}
-
-def get_available_languages():
-    """Retourne la liste des langues disponibles en détectant automatiquement les fichiers JSON"""
-    languages = {}
-    lang_dir = os.path.join(os.path.dirname(__file__), 'lang')
-    
-    if os.path.exists(lang_dir):
-        for filename in os.listdir(lang_dir):
-            if filename.endswith('.json'):
-                lang_code = filename[:-5]  # Remove .json
-                
-                # Utiliser la configuration par défaut si disponible, sinon générer automatiquement
-                if lang_code in DEFAULT_LANGUAGE_CONFIG:
-                    lang_config = DEFAULT_LANGUAGE_CONFIG[lang_code].copy()
-                    # Vérifier si la langue est activée
-                    if lang_config.get('enabled', True):
-                        languages[lang_code] = lang_config
-                else:
-                    # Génération automatique pour les nouvelles langues (activées par défaut)
-                    languages[lang_code] = {
-                        'name': lang_code.upper(),  # Nom par défaut
-                        'flag': '🌐',  # Drapeau générique
-                        'enabled': True
-                    }
-    
-    return languages
-
-def get_all_languages():
-    """Retourne toutes les langues (activées et désactivées)"""
-    languages = {}
-    lang_dir = os.path.join(os.path.dirname(__file__), 'lang')
-    
-    if os.path.exists(lang_dir):
-        for filename in os.listdir(lang_dir):
-            if filename.endswith('.json'):
-                lang_code = filename[:-5]  # Remove .json
-                
-                # Utiliser la configuration par défaut si disponible, sinon générer automatiquement
-                if lang_code in DEFAULT_LANGUAGE_CONFIG:
-                    languages[lang_code] = DEFAULT_LANGUAGE_CONFIG[lang_code].copy()
-                else:
-                    # Génération automatique pour les nouvelles langues
-                    languages[lang_code] = {
-                        'name': lang_code.upper(),  # Nom par défaut
-                        'flag': '🌐',  # Drapeau générique
-                        'enabled': True
-                    }
-    
-    return languages
-
-def get_language_info(lang_code):
-    """Obtient les informations d'une langue spécifique"""
-    available_languages = get_available_languages()
-    return available_languages.get(lang_code, {'name': lang_code.upper(), 'flag': '🌐'})
-
 def toggle_language_status(lang_code, enabled):
     """Active ou désactive une langue"""
     if lang_code in DEFAULT_LANGUAGE_CONFIG:
         DEFAULT_LANGUAGE_CONFIG[lang_code]['enabled'] = enabled
+        invalidate_language_cache()
         return True
     return False
 
@@ -113,6 +51,8 @@ def upload_language_file(lang_code, file_content):
         with open(lang_file, 'w', encoding='utf-8') as f:
             f.write(file_content)
         
+        invalidate_language_cache()
+        invalidate_translation_catalog()
         return True
     except (json.JSONDecodeError, Exception) as e:
         return False
@@ -123,13 +63,29 @@ def delete_language_file(lang_code):
     if os.path.exists(lang_file) and lang_code != 'fr':  # Ne pas supprimer le français
         try:
             os.remove(lang_file)
+            invalidate_language_cache()
+            invalidate_translation_catalog()
             return True
         except Exception:
             return False
     return False
 
 def get_current_language():
-    """Obtient la langue actuelle depuis la session, cookies ou les préférences utilisateur"""
+    """Obtient la langue actuelle depuis la session, cookies ou les préférences utilisateur.
+    
+    Le résultat est mémorisé dans flask.g pour la durée de la requête.
+    """
+    if not has_request_context():
+        return _resolve_current_language()
+    
+    lang = g.get('current_language')
+    if lang is None:
+        lang = _resolve_current_language()
+        g.current_language = lang
+    return lang
+
+def _resolve_current_language():
+    """Détermine la langue courante (session, cookie, profil, navigateur, défaut)"""
     available_languages = get_available_languages()
     
     # 1. Vérifier la session en premier
@@ -221,38 +177,104 @@ def set_language(lang_code):
     available_languages = get_available_languages()
     if lang_code in available_languages:
         session['language'] = lang_code
+        if has_request_context():
+            g.current_language = lang_code
         return True
     return False
 
-def load_translations(lang_code='fr'):
-    """Charge les traductions pour une langue donnée"""
-    lang_dir = os.path.join(os.path.dirname(__file__), 'lang')
+# Catalogue de traductions compilé, partagé par tout le processus.
+# Chaque langue est chargée une seule fois puis aplatie ("auth.login" -> valeur)
+# pour une recherche en O(1). Le fichier n'est relu que si son mtime change ou
+# après un upload/suppression via invalidate_translation_catalog().
+_translation_catalog = {}
+_translation_catalog_lock = threading.Lock()
+TRANSLATION_MTIME_CHECK_INTERVAL = 2.0  # secondes entre deux vérifications du mtime
+_MISSING_TRANSLATION = object()
+
+def _get_lang_dir():
+    """Retourne le dossier contenant les fichiers de langue"""
+    return os.path.join(os.path.dirname(__file__), 'lang')
+
+def _flatten_translations(data, prefix='', flat=None):
+    """Aplatit un dictionnaire de traductions imbriqué en clés pointées"""
+    if flat is None:
+        flat = {}
+    for key, value in data.items():
+        full_key = f"{prefix}{key}"
+        flat[full_key] = value
+        if isinstance(value, dict):
+            _flatten_translations(value, f"{full_key}.", flat)
+    return flat
+
+def _resolve_lang_file(lang_code):
+    """Retourne le chemin du fichier de langue (fallback vers le français)"""
+    lang_dir = _get_lang_dir()
     lang_file = os.path.join(lang_dir, f'{lang_code}.json')
-    
     if not os.path.exists(lang_file):
         lang_file = os.path.join(lang_dir, 'fr.json')
-    
+    return lang_file
+
+def _get_file_mtime(path):
     try:
-        with open(lang_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        return {}
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+def _get_catalog_entry(lang_code):
+    """Retourne l'entrée du catalogue pour une langue, en la (re)chargeant si nécessaire"""
+    now = time.monotonic()
+    entry = _translation_catalog.get(lang_code)
+    if entry is not None and now < entry['next_check']:
+        return entry
+    
+    with _translation_catalog_lock:
+        entry = _translation_catalog.get(lang_code)
+        if entry is not None and now < entry['next_check']:
+            return entry
+        
+        lang_file = _resolve_lang_file(lang_code)
+        mtime = _get_file_mtime(lang_file)
+        
+        if entry is not None and entry['path'] == lang_file and entry['mtime'] == mtime:
+            entry['next_check'] = now + TRANSLATION_MTIME_CHECK_INTERVAL
+            return entry
+        
+        try:
+            with open(lang_file, 'r', encoding='utf-8') as f:
+                translations = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            translations = {}
+        
+        entry = {
+            'path': lang_file,
+            'mtime': mtime,
+            'next_check': now + TRANSLATION_MTIME_CHECK_INTERVAL,
+            'tree': translations,
+            'flat': _flatten_translations(translations) if isinstance(translations, dict) else {}
+        }
+        _translation_catalog[lang_code] = entry
+        return entry
+
+def invalidate_translation_catalog(lang_code=None):
+    """Vide le catalogue de traductions (une langue ou toutes)"""
+    with _translation_catalog_lock:
+        if lang_code is None:
+            _translation_catalog.clear()
+        else:
+            _translation_catalog.pop(lang_code, None)
+
+def load_translations(lang_code='fr'):
+    """Charge les traductions pour une langue donnée"""
+    return _get_catalog_entry(lang_code)['tree']
 
 def t(key, lang_code=None, **kwargs):
     """Fonction de traduction"""
     if lang_code is None:
         lang_code = get_current_language()
     
-    translations = load_translations(lang_code)
-    
-    keys = key.split('.')
-    value = translations
-    
-    for k in keys:
-        if isinstance(value, dict) and k in value:
-            value = value[k]
-        else:
-            return key
+    value = _get_catalog_entry(lang_code)['flat'].get(key, _MISSING_TRANSLATION)
+    if value is _MISSING_TRANSLATION:
+        return key
     
     if kwargs and isinstance(value, str):
         try:
@@ -510,6 +532,13 @@ def create_pre_update_backup():
                     arc_path = os.path.relpath(file_path, '.')
                     zipf.write(file_path, arc_path)
         
+        # Sauvegarder les archives du journal des activités (mois compactés)
+        from log_storage_utils import LOG_ARCHIVE_FOLDER
+        if os.path.exists(LOG_ARCHIVE_FOLDER):
+            for file in os.listdir(LOG_ARCHIVE_FOLDER):
+                if file.endswith('.ndjson.gz'):
+                    zipf.write(os.path.join(LOG_ARCHIVE_FOLDER, file), os.path.join('log_archives', file))
+        
         # Sauvegarder les fichiers de langues
         if os.path.exists('lang'):
             for root, dirs, files in os.walk('lang'):
@@ -611,6 +640,7 @@ def create_pre_update_backup():
                 'database': True,
                 'uploads': os.path.exists('uploads'),
                 'forward_attachments': os.path.exists('forward_attachments'),
+                'log_archives': os.path.exists(LOG_ARCHIVE_FOLDER),
                 'languages': os.path.exists('lang'),
                 'templates': os.path.exists('templates'),
                 'static_files': os.path.exists('static'),
@@ -700,6 +730,13 @@ def create_system_backup():
                     arc_path = os.path.relpath(file_path, '.')
                     zipf.write(file_path, arc_path)
         
+        # Sauvegarder les archives du journal des activités (mois compactés)
+        from log_storage_utils import LOG_ARCHIVE_FOLDER
+        if os.path.exists(LOG_ARCHIVE_FOLDER):
+            for file in os.listdir(LOG_ARCHIVE_FOLDER):
+                if file.endswith('.ndjson.gz'):
+                    zipf.write(os.path.join(LOG_ARCHIVE_FOLDER, file), os.path.join('log_archives', file))
+        
         # Sauvegarder les fichiers de langues
         if os.path.exists('lang'):
             for root, dirs, files in os.walk('lang'):
@@ -738,7 +775,7 @@ def create_system_backup():
             'database_type': 'postgresql' if 'postgresql' in os.environ.get('DATABASE_URL', '') else 'sqlite',
             'backup_type': 'full_system_complete',
             'files_included': [
-                'database', 'uploads', 'forward_attachments', 'lang', 'config', 
+                'database', 'uploads', 'forward_attachments', 'log_archives', 'lang', 'config', 
                 'templates', 'static', 'exports', 'environment_doc'
             ],
             'description': 'Sauvegarde complète du système GEC incluant toutes les données, fichiers et configurations',
@@ -869,6 +906,15 @@ def restore_system_from_backup(backup_file):
             # Restaurer les nouvelles pièces jointes
             shutil.copytree(forward_attachments_backup_path, 'forward_attachments')
         
+        # Restaurer les archives du journal des activités
+        log_archives_backup_path = os.path.join(temp_dir, 'log_archives')
+        if os.path.exists(log_archives_backup_path):
+            from log_storage_utils import LOG_ARCHIVE_FOLDER
+            if os.path.exists(LOG_ARCHIVE_FOLDER):
+                log_archives_backup_name = f"log_archives_backup_{int(time.time())}"
+                shutil.move(LOG_ARCHIVE_FOLDER, log_archives_backup_name)
+            shutil.copytree(log_archives_backup_path, LOG_ARCHIVE_FOLDER)
+        
         # Restaurer tous les templates
         templates_backup_path = os.path.join(temp_dir, 'templates')
         if os.path.exists(templates_backup_path):
@@ -1042,53 +1088,39 @@ def verify_backup_integrity(backup_filename):
         return False, f"Erreur lors de la vérification: {str(e)}"
 
 def log_activity(user_id, action, description, courrier_id=None):
-    """Enregistrer une activité dans les logs"""
+    """Enregistrer une activité dans les logs (écriture groupée en arrière-plan)"""
     try:
         from flask import request
+        from log_writer_utils import queue_log
         ip_address = request.environ.get('HTTP_X_FORWARDED_FOR', request.environ.get('REMOTE_ADDR'))
         
-        from models import LogActivite
-        from app import db  # Import locally to avoid circular import
-        log = LogActivite(
-            utilisateur_id=user_id,
-            action=action,
-            description=description,
-            courrier_id=courrier_id,
-            ip_address=ip_address
-        )
-        
-        db.session.add(log)
-        db.session.commit()
+        queue_log('LogActivite',
+                  utilisateur_id=user_id,
+                  action=action,
+                  description=description,
+                  courrier_id=courrier_id,
+                  ip_address=ip_address)
     except Exception as e:
-        from app import db  # Import locally to avoid circular import
-        db.session.rollback()
         print(f"Erreur lors de l'enregistrement du log: {e}")
 
 def log_courrier_modification(courrier_id, user_id, champ_modifie, ancienne_valeur, nouvelle_valeur):
-    """Enregistrer une modification de courrier"""
+    """Enregistrer une modification de courrier (écriture groupée en arrière-plan)"""
     try:
         from flask import request
-        from models import CourrierModification
-        from app import db  # Import locally to avoid circular import
+        from log_writer_utils import queue_log
         
         ip_address = request.environ.get('HTTP_X_FORWARDED_FOR', request.environ.get('REMOTE_ADDR'))
         
-        modification = CourrierModification(
-            courrier_id=courrier_id,
-            utilisateur_id=user_id,
-            champ_modifie=champ_modifie,
-            ancienne_valeur=str(ancienne_valeur) if ancienne_valeur is not None else None,
-            nouvelle_valeur=str(nouvelle_valeur) if nouvelle_valeur is not None else None,
-            ip_address=ip_address
-        )
-        
-        db.session.add(modification)
-        db.session.commit()
+        queue_log('CourrierModification',
+                  courrier_id=courrier_id,
+                  utilisateur_id=user_id,
+                  champ_modifie=champ_modifie,
+                  ancienne_valeur=str(ancienne_valeur) if ancienne_valeur is not None else None,
+                  nouvelle_valeur=str(nouvelle_valeur) if nouvelle_valeur is not None else None,
+                  ip_address=ip_address)
         
     except Exception as e:
         print(f"Erreur lors de l'enregistrement de la modification: {e}")
-        from app import db  # Import locally to avoid circular import
-        db.session.rollback()
 
 def get_all_senders():
     """Récupérer la liste de tous les expéditeurs/destinataires uniques"""
@@ -1,6 +1,7 @@
 import json
 import os
 from flask import session, request
+from lang_utils import get_cached_language_table, list_language_codes
 
 # Languages disponibles
 AVAILABLE_LANGUAGES = {
@@ -10,15 +11,15 @@ AVAILABLE_LANGUAGES = {
 
 def get_available_languages():
     """Retourne la liste des langues disponibles"""
+    return get_cached_language_table(('utils.lang', 'available'), _build_available_languages)
+
+def _build_available_languages():
     languages = {}
     lang_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'lang')
     
-    if os.path.exists(lang_dir):
-        for filename in os.listdir(lang_dir):
-            if filename.endswith('.json'):
-                lang_code = filename[:-5]  # Remove .json
-                if lang_code in AVAILABLE_LANGUAGES:
-                    languages[lang_code] = AVAILABLE_LANGUAGES[lang_code]
+    for lang_code in list_language_codes(lang_dir):
+        if lang_code in AVAILABLE_LANGUAGES:
+            languages[lang_code] = AVAILABLE_LANGUAGES[lang_code]
     
     return languages
 
@@ -12,17 +12,22 @@ from flask import render_template, request, redirect, url_for, flash, session, s
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import check_password_hash, generate_password_hash
 from werkzeug.utils import secure_filename
-from sqlalchemy import or_, and_
+from sqlalchemy import or_, func
 import logging
 
 from app import app, db
-from models import User, Courrier, LogActivite, ParametresSysteme, StatutCourrier, Role, RolePermission, Departement, TypeCourrierSortant, Notification, CourrierComment, CourrierForward
+from models import User, Courrier, LogActivite, ParametresSysteme, StatutCourrier, Role, RolePermission, Departement, TypeCourrierSortant, Notification, CourrierComment, CourrierForward, CourrierSuggestion
 from utils import allowed_file, generate_accuse_reception, log_activity, export_courrier_pdf, export_mail_list_pdf, get_current_language, set_language, t, get_available_languages, get_all_languages, toggle_language_status, download_language_file, upload_language_file, delete_language_file, validate_backup_integrity, create_pre_update_backup, get_backup_files
 
 # Le support des langues est maintenant dans utils.py
 from email_utils import send_new_mail_notification, send_mail_forwarded_notification
 from security_utils import rate_limit, sanitize_input, validate_file_upload, log_security_event, record_failed_login, is_login_locked, reset_failed_login_attempts, get_client_ip, validate_password_strength, audit_log
-from performance_utils import cache_result, get_dashboard_statistics, optimize_search_query, PerformanceMonitor, clear_cache
+from http_cache_utils import cache_policy, REVALIDATE_PRIVATE, REVALIDATE_PUBLIC, PRIVATE_DAY
+from performance_utils import cache_result, get_dashboard_statistics, optimize_search_query, optimize_query_for_pagination, PerformanceMonitor, clear_cache
+from analytics_utils import compute_analytics
+from search_utils import apply_fulltext_search, normalize_suggestion_key, prefix_condition, SUGGESTION_SCAN_LIMIT
+from log_storage_utils import search_archived_logs, archived_months
+from attachment_store_utils import attachment_store
 
 @app.context_processor
 def inject_system_context():
@@ -59,19 +64,28 @@ def apply_mail_access_filter(query, user):
     """
     Applique les restrictions d'accès aux courriers selon les rôles avec exception pour les transmissions.
     Un courrier transmis à un utilisateur devient accessible même si son rôle ne le permet pas normalement.
-    """
-    from sqlalchemy import exists
     
+    Le filtre par département s'appuie sur la colonne dénormalisée Courrier.owner_departement_id
+    et l'index (is_deleted, owner_departement_id, date_enregistrement) : aucune sous-requête
+    corrélée n'est évaluée par ligne.
+    """
     # Base condition : courriers non supprimés
     query = query.filter(Courrier.is_deleted == False)
     
-    # Condition pour courriers transmis à l'utilisateur
-    forwarded_condition = exists().where(
-        and_(
-            CourrierForward.courrier_id == Courrier.id,
+    # Condition pour courriers transmis à l'utilisateur (sous-requête non corrélée, évaluée une fois)
+    forwarded_condition = Courrier.id.in_(
+        db.session.query(CourrierForward.courrier_id).filter(
             CourrierForward.forwarded_to_id == user.id
         )
     )
+    own_mail_condition = (Courrier.utilisateur_id == user.id)
+    
+    def department_or_own_filter():
+        if user.departement_id:
+            department_condition = (Courrier.owner_departement_id == user.departement_id)
+            return query.filter(or_(department_condition, forwarded_condition))
+        # Pas de département assigné : voir ses propres courriers OU ceux transmis
+        return query.filter(or_(own_mail_condition, forwarded_condition))
     
     # Conditions normales selon les permissions
     if user.has_permission('read_all_mail'):
@@ -79,41 +93,18 @@ def apply_mail_access_filter(query, user):
         return query
     elif user.has_permission('read_department_mail'):
         # Peut voir les courriers de son département OU les courriers qui lui sont transmis
-        if user.departement_id:
-            department_condition = exists().where(
-                and_(
-                    User.id == Courrier.utilisateur_id,
-                    User.departement_id == user.departement_id
-                )
-            )
-            return query.filter(or_(department_condition, forwarded_condition))
-        else:
-            # Pas de département assigné : voir ses propres courriers OU ceux transmis
-            own_mail_condition = (Courrier.utilisateur_id == user.id)
-            return query.filter(or_(own_mail_condition, forwarded_condition))
+        return department_or_own_filter()
     elif user.has_permission('read_own_mail'):
         # Peut voir ses propres courriers OU ceux transmis
-        own_mail_condition = (Courrier.utilisateur_id == user.id)
         return query.filter(or_(own_mail_condition, forwarded_condition))
     else:
         # Fallback sur l'ancien système avec transmission
         if user.role == 'super_admin':
             return query
         elif user.role == 'admin':
-            if user.departement_id:
-                department_condition = exists().where(
-                    and_(
-                        User.id == Courrier.utilisateur_id,
-                        User.departement_id == user.departement_id
-                    )
-                )
-                return query.filter(or_(department_condition, forwarded_condition))
-            else:
-                own_mail_condition = (Courrier.utilisateur_id == user.id)
-                return query.filter(or_(own_mail_condition, forwarded_condition))
+            return department_or_own_filter()
         else:
             # Utilisateur normal : ses propres courriers OU ceux transmis
-            own_mail_condition = (Courrier.utilisateur_id == user.id)
             return query.filter(or_(own_mail_condition, forwarded_condition))
 
 @app.route('/')
@@ -196,7 +187,7 @@ def logout():
 
 @app.route('/manage_email_templates')
 @login_required
-@rate_limit(max_requests=30, per_minutes=15)
+@rate_limit(max_requests=30, per_minutes=15, group='email_templates')
 def manage_email_templates():
     """Gestion des templates d'email"""
     if not current_user.has_permission('manage_email_templates') and not current_user.is_super_admin():
@@ -211,7 +202,7 @@ def manage_email_templates():
 
 @app.route('/add_email_template', methods=['GET', 'POST'])
 @login_required
-@rate_limit(max_requests=20, per_minutes=15)
+@rate_limit(max_requests=20, per_minutes=15, group='email_templates')
 def add_email_template():
     """Ajouter un nouveau template d'email"""
     if not current_user.has_permission('manage_email_templates') and not current_user.is_super_admin():
@@ -264,7 +255,7 @@ def add_email_template():
 
 @app.route('/edit_email_template/<int:template_id>', methods=['GET', 'POST'])
 @login_required
-@rate_limit(max_requests=20, per_minutes=15)
+@rate_limit(max_requests=20, per_minutes=15, group='email_templates')
 def edit_email_template(template_id):
     """Modifier un template d'email"""
     if not current_user.has_permission('manage_email_templates') and not current_user.is_super_admin():
@@ -307,7 +298,7 @@ def edit_email_template(template_id):
 
 @app.route('/delete_email_template/<int:template_id>', methods=['POST'])
 @login_required
-@rate_limit(max_requests=10, per_minutes=15)
+@rate_limit(max_requests=10, per_minutes=15, group='email_templates')
 def delete_email_template(template_id):
     """Supprimer un template d'email"""
     if not current_user.has_permission('manage_email_templates') and not current_user.is_super_admin():
@@ -560,6 +551,7 @@ def register_mail():
         fichier_nom = None
         fichier_chemin = None
         fichier_type = None
+        fichier_checksum = None
         
         # Vérifier que le fichier est présent (obligatoire)
         if not file or not file.filename or file.filename == '':
@@ -571,15 +563,8 @@ def register_mail():
         
         if allowed_file(file.filename):
             filename = secure_filename(file.filename)
-            # Ajouter timestamp pour éviter les conflits
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f"{timestamp}_{filename}"
-            # Stocker le chemin relatif, pas absolu
-            fichier_chemin = os.path.join('uploads', filename)
-            # Créer le dossier uploads s'il n'existe pas
-            os.makedirs('uploads', exist_ok=True)
-            # Sauvegarder le fichier
-            file.save(fichier_chemin)
+            # Stockage par contenu : un document déjà reçu n'est pas copié une seconde fois
+            fichier_checksum, _, fichier_chemin = attachment_store.save(file.stream)
             fichier_nom = file.filename
             fichier_type = filename.rsplit('.', 1)[1].lower()
         else:
@@ -603,14 +588,17 @@ def register_mail():
             fichier_nom=fichier_nom,
             fichier_chemin=fichier_chemin,
             fichier_type=fichier_type,
+            fichier_checksum=fichier_checksum,
             utilisateur_id=current_user.id,
             secretaire_general_copie=secretaire_general_copie,
             autres_informations=autres_informations if type_courrier == 'SORTANT' else None
         )
         
+        committed = False
         try:
             db.session.add(courrier)
             db.session.commit()
+            committed = True
             
             # Log de l'activité
             log_activity(current_user.id, "ENREGISTREMENT_COURRIER", 
@@ -670,6 +658,8 @@ def register_mail():
             
         except Exception as e:
             db.session.rollback()
+            if fichier_checksum and not committed:
+                attachment_store.release(fichier_checksum)
             logging.error(f"Erreur lors de l'enregistrement: {e}")
             flash('Erreur lors de l\'enregistrement du courrier.', 'error')
     
@@ -690,7 +680,7 @@ def register_mail():
 def view_mail():
     from models import TypeCourrierSortant
     
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor', '')
     per_page = 25  # Increased from 20 for better performance
     
     # Filtres
@@ -712,16 +702,24 @@ def view_mail():
     # Ajout du filtre pour type de courrier
     type_courrier = request.args.get('type_courrier', '')
     
-    # Enhanced search with performance optimization - indexing all metadata
+    # Recherche plein texte (FTS5 / tsvector), repli sur ILIKE si l'index est indisponible
+    fulltext_used = False
     if search:
         with PerformanceMonitor("search_query"):
             # Sanitize search input for security
             search = sanitize_input(search)
-            search_condition = optimize_search_query(search, Courrier)
-            if search_condition is not None:
-                query = query.filter(search_condition)
-                # Log search activity for analytics
+            if 'sort_by' not in request.args:
+                sort_by = 'pertinence'
+            query, fulltext_used = apply_fulltext_search(query, search, Courrier, db.engine,
+                                                         order_by_rank=(sort_by == 'pertinence'))
+            if fulltext_used:
                 log_security_event("SEARCH", f"Search performed: {search[:50]}...")
+            else:
+                search_condition = optimize_search_query(search, Courrier)
+                if search_condition is not None:
+                    query = query.filter(search_condition)
+                    # Log search activity for analytics
+                    log_security_event("SEARCH", f"Search performed: {search[:50]}...")
     
     # Filtre par type de courrier
     if type_courrier:
@@ -772,17 +770,27 @@ def view_mail():
         except ValueError:
             pass
     
-    # Tri
+    # Tri (le tri par pertinence est appliqué par apply_fulltext_search)
     if sort_by in ['date_enregistrement', 'numero_accuse_reception', 'expediteur', 'objet', 'statut']:
-        order_column = getattr(Courrier, sort_by)
-        if sort_order == 'desc':
-            query = query.order_by(order_column.desc())
-        else:
-            query = query.order_by(order_column.asc())
-    
-    # Pagination
-    courriers_paginated = query.paginate(page=page, per_page=per_page, error_out=False)
+        sort_keys = [(sort_by, sort_order == 'desc')]
+    elif sort_by == 'pertinence' and fulltext_used:
+        sort_keys = None
+    else:
+        sort_keys = [('date_enregistrement', True)]
+    
+    # Pagination par clé (date_enregistrement, id) : pas d'OFFSET ni de COUNT par page
+    # Liste non filtrée d'un utilisateur voyant tout : total estimé par le planificateur,
+    # diminué des courriers de la corbeille que l'estimation de la table inclut
+    filter_args = [search, date_from, date_to, date_redaction_from, date_redaction_to, statut,
+                   type_courrier, type_courrier_sortant_id, sg_copie]
+    unfiltered = not any(filter_args) and current_user.has_permission('read_all_mail')
+    courriers_paginated = optimize_query_for_pagination(
+        query, Courrier, sort_keys, per_page, cursor=cursor,
+        estimate_table='courrier' if unfiltered else None,
+        estimate_excluded=Courrier.query.filter(Courrier.is_deleted == True) if unfiltered else None
+    )
     courriers = courriers_paginated.items
+    pagination_args = {k: v for k, v in request.args.items() if k not in ('cursor', 'page')}
     
     # Récupérer les types de courrier sortant pour le filtre
     types_courrier_sortant = TypeCourrierSortant.query.filter_by(actif=True).order_by(TypeCourrierSortant.ordre_affichage).all()
@@ -790,6 +798,7 @@ def view_mail():
     return render_template('view_mail.html', 
                          courriers=courriers,
                          pagination=courriers_paginated,
+                         pagination_args=pagination_args,
                          search=search,
                          date_from=date_from,
                          date_to=date_to,
@@ -829,46 +838,32 @@ def search_suggestions():
         # Sanitize input
         q = sanitize_input(q)
         
-        # Construire la requête avec restrictions selon le rôle (incluant transmissions)
-        query = Courrier.query
-        query = apply_mail_access_filter(query, current_user)
-        
-        # Recherche dans tous les champs indexés
-        suggestions = set()  # Utiliser un set pour éviter les doublons
-        
-        # Rechercher dans les numéros d'accusé
-        results = query.filter(Courrier.numero_accuse_reception.ilike(f'%{q}%')).limit(5).all()
-        for r in results:
-            suggestions.add(r.numero_accuse_reception)
-        
-        # Rechercher dans les références
-        results = query.filter(Courrier.numero_reference.ilike(f'%{q}%')).limit(5).all()
-        for r in results:
-            if r.numero_reference:
-                suggestions.add(r.numero_reference)
-        
-        # Rechercher dans les objets
-        results = query.filter(Courrier.objet.ilike(f'%{q}%')).limit(5).all()
-        for r in results:
-            if len(r.objet) <= 100:  # Limiter la longueur des suggestions
-                suggestions.add(r.objet)
-            else:
-                suggestions.add(r.objet[:97] + '...')
-        
-        # Rechercher dans les expéditeurs
-        results = query.filter(Courrier.expediteur.ilike(f'%{q}%')).limit(5).all()
-        for r in results:
-            if r.expediteur:
-                suggestions.add(r.expediteur)
-        
-        # Rechercher dans les destinataires
-        results = query.filter(Courrier.destinataire.ilike(f'%{q}%')).limit(5).all()
-        for r in results:
-            if r.destinataire:
-                suggestions.add(r.destinataire)
+        key = normalize_suggestion_key(q)
+        if len(key) < 2:
+            return jsonify([])
         
-        # Convertir en liste et limiter à 10 suggestions
-        suggestions_list = list(suggestions)[:10]
+        # Candidats lus dans l'ordre de l'index de préfixes, avec restrictions selon le rôle (incluant
+        # transmissions) : le parcours s'arrête après SUGGESTION_SCAN_LIMIT lignes accessibles
+        candidates = db.session.query(
+            CourrierSuggestion.terme.label('terme'), CourrierSuggestion.courrier_id.label('courrier_id')
+        ).join(
+            Courrier, Courrier.id == CourrierSuggestion.courrier_id
+        ).filter(prefix_condition(CourrierSuggestion.cle, key, db.engine.dialect.name))
+        candidates = apply_mail_access_filter(candidates, current_user)
+        candidates = candidates.order_by(CourrierSuggestion.cle).limit(SUGGESTION_SCAN_LIMIT).subquery()
+        
+        # Classer par nombre de courriers parmi les candidats ; la limite s'applique après le classement
+        frequency = func.count(func.distinct(candidates.c.courrier_id)).label('frequence')
+        rows = db.session.query(candidates.c.terme, frequency).group_by(
+            candidates.c.terme
+        ).order_by(frequency.desc(), candidates.c.terme).limit(10).all()
+        
+        suggestions_list = []
+        for terme, _ in rows:
+            if len(terme) > 100:  # Limiter la longueur des suggestions
+                terme = terme[:97] + '...'
+            if terme not in suggestions_list:
+                suggestions_list.append(terme)
         
         return jsonify(suggestions_list)
     except Exception as e:
@@ -1218,6 +1213,7 @@ def export_mail_list():
 
 @app.route('/download_file/<int:id>')
 @login_required
+@cache_policy(REVALIDATE_PRIVATE)
 def download_file(id):
     courrier = Courrier.query.get_or_404(id)
     
@@ -1228,21 +1224,14 @@ def download_file(id):
     
     # Gérer les chemins relatifs et absolus
     if courrier.fichier_chemin:
-        # Si le chemin est absolu, extraire la partie relative
-        file_path = courrier.fichier_chemin
-        if file_path.startswith('/'):
-            # Chemin absolu - chercher la partie uploads
-            if 'uploads/' in file_path:
-                relative_path = file_path.split('uploads/')[-1]
-                file_path = os.path.join('uploads', relative_path)
+        # Stockage par contenu, sinon ancien emplacement (uploads/, chemins absolus)
+        file_path = attachment_store.resolve(courrier.fichier_checksum, courrier.fichier_chemin)
         
         # Log du chemin final
         logging.info(f"Chemin final à vérifier: {file_path}")
-        logging.info(f"Le fichier existe? {os.path.exists(file_path)}")
-        logging.info(f"Chemin absolu: {os.path.abspath(file_path)}")
         
         # Vérifier si le fichier existe
-        if os.path.exists(file_path):
+        if file_path:
             log_activity(current_user.id, "TELECHARGEMENT_FICHIER", 
                         f"Téléchargement du fichier du courrier {courrier.numero_accuse_reception}", courrier.id)
             
@@ -1267,7 +1256,7 @@ def download_file(id):
                                      download_name=courrier.fichier_nom,
                                      mimetype=mimetype)
         else:
-            logging.error(f"Fichier non trouvé au chemin: {file_path}")
+            logging.error(f"Fichier non trouvé au chemin: {courrier.fichier_chemin}")
             # Essayer de lister le contenu du dossier uploads
             try:
                 uploads_content = os.listdir('uploads')
@@ -1290,7 +1279,7 @@ def settings():
         return redirect(url_for('dashboard'))
     
     with PerformanceMonitor("settings_page"):
-        parametres = ParametresSysteme.get_parametres()
+        parametres = ParametresSysteme.get_parametres(for_update=True)
         # Types de courrier sortant maintenant gérés dans une page dédiée
         
         if request.method == 'POST':
@@ -1435,8 +1424,11 @@ def settings():
                     except Exception as e:
                         flash(f'Erreur lors du téléchargement du logo PDF: {str(e)}', 'error')
         
+            parametres.bump_cache_version()
+            
             try:
                 db.session.commit()
+                ParametresSysteme.invalidate_cache()
                 log_activity(current_user.id, "MODIFICATION_PARAMETRES", 
                             f"Mise à jour des paramètres système par {current_user.username}")
                 log_security_event("SETTINGS_UPDATE", f"System settings updated by {current_user.username}")
@@ -1457,10 +1449,10 @@ def settings():
                               parametres=parametres,
                               format_preview=format_preview)
 
-@app.route('/clear_cache', methods=['POST'])
+@app.route('/clear_cache', methods=['GET', 'POST'])
 @login_required
 def clear_cache_route():
-    """Route pour vider le cache système"""
+    """Route pour vider le cache système (GET : consulter les compteurs sans vider)"""
     if not current_user.is_super_admin():
         return jsonify({
             'success': False,
@@ -1468,8 +1460,21 @@ def clear_cache_route():
         }), 403
     
     try:
-        # Import et appel de la fonction clear_cache depuis performance_utils
-        from performance_utils import clear_cache
+        from performance_utils import clear_cache, get_cache_stats
+        from compression_utils import get_compression_stats
+        from log_writer_utils import get_log_writer_stats
+        
+        if request.method == 'GET':
+            return jsonify({
+                'success': True,
+                'stats': get_cache_stats(),
+                'compression': get_compression_stats(),
+                'log_writer': get_log_writer_stats(),
+                'attachment_store': attachment_store.stats()
+            })
+        
+        # Compteurs avant vidage (entrées libérées, taux de succès)
+        stats = get_cache_stats()
         clear_cache()
         
         # Log de l'action
@@ -1481,7 +1486,8 @@ def clear_cache_route():
         
         return jsonify({
             'success': True,
-            'message': 'Cache vidé avec succès'
+            'message': 'Cache vidé avec succès',
+            'stats': stats
         })
     except Exception as e:
         logging.error(f"Erreur lors du vidage du cache: {str(e)}")
@@ -2064,6 +2070,7 @@ def change_status(id):
 
 @app.route('/view_file/<int:id>')
 @login_required
+@cache_policy(REVALIDATE_PRIVATE)
 def view_file(id):
     courrier = Courrier.query.get_or_404(id)
     
@@ -2074,20 +2081,14 @@ def view_file(id):
     
     # Gérer les chemins relatifs et absolus
     if courrier.fichier_chemin:
-        # Si le chemin est absolu, extraire la partie relative
-        file_path = courrier.fichier_chemin
-        if file_path.startswith('/'):
-            # Chemin absolu - chercher la partie uploads
-            if 'uploads/' in file_path:
-                relative_path = file_path.split('uploads/')[-1]
-                file_path = os.path.join('uploads', relative_path)
+        # Stockage par contenu, sinon ancien emplacement (uploads/, chemins absolus)
+        file_path = attachment_store.resolve(courrier.fichier_checksum, courrier.fichier_chemin)
         
         # Log du chemin final
         logging.info(f"Chemin final à vérifier: {file_path}")
-        logging.info(f"Le fichier existe? {os.path.exists(file_path)}")
         
         # Vérifier si le fichier existe
-        if os.path.exists(file_path):
+        if file_path:
             log_activity(current_user.id, "VISUALISATION_FICHIER", 
                         f"Visualisation du fichier du courrier {courrier.numero_accuse_reception}", courrier.id)
             
@@ -2111,7 +2112,7 @@ def view_file(id):
                                      as_attachment=False,
                                      mimetype=mimetype)
         else:
-            logging.error(f"Fichier non trouvé au chemin: {file_path}")
+            logging.error(f"Fichier non trouvé au chemin: {courrier.fichier_chemin}")
     else:
         logging.error(f"Pas de chemin de fichier dans la base de données pour le courrier {id}")
     
@@ -2198,8 +2199,8 @@ def set_language_route(lang_code):
         flash('Langue non supportée', 'error')
         return redirect(request.referrer or url_for('dashboard'))
     
-    # Définir la langue dans la session
-    session['language'] = lang_code
+    # Définir la langue dans la session (et pour le reste de la requête)
+    set_language(lang_code)
     session.permanent = True  # Rendre la session permanente
     
     # Si l'utilisateur est connecté, sauvegarder dans son profil
@@ -2454,13 +2455,16 @@ def trash():
         flash('Vous n\'avez pas l\'autorisation de consulter la corbeille.', 'error')
         return redirect(url_for('dashboard'))
     
-    # Récupérer les courriers supprimés
-    courriers = Courrier.query.filter_by(is_deleted=True).order_by(Courrier.deleted_at.desc()).all()
+    # Récupérer les courriers supprimés, par pages de (deleted_at, id)
+    cursor = request.args.get('cursor', '')
+    query = Courrier.query.filter_by(is_deleted=True)
+    pagination = optimize_query_for_pagination(query, Courrier, [('deleted_at', True)], 50, cursor=cursor)
+    courriers = pagination.items
     
     log_activity(current_user.id, "CONSULTATION_CORBEILLE", 
-                f"Consultation de la corbeille ({len(courriers)} courriers)")
+                f"Consultation de la corbeille ({pagination.total} courriers)")
     
-    return render_template('trash.html', courriers=courriers)
+    return render_template('trash.html', courriers=courriers, pagination=pagination)
 
 @app.route('/empty_trash', methods=['POST'])
 @login_required
@@ -2472,10 +2476,19 @@ def empty_trash():
     
     # Supprimer définitivement tous les courriers de la corbeille
     deleted_count = Courrier.query.filter_by(is_deleted=True).count()
+    # La suppression en masse ne déclenche pas les événements du modèle : retirer les suggestions d'abord
+    deleted_ids = db.session.query(Courrier.id).filter(Courrier.is_deleted == True)
+    CourrierSuggestion.query.filter(CourrierSuggestion.courrier_id.in_(deleted_ids)).delete(synchronize_session=False)
+    # Pièces jointes du stockage par contenu dont les références seront retirées
+    released_checksums = [checksum for checksum, chemin in db.session.query(Courrier.fichier_checksum, Courrier.fichier_chemin)
+                          .filter(Courrier.is_deleted == True, Courrier.fichier_checksum.isnot(None))
+                          if attachment_store.owns(chemin, checksum)]
     Courrier.query.filter_by(is_deleted=True).delete()
     
     try:
         db.session.commit()
+        for checksum in released_checksums:
+            attachment_store.release(checksum)
         log_activity(current_user.id, "VIDAGE_CORBEILLE", 
                     f"Suppression définitive de {deleted_count} courriers")
         flash(f'{deleted_count} courriers ont été supprimés définitivement.', 'success')
@@ -2525,18 +2538,21 @@ def view_logs():
         flash('Accès non autorisé.', 'error')
         return redirect(url_for('dashboard'))
     
-    page = request.args.get('page', 1, type=int)
+    cursor = request.args.get('cursor', '')
     per_page = 50
     
     # Filtres
     search = request.args.get('search', '')
     action_filter = request.args.get('action', '')
-    user_filter = request.args.get('user_id', '', type=str)
+    user_id = request.args.get('user_id', type=int)  # None si absent ou non numérique
+    user_filter = str(user_id) if user_id else ''
     date_from = request.args.get('date_from', '')
     date_to = request.args.get('date_to', '')
+    archives = request.args.get('archives') == '1'
+    date_from_obj = date_to_obj = None
     
-    # Construction de la requête
-    query = LogActivite.query.join(User).order_by(LogActivite.date_action.desc())
+    # Construction de la requête (l'ordre est fixé par la pagination par clé)
+    query = LogActivite.query.join(User)
     
     # Filtre de recherche textuelle
     if search:
@@ -2554,8 +2570,8 @@ def view_logs():
         query = query.filter(LogActivite.action == action_filter)
     
     # Filtre par utilisateur
-    if user_filter:
-        query = query.filter(LogActivite.utilisateur_id == user_filter)
+    if user_id:
+        query = query.filter(LogActivite.utilisateur_id == user_id)
     
     # Filtres par date
     if date_from:
@@ -2574,8 +2590,16 @@ def view_logs():
         except ValueError:
             pass
     
-    # Pagination
-    logs_paginated = query.paginate(page=page, per_page=per_page, error_out=False)
+    if archives:
+        # Entrées en base puis mois compactés (archives NDJSON), avec les mêmes filtres
+        logs_paginated = search_archived_logs(search, action_filter, user_id, date_from_obj, date_to_obj,
+                                              per_page=per_page, cursor=cursor, live_query=query)
+    else:
+        # Pagination par clé (date_action, id)
+        unfiltered = not any([search, action_filter, user_filter, date_from, date_to])
+        logs_paginated = optimize_query_for_pagination(query, LogActivite, [('date_action', True)], per_page,
+                                                       cursor=cursor,
+                                                       estimate_table='log_activite' if unfiltered else None)
     logs = logs_paginated.items
     
     # Obtenir les actions uniques pour le filtre
@@ -2593,6 +2617,8 @@ def view_logs():
                          user_filter=user_filter,
                          date_from=date_from,
                          date_to=date_to,
+                         archives=archives,
+                         archive_months=archived_months(),
                          actions_list=actions_list,
                          users_list=users_list)
 
@@ -2608,9 +2634,12 @@ def export_logs_pdf_route():
         # Récupérer les mêmes filtres que la route view_logs
         search = request.args.get('search', '')
         action_filter = request.args.get('action', '')
-        user_filter = request.args.get('user_id', '', type=str)
+        user_id = request.args.get('user_id', type=int)  # None si absent ou non numérique
+        user_filter = str(user_id) if user_id else ''
         date_from = request.args.get('date_from', '')
         date_to = request.args.get('date_to', '')
+        archives = request.args.get('archives') == '1'
+        date_from_obj = date_to_obj = None
         
         # Construction de la requête avec les mêmes filtres
         query = LogActivite.query.join(User).order_by(LogActivite.date_action.desc())
@@ -2629,8 +2658,8 @@ def export_logs_pdf_route():
         if action_filter:
             query = query.filter(LogActivite.action == action_filter)
         
-        if user_filter:
-            query = query.filter(LogActivite.utilisateur_id == user_filter)
+        if user_id:
+            query = query.filter(LogActivite.utilisateur_id == user_id)
         
         if date_from:
             try:
@@ -2648,7 +2677,11 @@ def export_logs_pdf_route():
                 pass
         
         # Limiter à 1000 entrées maximum pour éviter les PDFs trop volumineux
-        logs = query.limit(1000).all()
+        if archives:
+            logs = search_archived_logs(search, action_filter, user_id, date_from_obj, date_to_obj,
+                                        per_page=1000, live_query=query).items
+        else:
+            logs = query.limit(1000).all()
         
         # Préparer les informations de filtres pour le PDF
         filters = {
@@ -2656,7 +2689,8 @@ def export_logs_pdf_route():
             'action_filter': action_filter,
             'user_filter': user_filter,
             'date_from': date_from,
-            'date_to': date_to
+            'date_to': date_to,
+            'archives': archives
         }
         
         # Générer le PDF
@@ -2849,6 +2883,7 @@ def add_role():
                 db.session.add(role_permission)
             
             db.session.commit()
+            Role.invalidate_permission_matrix()
             log_activity(current_user.id, "CREATION_ROLE", 
                         f"Création du rôle {nom_affichage}")
             flash(f'Rôle "{nom_affichage}" créé avec succès!', 'success')
@@ -2934,6 +2969,7 @@ def edit_role(role_id):
                 db.session.add(role_permission)
             
             db.session.commit()
+            Role.invalidate_permission_matrix()
             log_activity(current_user.id, "MODIFICATION_ROLE", 
                         f"Modification du rôle {role.nom_affichage}")
             flash(f'Rôle "{role.nom_affichage}" modifié avec succès!', 'success')
@@ -3007,6 +3043,7 @@ def delete_role(role_id):
         nom_role = role.nom_affichage
         db.session.delete(role)
         db.session.commit()
+        Role.invalidate_permission_matrix()
         log_activity(current_user.id, "SUPPRESSION_ROLE", 
                     f"Suppression du rôle {nom_role}")
         flash(f'Rôle "{nom_role}" supprimé avec succès!', 'success')
@@ -3199,12 +3236,14 @@ def upload_profile_photo():
     return redirect(url_for('dashboard'))
 
 @app.route('/static/uploads/profiles/<filename>')
+@cache_policy(PRIVATE_DAY)
 def profile_photo(filename):
     """Servir les photos de profil"""
     profile_folder = os.path.join('uploads', 'profiles')
     return send_file(os.path.join(profile_folder, filename))
 
 @app.route('/uploads/<filename>')
+@cache_policy(REVALIDATE_PUBLIC)
 def uploaded_file(filename):
     """Servir les fichiers uploadés (logos, etc.)"""
     try:
@@ -3737,6 +3776,7 @@ def restore_database_complete(backup_file_path):
             
             if result.returncode == 0:
                 logging.info("✅ Base de données PostgreSQL restaurée avec succès")
+                ParametresSysteme.invalidate_cache()
                 
                 # Vérifier que des données ont été restaurées
                 try:
@@ -3847,7 +3887,8 @@ def security_settings():
         
     from security_utils import (MAX_LOGIN_ATTEMPTS, LOGIN_LOCKOUT_DURATION, 
                                SUSPICIOUS_ACTIVITY_THRESHOLD, AUTO_BLOCK_DURATION,
-                               _blocked_ips, _failed_login_attempts, get_security_logs)
+                               _blocked_ips, clear_failed_login_attempts,
+                               count_failed_login_ips, get_security_logs)
     
     if request.method == 'POST':
         form_type = request.form.get('form_type')
@@ -3875,7 +3916,7 @@ def security_settings():
             from models import IPBlock
             cleared_ips = IPBlock.unblock_all_ips()
             _blocked_ips.clear()
-            _failed_login_attempts.clear()
+            clear_failed_login_attempts()
             flash(f'{cleared_ips} adresses IP débloquées', 'success')
             log_activity(current_user.id, "SECURITY_UNBLOCK", f"Toutes les IP bloquées débloquées ({cleared_ips})")
         
@@ -3887,8 +3928,7 @@ def security_settings():
                 success = IPBlock.unblock_ip(ip_address)
                 if ip_address in _blocked_ips:
                     _blocked_ips.remove(ip_address)
-                if ip_address in _failed_login_attempts:
-                    del _failed_login_attempts[ip_address]
+                reset_failed_login_attempts(ip_address)
                 
                 if success:
                     flash(f'Adresse IP {ip_address} débloquée avec succès', 'success')
@@ -3944,12 +3984,8 @@ def security_settings():
         
         return redirect(url_for('security_settings'))
     
-    # Statistiques de sécurité
-    from datetime import datetime, timedelta
-    now = datetime.now()
-    failed_attempts_24h = sum(1 for data in _failed_login_attempts.values() 
-                             if isinstance(data, dict) and 
-                             now - data.get('timestamp', now) < timedelta(hours=24))
+    # Statistiques de sécurité (les échecs expirent après la durée de blocage)
+    failed_attempts_24h = count_failed_login_ips()
     
     # Récupérer les listes d'IPs bloquées et en whitelist
     from models import IPBlock, IPWhitelist
@@ -3966,7 +4002,7 @@ def security_settings():
                          blocked_ips=list(set(blocked_ips + list(_blocked_ips))),  # Combine et déduplique
                          whitelisted_ips=whitelisted_ips,
                          failed_attempts_24h=failed_attempts_24h,
-                         monitored_ips=len(_failed_login_attempts))
+                         monitored_ips=failed_attempts_24h)
 
 def export_security_logs(level, event_type, date_start, date_end):
     """Exporte les logs de sécurité en CSV"""
@@ -4021,7 +4057,6 @@ def analytics():
         return redirect(url_for('dashboard'))
     
     from datetime import datetime, timedelta
-    from sqlalchemy import func
     import json
     
     # Récupérer les paramètres de filtre temporel
@@ -4051,292 +4086,49 @@ def analytics():
         start_date = None
         end_date = None
     
-    # Construire le filtre de base
-    base_filter = [Courrier.is_deleted == False]
-    if start_date and end_date:
-        base_filter.append(Courrier.date_enregistrement >= start_date)
-        base_filter.append(Courrier.date_enregistrement <= end_date)
-    
-    # Statistiques générales avec filtre
-    total_courriers = Courrier.query.filter(*base_filter).count()
-    courriers_entrants = Courrier.query.filter(*base_filter, Courrier.type_courrier == 'ENTRANT').count()
-    courriers_sortants = Courrier.query.filter(*base_filter, Courrier.type_courrier == 'SORTANT').count()
-    
-    # Variables pour export PDF
-    date_7_days_ago = datetime.now() - timedelta(days=7)
-    courriers_7_days = Courrier.query.filter(
-        Courrier.date_enregistrement >= date_7_days_ago,
-        Courrier.is_deleted == False
-    ).count()
-    
-    date_30_days_ago = datetime.now() - timedelta(days=30)
-    courriers_30_days = Courrier.query.filter(
-        Courrier.date_enregistrement >= date_30_days_ago,
-        Courrier.is_deleted == False
-    ).count()
-    
-    # Top expéditeurs avec filtre
-    sender_filter = base_filter + [
-        Courrier.expediteur != None,
-        Courrier.expediteur != ''
-    ]
-    top_senders = db.session.query(
-        Courrier.expediteur,
-        func.count(Courrier.id).label('count')
-    ).filter(*sender_filter).group_by(Courrier.expediteur).order_by(func.count(Courrier.id).desc()).limit(10).all()
-    
-    
-    # Volume par jour avec filtre
-    daily_filter = base_filter.copy()
-    if not start_date:  # Si pas de filtre spécifique, utiliser 30 derniers jours
-        daily_filter.append(Courrier.date_enregistrement >= date_30_days_ago)
-    
-    daily_volumes = db.session.query(
-        func.date(Courrier.date_enregistrement).label('date'),
-        func.count(Courrier.id).label('count')
-    ).filter(*daily_filter).group_by(func.date(Courrier.date_enregistrement)).all()
+    # Tous les indicateurs sont calculés par le moteur d'analyse en quelques requêtes groupées
+    stats = compute_analytics(start_date, end_date, now=now)
     
     daily_data = {
-        'dates': [str(d.date) for d in daily_volumes],
-        'counts': [d.count for d in daily_volumes]
+        'dates': [str(d.jour) for d in stats.daily_volumes],
+        'counts': [d.count for d in stats.daily_volumes]
     }
-    
-    # Répartition par statut avec filtre
-    status_distribution = db.session.query(
-        Courrier.statut,
-        func.count(Courrier.id).label('count')
-    ).filter(*base_filter).group_by(Courrier.statut).all()
-    
     status_data = {
-        'labels': [s.statut or 'Non défini' for s in status_distribution],
-        'counts': [s.count for s in status_distribution]
+        'labels': [s.statut or 'Non défini' for s in stats.status_distribution],
+        'counts': [s.count for s in stats.status_distribution]
     }
-    
-    # Top 10 expéditeurs (déjà défini plus haut avec filtre)
-    
-    # Top 10 destinataires avec filtre
-    recipient_filter = base_filter + [
-        Courrier.destinataire != None,
-        Courrier.destinataire != ''
-    ]
-    top_recipients = db.session.query(
-        Courrier.destinataire,
-        func.count(Courrier.id).label('count')
-    ).filter(*recipient_filter).group_by(Courrier.destinataire).order_by(func.count(Courrier.id).desc()).limit(10).all()
-    
-    # Temps moyen de traitement (courriers avec statut "TRAITE")
-    processed_mails = Courrier.query.filter_by(statut='TRAITE', is_deleted=False).all()
-    avg_processing_time = 0
-    if processed_mails:
-        total_time = sum([(m.date_enregistrement - m.date_redaction).days 
-                         for m in processed_mails if m.date_redaction])
-        avg_processing_time = total_time / len(processed_mails) if processed_mails else 0
-    
-    # Volume par mois (12 derniers mois)
-    monthly_volumes = []
-    for i in range(12):
-        month_start = datetime.now().replace(day=1) - timedelta(days=30*i)
-        month_end = (month_start + timedelta(days=32)).replace(day=1)
-        count = Courrier.query.filter(
-            Courrier.date_enregistrement >= month_start,
-            Courrier.date_enregistrement < month_end,
-            Courrier.is_deleted == False
-        ).count()
-        monthly_volumes.append({
-            'month': month_start.strftime('%B %Y'),
-            'count': count
-        })
-    monthly_volumes.reverse()
-    
-    # === NOUVELLES STATISTIQUES DÉTAILLÉES ===
-    
-    # 1. Statistiques par département avec filtre
-    dept_stats_raw = db.session.query(
-        Departement.nom.label('departement'),
-        Courrier.type_courrier,
-        func.count(Courrier.id).label('count')
-    ).join(User, Courrier.utilisateur_id == User.id)\
-     .join(Departement, User.departement_id == Departement.id)\
-     .filter(*base_filter)\
-     .group_by(Departement.nom, Courrier.type_courrier).all()
-    
-    # Agrégation des résultats par département
-    dept_dict = {}
-    for stat in dept_stats_raw:
-        if stat.departement not in dept_dict:
-            dept_dict[stat.departement] = {'departement': stat.departement, 'total': 0, 'entrants': 0, 'sortants': 0}
-        dept_dict[stat.departement]['total'] += stat.count
-        if stat.type_courrier == 'ENTRANT':
-            dept_dict[stat.departement]['entrants'] = stat.count
-        elif stat.type_courrier == 'SORTANT':
-            dept_dict[stat.departement]['sortants'] = stat.count
-    
-    # Conversion en liste triée par total
-    dept_stats = []
-    for dept_name, data in dept_dict.items():
-        from collections import namedtuple
-        DeptStat = namedtuple('DeptStat', ['departement', 'total', 'entrants', 'sortants'])
-        dept_stats.append(DeptStat(data['departement'], data['total'], data['entrants'], data['sortants']))
-    dept_stats.sort(key=lambda x: x.total, reverse=True)
-    
-    # 2. Statistiques par utilisateur avec filtre (top 10)
-    user_stats_raw = db.session.query(
-        User.nom_complet,
-        Courrier.type_courrier,
-        func.count(Courrier.id).label('count')
-    ).join(Courrier, Courrier.utilisateur_id == User.id)\
-     .filter(*base_filter)\
-     .group_by(User.nom_complet, Courrier.type_courrier).all()
-    
-    # Agrégation des résultats par utilisateur
-    user_dict = {}
-    for stat in user_stats_raw:
-        if stat.nom_complet not in user_dict:
-            user_dict[stat.nom_complet] = {'nom_complet': stat.nom_complet, 'total': 0, 'entrants': 0, 'sortants': 0}
-        user_dict[stat.nom_complet]['total'] += stat.count
-        if stat.type_courrier == 'ENTRANT':
-            user_dict[stat.nom_complet]['entrants'] = stat.count
-        elif stat.type_courrier == 'SORTANT':
-            user_dict[stat.nom_complet]['sortants'] = stat.count
-    
-    # Conversion en liste triée par total (top 10)
-    user_stats = []
-    for user_name, data in user_dict.items():
-        from collections import namedtuple
-        UserStat = namedtuple('UserStat', ['nom_complet', 'total', 'entrants', 'sortants'])
-        user_stats.append(UserStat(data['nom_complet'], data['total'], data['entrants'], data['sortants']))
-    user_stats.sort(key=lambda x: x.total, reverse=True)
-    user_stats = user_stats[:10]  # Top 10
-    
-    # 3. Évolution des statuts par semaine (8 dernières semaines)
-    weekly_status = {}
-    for i in range(8):
-        week_start = datetime.now() - timedelta(weeks=i+1)
-        week_end = datetime.now() - timedelta(weeks=i)
-        
-        week_stats = db.session.query(
-            Courrier.statut,
-            func.count(Courrier.id).label('count')
-        ).filter(
-            Courrier.date_enregistrement >= week_start,
-            Courrier.date_enregistrement < week_end,
-            Courrier.is_deleted == False
-        ).group_by(Courrier.statut).all()
-        
-        week_key = f"Semaine {8-i}"
-        weekly_status[week_key] = {stat.statut or 'Non défini': stat.count for stat in week_stats}
-    
-    # 4. Statistiques par type de courrier avec évolution mensuelle
-    type_evolution = {}
-    for i in range(6):  # 6 derniers mois
-        month_start = datetime.now().replace(day=1) - timedelta(days=30*i)
-        month_end = (month_start + timedelta(days=32)).replace(day=1)
-        
-        month_types = db.session.query(
-            Courrier.type_courrier,
-            func.count(Courrier.id).label('count')
-        ).filter(
-            Courrier.date_enregistrement >= month_start,
-            Courrier.date_enregistrement < month_end,
-            Courrier.is_deleted == False
-        ).group_by(Courrier.type_courrier).all()
-        
-        month_key = month_start.strftime('%B %Y')
-        type_evolution[month_key] = {typ.type_courrier: typ.count for typ in month_types}
-    
-    # 5. Performance par département (temps moyen de traitement)
-    dept_performance = db.session.query(
-        Departement.nom.label('departement'),
-        func.count(Courrier.id).label('total'),
-        func.avg(
-            func.extract('day', Courrier.date_enregistrement - func.coalesce(Courrier.date_redaction, Courrier.date_enregistrement))
-        ).label('temps_moyen')
-    ).join(User, Courrier.utilisateur_id == User.id)\
-     .join(Departement, User.departement_id == Departement.id)\
-     .filter(
-         Courrier.is_deleted == False,
-         Courrier.statut.in_(['TRAITE', 'CLOS'])
-     )\
-     .group_by(Departement.nom).all()
-    
-    # 6. Analyse temporelle détaillée - Courriers par jour de la semaine
-    weekday_stats = db.session.query(
-        func.extract('dow', Courrier.date_enregistrement).label('day_of_week'),
-        func.count(Courrier.id).label('count')
-    ).filter(
-        Courrier.date_enregistrement >= date_30_days_ago,
-        Courrier.is_deleted == False
-    ).group_by(func.extract('dow', Courrier.date_enregistrement)).all()
-    
-    weekdays = ['Dimanche', 'Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi']
-    weekday_data = {
-        'labels': [weekdays[int(stat.day_of_week)] for stat in weekday_stats],
-        'counts': [stat.count for stat in weekday_stats]
-    }
-    
-    # 7. Analyse par heure de la journée
-    hourly_stats = db.session.query(
-        func.extract('hour', Courrier.date_enregistrement).label('hour'),
-        func.count(Courrier.id).label('count')
-    ).filter(
-        Courrier.date_enregistrement >= date_30_days_ago,
-        Courrier.is_deleted == False
-    ).group_by(func.extract('hour', Courrier.date_enregistrement)).all()
-    
-    hourly_data = {
-        'hours': [f"{int(stat.hour):02d}h" for stat in hourly_stats],
-        'counts': [stat.count for stat in hourly_stats]
-    }
-    
-    # 8. Évolution annuelle (24 derniers mois pour voir la tendance)
-    yearly_evolution = []
-    for i in range(24):
-        month_start = datetime.now().replace(day=1) - timedelta(days=30*i)
-        month_end = (month_start + timedelta(days=32)).replace(day=1)
-        
-        entrants = Courrier.query.filter(
-            Courrier.date_enregistrement >= month_start,
-            Courrier.date_enregistrement < month_end,
-            Courrier.type_courrier == 'ENTRANT',
-            Courrier.is_deleted == False
-        ).count()
-        
-        sortants = Courrier.query.filter(
-            Courrier.date_enregistrement >= month_start,
-            Courrier.date_enregistrement < month_end,
-            Courrier.type_courrier == 'SORTANT',
-            Courrier.is_deleted == False
-        ).count()
-        
-        yearly_evolution.append({
-            'month': month_start.strftime('%m/%Y'),
-            'entrants': entrants,
-            'sortants': sortants,
-            'total': entrants + sortants
-        })
-    yearly_evolution.reverse()
+    monthly_volumes = [{
+        'month': volume.month_start.strftime('%B %Y'),
+        'count': volume.total
+    } for volume in stats.monthly_volumes(12)]
+    yearly_evolution = [{
+        'month': volume.month_start.strftime('%m/%Y'),
+        'entrants': volume.entrants,
+        'sortants': volume.sortants,
+        'total': volume.total
+    } for volume in stats.monthly_volumes(24)]
     
     return render_template('analytics.html',
-                         total_courriers=total_courriers,
-                         courriers_entrants=courriers_entrants,
-                         courriers_sortants=courriers_sortants,
-                         courriers_7_days=courriers_7_days,
-                         courriers_30_days=courriers_30_days,
+                         total_courriers=stats.total_courriers,
+                         courriers_entrants=stats.courriers_entrants,
+                         courriers_sortants=stats.courriers_sortants,
+                         courriers_7_days=stats.courriers_7_days,
+                         courriers_30_days=stats.courriers_30_days,
                          daily_data=json.dumps(daily_data),
                          status_data=json.dumps(status_data),
-                         top_senders=top_senders,
-                         top_recipients=top_recipients,
-                         avg_processing_time=round(avg_processing_time, 1),
+                         top_senders=stats.top_senders,
+                         top_recipients=stats.top_recipients,
+                         avg_processing_time=round(stats.avg_processing_time, 1),
                          monthly_volumes=monthly_volumes,
                          
                          # Nouvelles statistiques détaillées
-                         dept_stats=dept_stats,
-                         user_stats=user_stats,
-                         weekly_status=json.dumps(weekly_status),
-                         type_evolution=json.dumps(type_evolution),
-                         dept_performance=dept_performance,
-                         weekday_data=json.dumps(weekday_data),
-                         hourly_data=json.dumps(hourly_data),
+                         dept_stats=stats.dept_stats,
+                         user_stats=stats.user_stats,
+                         weekly_status=json.dumps(stats.weekly_status),
+                         type_evolution=json.dumps(stats.type_evolution(6)),
+                         dept_performance=stats.dept_performance,
+                         weekday_data=json.dumps(stats.weekday_data()),
+                         hourly_data=json.dumps(stats.hourly_data()),
                          yearly_evolution=json.dumps(yearly_evolution))
 
 
@@ -4344,8 +4136,7 @@ def analytics():
 @login_required
 def export_analytics(format):
     """Export des données analytiques en PDF ou Excel"""
-    from datetime import datetime, timedelta
-    from sqlalchemy import func
+    from datetime import datetime
     from flask import send_file
     import io
     
@@ -4353,35 +4144,14 @@ def export_analytics(format):
         flash('Format d\'export invalide', 'error')
         return redirect(url_for('analytics'))
     
-    # Collecter les mêmes données que pour la page analytics
-    total_courriers = Courrier.query.filter_by(is_deleted=False).count()
-    courriers_entrants = Courrier.query.filter_by(type_courrier='ENTRANT', is_deleted=False).count()
-    courriers_sortants = Courrier.query.filter_by(type_courrier='SORTANT', is_deleted=False).count()
-    
-    # Calculer les statistiques par période
-    date_7_days_ago = datetime.now() - timedelta(days=7)
-    courriers_7_days = Courrier.query.filter(
-        Courrier.date_enregistrement >= date_7_days_ago,
-        Courrier.is_deleted == False
-    ).count()
-    
-    date_30_days_ago = datetime.now() - timedelta(days=30)
-    courriers_30_days = Courrier.query.filter(
-        Courrier.date_enregistrement >= date_30_days_ago,
-        Courrier.is_deleted == False
-    ).count()
-    
-    # Top expéditeurs pour le PDF
-    top_senders = db.session.query(
-        Courrier.expediteur,
-        func.count(Courrier.id).label('count')
-    ).filter(
-        Courrier.is_deleted == False,
-        Courrier.expediteur.isnot(None),
-        Courrier.expediteur != ''
-    ).group_by(Courrier.expediteur).order_by(
-        func.count(Courrier.id).desc()
-    ).limit(10).all()
+    # Collecter les mêmes données que pour la page analytics (moteur d'analyse partagé)
+    stats = compute_analytics()
+    total_courriers = stats.total_courriers
+    courriers_entrants = stats.courriers_entrants
+    courriers_sortants = stats.courriers_sortants
+    courriers_7_days = stats.courriers_7_days
+    courriers_30_days = stats.courriers_30_days
+    top_senders = stats.top_senders
     
     if format == 'excel':
         try:
@@ -4401,17 +4171,8 @@ def export_analytics(format):
             stats_df.to_excel(writer, sheet_name='Statistiques', index=False)
             
             # Feuille 2 : Volume par jour
-            date_30_days_ago = datetime.now() - timedelta(days=30)
-            daily_volumes = db.session.query(
-                func.date(Courrier.date_enregistrement).label('date'),
-                func.count(Courrier.id).label('count')
-            ).filter(
-                Courrier.date_enregistrement >= date_30_days_ago,
-                Courrier.is_deleted == False
-            ).group_by(func.date(Courrier.date_enregistrement)).all()
-            
-            if daily_volumes:
-                daily_df = pd.DataFrame([(str(d.date), d.count) for d in daily_volumes],
+            if stats.daily_volumes:
+                daily_df = pd.DataFrame([(str(d.jour), d.count) for d in stats.daily_volumes],
                                        columns=['Date', 'Nombre de Courriers'])
                 daily_df.to_excel(writer, sheet_name='Volume Quotidien', index=False)
         
@@ -4437,110 +4198,19 @@ def export_analytics(format):
             flash('ReportLab n\'est pas installé. Impossible d\'exporter en PDF.', 'error')
             return redirect(url_for('analytics'))
         
-        # Récupérer toutes les données analytiques comme dans la fonction analytics()
-        # Copier les calculs de la fonction analytics() pour avoir toutes les données
-        
-        # Filtres de base
-        base_filter = [Courrier.is_deleted == False]
-        
-        # Statistiques par département
-        dept_stats_raw = db.session.query(
-            Departement.nom.label('departement'),
-            Courrier.type_courrier,
-            func.count(Courrier.id).label('count')
-        ).join(User, Courrier.utilisateur_id == User.id)\
-         .join(Departement, User.departement_id == Departement.id)\
-         .filter(*base_filter)\
-         .group_by(Departement.nom, Courrier.type_courrier).all()
-        
-        # Agrégation des résultats par département
-        dept_dict = {}
-        for stat in dept_stats_raw:
-            if stat.departement not in dept_dict:
-                dept_dict[stat.departement] = {'departement': stat.departement, 'total': 0, 'entrants': 0, 'sortants': 0}
-            dept_dict[stat.departement]['total'] += stat.count
-            if stat.type_courrier == 'ENTRANT':
-                dept_dict[stat.departement]['entrants'] = stat.count
-            elif stat.type_courrier == 'SORTANT':
-                dept_dict[stat.departement]['sortants'] = stat.count
-        
-        # Conversion en liste triée par total
-        dept_stats = []
-        for dept_name, data in dept_dict.items():
-            from collections import namedtuple
-            DeptStat = namedtuple('DeptStat', ['departement', 'total', 'entrants', 'sortants'])
-            dept_stats.append(DeptStat(data['departement'], data['total'], data['entrants'], data['sortants']))
-        dept_stats.sort(key=lambda x: x.total, reverse=True)
-        
-        # Statistiques par utilisateur (top 10)
-        user_stats_raw = db.session.query(
-            User.nom_complet,
-            Courrier.type_courrier,
-            func.count(Courrier.id).label('count')
-        ).join(Courrier, Courrier.utilisateur_id == User.id)\
-         .filter(*base_filter)\
-         .group_by(User.nom_complet, Courrier.type_courrier).all()
-        
-        # Agrégation des résultats par utilisateur
-        user_dict = {}
-        for stat in user_stats_raw:
-            if stat.nom_complet not in user_dict:
-                user_dict[stat.nom_complet] = {'nom_complet': stat.nom_complet, 'total': 0, 'entrants': 0, 'sortants': 0}
-            user_dict[stat.nom_complet]['total'] += stat.count
-            if stat.type_courrier == 'ENTRANT':
-                user_dict[stat.nom_complet]['entrants'] = stat.count
-            elif stat.type_courrier == 'SORTANT':
-                user_dict[stat.nom_complet]['sortants'] = stat.count
-        
-        # Conversion en liste triée par total (top 10)
-        user_stats = []
-        for user_name, data in user_dict.items():
-            from collections import namedtuple
-            UserStat = namedtuple('UserStat', ['nom_complet', 'total', 'entrants', 'sortants'])
-            user_stats.append(UserStat(data['nom_complet'], data['total'], data['entrants'], data['sortants']))
-        user_stats.sort(key=lambda x: x.total, reverse=True)
-        user_stats = user_stats[:10]  # Top 10
-        
-        # Top destinataires
-        recipient_filter = base_filter + [
-            Courrier.destinataire != None,
-            Courrier.destinataire != ''
-        ]
-        top_recipients = db.session.query(
-            Courrier.destinataire,
-            func.count(Courrier.id).label('count')
-        ).filter(*recipient_filter).group_by(Courrier.destinataire).order_by(func.count(Courrier.id).desc()).limit(10).all()
-        
-        # Répartition par statut
-        status_distribution = db.session.query(
-            Courrier.statut,
-            func.count(Courrier.id).label('count')
-        ).filter(*base_filter).group_by(Courrier.statut).all()
+        # Données analytiques calculées par le moteur partagé avec analytics()
+        dept_stats = stats.dept_stats
+        user_stats = stats.user_stats
+        top_recipients = stats.top_recipients
+        status_distribution = stats.status_distribution
         
         # Volume par mois (6 derniers mois)
-        monthly_volumes = []
-        for i in range(6):
-            month_start = datetime.now().replace(day=1) - timedelta(days=30*i)
-            month_end = (month_start + timedelta(days=32)).replace(day=1)
-            entrants = Courrier.query.filter(
-                Courrier.date_enregistrement >= month_start,
-                Courrier.date_enregistrement < month_end,
-                Courrier.type_courrier == 'ENTRANT',
-                Courrier.is_deleted == False
-            ).count()
-            sortants = Courrier.query.filter(
-                Courrier.date_enregistrement >= month_start,
-                Courrier.date_enregistrement < month_end,
-                Courrier.type_courrier == 'SORTANT',
-                Courrier.is_deleted == False
-            ).count()
-            monthly_volumes.append({
-                'month': month_start.strftime('%B %Y'),
-                'entrants': entrants,
-                'sortants': sortants,
-                'total': entrants + sortants
-            })
-        monthly_volumes.reverse()
+        monthly_volumes = [{
+            'month': volume.month_start.strftime('%B %Y'),
+            'entrants': volume.entrants,
+            'sortants': volume.sortants,
+            'total': volume.total
+        } for volume in stats.monthly_volumes(6)]
         
         buffer = io.BytesIO()
         doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=2*cm, bottomMargin=2*cm)
@@ -4949,29 +4619,22 @@ def forward_mail(courrier_id):
     attachment_filename = None
     attachment_original_name = None
     attachment_size = None
+    attachment_checksum = None
     
     if 'attachment' in request.files:
         file = request.files['attachment']
         if file and file.filename:
             # Valider le fichier
             if validate_file_upload(file):
-                # Créer le répertoire s'il n'existe pas
-                forward_uploads_dir = os.path.join(app.config.get('UPLOAD_FOLDER', 'uploads'), 'forwards')
-                os.makedirs(forward_uploads_dir, exist_ok=True)
-                
-                # Générer un nom unique pour le fichier
                 file_extension = os.path.splitext(file.filename)[1].lower()
-                unique_filename = f"forward_{courrier_id}_{current_user.id}_{uuid.uuid4().hex[:8]}{file_extension}"
-                file_path = os.path.join(forward_uploads_dir, unique_filename)
                 
                 try:
-                    # Sauvegarder le fichier
-                    file.save(file_path)
+                    # Stockage par contenu (fichier partagé si le même document a déjà été reçu)
+                    attachment_checksum, attachment_size, _ = attachment_store.save(file.stream)
                     
                     # Enregistrer les informations du fichier
-                    attachment_filename = unique_filename
+                    attachment_filename = f"{attachment_checksum}{file_extension}"
                     attachment_original_name = file.filename
-                    attachment_size = os.path.getsize(file_path)
                     
                     log_activity(current_user.id, "UPLOAD_TRANSMISSION_FILE", 
                                f"Fichier joint ajouté à la transmission: {file.filename}", courrier_id)
@@ -4991,12 +4654,15 @@ def forward_mail(courrier_id):
         message=message,
         attached_file=attachment_filename,
         attached_file_original_name=attachment_original_name,
-        attached_file_size=attachment_size
+        attached_file_size=attachment_size,
+        attached_file_checksum=attachment_checksum
     )
     
+    committed = False
     try:
         db.session.add(forward)
         db.session.commit()
+        committed = True
         
         # Créer une notification dans l'application
         Notification.create_notification(
@@ -5035,6 +4701,8 @@ def forward_mail(courrier_id):
         
     except Exception as e:
         db.session.rollback()
+        if attachment_checksum and not committed:
+            attachment_store.release(attachment_checksum)
         logging.error(f"Erreur lors de la transmission: {e}")
         flash('Erreur lors de la transmission du courrier.', 'error')
     
@@ -5042,6 +4710,7 @@ def forward_mail(courrier_id):
 
 @app.route('/download_forward_attachment/<int:forward_id>')
 @login_required  
+@cache_policy(REVALIDATE_PRIVATE)
 def download_forward_attachment(forward_id):
     """Télécharger un fichier joint d'une transmission"""
     forward = CourrierForward.query.get_or_404(forward_id)
@@ -5057,11 +4726,12 @@ def download_forward_attachment(forward_id):
         flash('Aucun fichier joint trouvé pour cette transmission.', 'error')
         return redirect(url_for('mail_detail', id=forward.courrier_id))
     
-    # Chemin vers le fichier
+    # Stockage par contenu, sinon ancien emplacement uploads/forwards
     forward_uploads_dir = os.path.join(app.config.get('UPLOAD_FOLDER', 'uploads'), 'forwards')
-    file_path = os.path.join(forward_uploads_dir, forward.attached_file)
+    file_path = attachment_store.resolve(forward.attached_file_checksum,
+                                         os.path.join(forward_uploads_dir, forward.attached_file))
     
-    if not os.path.exists(file_path):
+    if not file_path:
         flash('Le fichier joint n\'existe plus sur le serveur.', 'error')
         return redirect(url_for('mail_detail', id=forward.courrier_id))
     
@@ -5277,6 +4947,7 @@ def toggle_language(lang_code):
 
 @app.route('/download_language/<lang_code>')
 @login_required
+@cache_policy(REVALIDATE_PRIVATE)
 def download_language(lang_code):
     """Télécharger un fichier de langue JSON"""
     if not current_user.is_super_admin():